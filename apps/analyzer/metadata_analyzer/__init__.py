@@ -1 +1,6 @@
 """Automatically generated by Nx."""
+
+import time
+
+# Start of the imports of the analyzer, used for the startup report
+import_start = time.perf_counter()
@@ -1,4 +1,20 @@
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata_analyzer.batch_dispatcher import (
+    AdaptiveBatchSizer,
+    BatchDispatcher,
+    BatchDispatchError,
+)
+from metadata_analyzer.database import (
+    decode_results_cursor,
+    encode_results_cursor,
+    parse_backend_date,
+)
+from metadata_analyzer.pipeline import Prefetcher
+from metadata_analyzer.results_cache import ResultList, ResultsCache
 
 
 class Analyzer:
@@ -11,6 +27,9 @@ class Analyzer:
         time_series_analyzer,
         schedule_based_analyzer,
         enhanced_storage_analyzer,
+        results_snapshot=None,
+        outbox=None,
+        fingerprints=None,
     ):
         cls.database = database
         cls.backend = backend
@@ -18,7 +37,28 @@ class Analyzer:
         cls.time_series_analyzer = time_series_analyzer
         cls.schedule_based_analyzer = schedule_based_analyzer
         cls.series_loaded = False
+        cls.series_lock = threading.Lock()
         cls.enhanced_storage_analyzer = enhanced_storage_analyzer
+        cls.results_snapshot = results_snapshot
+        cls.outbox = outbox
+        cls.fingerprints = fingerprints
+        # Data shared by the analyses until the results change
+        cls.results_cache = ResultsCache(database)
+        # Position after the last result read by _send_Backups
+        cls.backups_cursor = None
+        # Where the next run starts if batches of backups were lost without an outbox,
+        # as (latest backup date, cursor)
+        cls.backups_resume = None
+
+    @classmethod
+    def after_fork(cls):
+        # Called in every worker forked from a process that already initialized the analyzer
+        cls.database.after_fork()
+        cls.backend.after_fork()
+        if cls.outbox is not None:
+            cls.outbox.after_fork()
+        if cls.fingerprints is not None:
+            cls.fingerprints.after_fork()
 
     @staticmethod
     def _convert_result(result):
@@ -32,12 +72,10 @@ class Analyzer:
             "id": result.uuid,
             "saveset": result.saveset,
             "sizeMB": result.data_size / 1_000_000,
-            "creationDate": result.start_time.isoformat(),
+            "creationDate": result.start_time,
             "type": backup_type,
             "taskId": result.task_uuid,
-            "scheduledTime": result.scheduledTime.isoformat()
-            if result.scheduledTime
-            else None,
+            "scheduledTime": result.scheduledTime,
         }
 
     @staticmethod
@@ -47,17 +85,74 @@ class Analyzer:
             "displayName": task.task,
         }
 
+    @classmethod
+    def replay_outbox(cls):
+        # Sends the batches left over from failed runs before anything new,
+        # called at startup and at the start of update_data and run_all_analyses
+        if cls.outbox is None:
+            return 0
+        replayed = cls.outbox.replay(cls.backend)
+        if replayed > 0:
+            print(f"Replayed {replayed} batches from the outbox")
+        return replayed
+
     @classmethod
     def _get_start_date(cls, data, alert_type, backup_type):
-        latest_id = cls.backend.get_latest_alert_id(alert_type, backup_type)
-        if latest_id == "":
-            return datetime.datetime.min
-        else:
-            latest_alerts = [
-                result.start_time for result in data if result.uuid == latest_id
-            ]
-            assert len(latest_alerts) == 1
-            return latest_alerts[0]
+        return cls._get_start_dates(data, [(alert_type, backup_type)])[0]
+
+    @classmethod
+    def _get_start_dates(cls, data, queries):
+        # Returns the start time of the latest alerted result for every (alert_type, backup_type)
+        # Alerts which are still in the outbox are not replayed here: the backend's latest alert
+        # doesn't include them, so they are created again by the analysis
+        latest_ids = cls.backend.get_latest_alert_ids(queries)
+        if not isinstance(data, ResultList):
+            data = ResultList(data)
+        return [
+            datetime.datetime.min if latest_id == "" else data.start_time(latest_id)
+            for latest_id in latest_ids
+        ]
+
+    @classmethod
+    def _get_results_frame(cls, columns=None):
+        key = ("frame", tuple(columns) if columns is not None else None)
+        return cls.results_cache.get(key, lambda: cls._load_results_frame(columns))
+
+    @classmethod
+    def _load_results_frame(cls, columns=None):
+        # Reads the results from the local snapshot if there is one
+        if cls.results_snapshot is None:
+            return cls.database.get_results_frame(columns)
+        df = cls.results_snapshot.load()
+        if columns is not None:
+            df = df[list(columns)]
+        return df
+
+    @classmethod
+    def _get_results(cls):
+        # One projection with the columns of all analyses, which is shared by every analysis
+        # until the results change; each analysis selects its backup types from it
+        columns = ("uuid", "fdi_type", "is_backup", "start_time")
+        for analyzer in (cls.simple_rule_based_analyzer, cls.schedule_based_analyzer):
+            if analyzer is not None:
+                columns += analyzer.result_columns
+        columns = tuple(dict.fromkeys(columns))
+        return cls.results_cache.get(
+            ("results", columns),
+            lambda: ResultList(cls.database.get_result_columns(columns)),
+        )
+
+    @classmethod
+    def _get_schedules(cls):
+        return cls.results_cache.get(
+            ("schedules",), lambda: list(cls.database.get_schedules())
+        )
+
+    @classmethod
+    def _get_task_events(cls):
+        return cls.results_cache.get(
+            ("task_events",), lambda: list(cls.database.get_task_events())
+        )
 
     @classmethod
     def _get_latest_backup_date_from_backend(cls):
@@ -68,71 +163,140 @@ class Analyzer:
             return latest_backup["creationDate"]
 
     @classmethod
-    def _send_Backups(cls):
-        try:
-            latest_backup_date = cls._get_latest_backup_date_from_backend()
-        except Exception as e:
-            print(f"Error getting latest backup date: {e}")
-            latest_backup_date = None
-        results = list(cls.database.get_results(latest_backup_date))
-
-        schedules = list(cls.database.get_schedules())
-        cls.simple_rule_based_analyzer.analyze_creation_dates(
-            results, schedules, None, latest_backup_date, "ONLY_SCHEDULES"
-        )
+    def _send_Backups(cls, tasks_sent=None):
+        if cls.backups_resume is not None:
+            # Batches of the previous run were not sent, but later ones may have been accepted,
+            # so the latest backup of the backend is already past them
+            latest_backup_date, cursor = cls.backups_resume
+        else:
+            try:
+                latest_backup_date = cls._get_latest_backup_date_from_backend()
+            except Exception as e:
+                print(f"Error getting latest backup date: {e}")
+                latest_backup_date = None
+            cursor = cls._get_backups_cursor(latest_backup_date)
+        # Stream the results in the background, while the ones read before are sent
+        with Prefetcher(
+            cls.database.stream_results(latest_backup_date, cursor)
+        ) as prefetcher:
+            schedules = list(cls.database.get_schedules())
+            results = cls.simple_rule_based_analyzer.annotate_scheduled_times(
+                prefetcher, schedules, latest_backup_date
+            )
+
+            # The backend ignores backups of unknown tasks, so wait until the tasks are sent
+            if tasks_sent is not None:
+                tasks_sent.result()
+
+            return cls._dispatch_Backups(results, (latest_backup_date, cursor))
 
-        batch = []
+    @classmethod
+    def _dispatch_Backups(cls, results, start=(None, None)):
+        # start is the (latest backup date, cursor) the results were read from
         count = 0
+        last_result = None
 
-        for result in results:
-            if (result.is_backup is not None) and (result.is_backup <= 0):
-                continue
-
-            if result.subtask_flag != "0":
-                continue
-
-            if result.data_size is None or result.start_time is None:
-                continue
-
-            batch.append(cls._convert_result(result))
-            count += 1
+        # The backend continues after its latest backup, so no batches are started after a failed one
+        # and the batches are resent from the first one that was not sent
+        try:
+            with BatchDispatcher(
+                cls.backend.send_backup_data_batched,
+                ordered=True,
+                sizer=AdaptiveBatchSizer.shared("backups"),
+                outbox=cls.outbox,
+            ) as dispatcher:
+                for result in results:
+                    previous = last_result
+                    last_result = result
+
+                    if (result.is_backup is not None) and (result.is_backup <= 0):
+                        continue
+
+                    if result.subtask_flag != "0":
+                        continue
+
+                    if result.data_size is None or result.start_time is None:
+                        continue
+
+                    # Position after the result read before this one
+                    dispatcher.add(cls._convert_result(result), previous)
+                    count += 1
+        except BatchDispatchError as e:
+            if cls.outbox is not None:
+                # The batches which were not sent are kept in the outbox,
+                # so the next run continues after the last read result
+                if last_result is not None:
+                    cls.backups_cursor = encode_results_cursor(last_result)
+            elif e.resume is None:
+                cls.backups_resume = start
+            else:
+                cls.backups_resume = (None, encode_results_cursor(e.resume))
+            raise
+
+        cls.backups_resume = None
+        if last_result is not None:
+            cls.backups_cursor = encode_results_cursor(last_result)
 
-            if len(batch) == 100:
-                cls.backend.send_backup_data_batched(batch)
-                batch = []
+        return count
 
-        if len(batch) > 0:
-            cls.backend.send_backup_data_batched(batch)
+    @classmethod
+    def _get_backups_cursor(cls, latest_backup_date):
+        # Resume after the last read result if the backend has received everything up to it,
+        # otherwise start again at the latest backup of the backend
+        if cls.backups_cursor is None or latest_backup_date is None:
+            return None
+        start_time, _ = decode_results_cursor(cls.backups_cursor)
+        if start_time < parse_backend_date(latest_backup_date):
+            return None
+        return cls.backups_cursor
 
-        return count
+    @classmethod
+    def _get_changed(cls, kind, payloads):
+        # Only the new or changed entities have to be sent if the fingerprints are known
+        if cls.fingerprints is None:
+            return payloads
+        return cls.fingerprints.changed(kind, payloads)
 
     @classmethod
     def _send_Tasks(cls):
         tasks = list(cls.database.get_tasks())
 
-        batch = []
-        count = 0
-
+        task_data = []
         for task in tasks:
             if task.uuid is None or task.task is None:
                 continue
 
-            batch.append(cls._convert_task(task))
-            count += 1
+            task_data.append(cls._convert_task(task))
 
-            if len(batch) == 100:
-                cls.backend.send_task_data_batched(batch)
-                batch = []
+        changed = cls._get_changed("tasks", task_data)
+        with BatchDispatcher(
+            cls.backend.send_task_data_batched,
+            sizer=AdaptiveBatchSizer.shared("tasks"),
+            outbox=cls.outbox,
+        ) as dispatcher:
+            for data in changed:
+                dispatcher.add(data)
 
-        if len(batch) > 0:
-            cls.backend.send_task_data_batched(batch)
+        if cls.fingerprints is not None:
+            cls.fingerprints.record("tasks", changed)
 
-        return count
+        return len(task_data), len(task_data) - len(changed)
+
+    @staticmethod
+    def _convert_storage(storage):
+        return {
+            "id": storage.uuid,
+            "displayName": storage.name,
+            "capacity": storage.capacity,
+            "highWaterMark": storage.high_water_mark,
+            "filled": storage.filled,
+        }
 
     @classmethod
     def _send_Storage(cls):
         storages = list(cls.database.get_data_stores())
 
+        storage_data = []
         for storage in storages:
             if (
                 storage.uuid is None
@@ -143,40 +307,56 @@ class Analyzer:
             ):
                 continue
 
-            storage_data = {
-                "id": storage.uuid,
-                "displayName": storage.name,
-                "capacity": storage.capacity,
-                "highWaterMark": storage.high_water_mark,
-                "filled": storage.filled,
-            }
+            storage_data.append(cls._convert_storage(storage))
 
-            cls.backend.send_storage_data(storage_data)
+        changed = cls._get_changed("storage", storage_data)
+        for data in changed:
+            cls.backend.send_storage_data(data)
+            if cls.fingerprints is not None:
+                cls.fingerprints.record("storage", [data])
 
-        return len(storages)
+        return len(storages), len(storage_data) - len(changed)
 
     @classmethod
     def update_data(cls):
-        num_Storage = cls._send_Storage()
-        num_Tasks = cls._send_Tasks()
-        num_Backups = cls._send_Backups()
+        cls.replay_outbox()
+        # The three types are synced at the same time, only sending the backups waits for the tasks
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            storage = executor.submit(cls._send_Storage)
+            tasks = executor.submit(cls._send_Tasks)
+            backups = executor.submit(cls._send_Backups, tasks)
+
+            num_Storage, skipped_Storage = storage.result()
+            num_Tasks, skipped_Tasks = tasks.result()
+            num_Backups = backups.result()
 
         return {
             "storage": num_Storage,
             "tasks": num_Tasks,
             "backups": num_Backups,
+            # Unchanged entities which were not sent again
+            "skippedStorage": skipped_Storage,
+            "skippedTasks": skipped_Tasks,
         }
 
     @classmethod
     def simple_rule_based_analysis(cls, alert_limit):
-        data = list(cls.database.get_results())
+        data = cls._select_fdi_types(cls._get_results(), ["F"])
+        return cls._analyze_size_full(data, alert_limit)
+
+    @classmethod
+    def _analyze_size_full(cls, data, alert_limit):
         start_date = cls._get_start_date(data, "SIZE_ALERT", "FULL")
         result = cls.simple_rule_based_analyzer.analyze(data, alert_limit, start_date)
         return result
 
     @classmethod
     def simple_rule_based_analysis_diff(cls, alert_limit):
-        data = list(cls.database.get_results())
+        data = cls._select_fdi_types(cls._get_results(), ["F", "D"])
+        return cls._analyze_size_diff(data, alert_limit)
+
+    @classmethod
+    def _analyze_size_diff(cls, data, alert_limit):
         start_date = cls._get_start_date(data, "SIZE_ALERT", "DIFFERENTIAL")
         result = cls.simple_rule_based_analyzer.analyze_diff(
             data, alert_limit, start_date
@@ -185,7 +365,11 @@ class Analyzer:
 
     @classmethod
     def simple_rule_based_analysis_inc(cls, alert_limit):
-        data = list(cls.database.get_results())
+        data = cls._select_fdi_types(cls._get_results(), ["I"])
+        return cls._analyze_size_inc(data, alert_limit)
+
+    @classmethod
+    def _analyze_size_inc(cls, data, alert_limit):
         start_date = cls._get_start_date(data, "SIZE_ALERT", "INCREMENTAL")
         result = cls.simple_rule_based_analyzer.analyze_inc(
             data, alert_limit, start_date
@@ -196,8 +380,7 @@ class Analyzer:
     def simple_time_series_analysis(
         cls, variable, task_id, frequency, backup_type, window_size
     ):
-        if not cls.series_loaded:
-            cls.load_time_series_data()
+        cls._ensure_time_series_data()
 
         return cls.time_series_analyzer.k_means_analyze(
             variable, task_id, frequency, backup_type, window_size
@@ -205,30 +388,49 @@ class Analyzer:
 
     @classmethod
     def time_series_get_frequencies(cls, task_id, backup_type, variable):
-        if not cls.series_loaded:
-            cls.load_time_series_data()
+        cls._ensure_time_series_data()
         return cls.time_series_analyzer.get_frequencies(task_id, backup_type, variable)
 
     @classmethod
     def time_series_get_task_ids(cls):
-        if not cls.series_loaded:
-            cls.load_time_series_data()
+        cls._ensure_time_series_data()
         return cls.time_series_analyzer.get_task_ids()
 
+    @classmethod
+    def _ensure_time_series_data(cls):
+        # Concurrent requests load the time series data only once
+        if cls.series_loaded:
+            return
+        with cls.series_lock:
+            if not cls.series_loaded:
+                cls.load_time_series_data()
+
     @classmethod
     def load_time_series_data(cls):
-        data = list(cls.database.get_results())
+        # The time series analyzer keeps its own preprocessed copy, so the full results
+        # are not put into the results cache where they would be held a second time
+        data = cls._load_results_frame()
         cls.time_series_analyzer.preload_data(data)
         cls.series_loaded = True
 
     @classmethod
     def schedule_based_analysis(cls, alert_limit, stop_date):
-        results = list(cls.database.get_results())
-        schedules = list(cls.database.get_schedules())
-        task_events = list(cls.database.get_task_events())
+        results = cls._select_backups(cls._get_results())
+        schedules = cls._get_schedules()
+        task_events = cls._get_task_events()
+        return cls._analyze_schedules(
+            results, schedules, task_events, alert_limit, stop_date
+        )
+
+    @classmethod
+    def _analyze_schedules(
+        cls, results, schedules, task_events, alert_limit, stop_date
+    ):
         start_date = max(
-            cls._get_start_date(results, "CREATION_DATE_ALERT", None),
-            cls._get_start_date(results, "ADDITIONAL_BACKUP_ALERT", None),
+            cls._get_start_dates(
+                results,
+                [("CREATION_DATE_ALERT", None), ("ADDITIONAL_BACKUP_ALERT", None)],
+            )
         )
         return cls.schedule_based_analyzer.analyze(
             results, schedules, task_events, alert_limit, start_date, stop_date
@@ -237,16 +439,98 @@ class Analyzer:
     @classmethod
     def simple_rule_based_analysis_storage_capacity(cls, alert_limit):
         data = list(cls.database.get_data_stores())
+        return cls._analyze_storage_capacity(data, alert_limit)
+
+    @classmethod
+    def _analyze_storage_capacity(cls, data, alert_limit):
         result = cls.simple_rule_based_analyzer.analyze_storage_capacity(
             data, alert_limit
         )
         return result
 
+    @classmethod
+    def run_all_analyses(cls, alert_limit, stop_date):
+        # Runs the size, schedule and storage capacity analyses at the same time on data loaded once
+        start = time.perf_counter()
+        results = cls._get_results()
+        schedules = cls._get_schedules()
+        task_events = cls._get_task_events()
+        data_stores = list(cls.database.get_data_stores())
+        # Replay once before the analyses start, the analyses themselves don't replay,
+        # so batches they are sending at the same time are not sent again
+        cls.replay_outbox()
+
+        analyses = {
+            "sizeFullBackups": lambda: cls._analyze_size_full(
+                cls._select_fdi_types(results, ["F"]), alert_limit
+            ),
+            "sizeDiffBackups": lambda: cls._analyze_size_diff(
+                cls._select_fdi_types(results, ["F", "D"]), alert_limit
+            ),
+            "sizeIncBackups": lambda: cls._analyze_size_inc(
+                cls._select_fdi_types(results, ["I"]), alert_limit
+            ),
+            "creationDate": lambda: cls._analyze_schedules(
+                cls._select_backups(results),
+                schedules,
+                task_events,
+                alert_limit,
+                stop_date,
+            ),
+            "storageCapacity": lambda: cls._analyze_storage_capacity(
+                data_stores, alert_limit
+            ),
+        }
+        with ThreadPoolExecutor(max_workers=len(analyses)) as executor:
+            futures = {
+                name: executor.submit(cls._run_timed, analysis)
+                for name, analysis in analyses.items()
+            }
+
+        return {
+            "analyses": {name: future.result() for name, future in futures.items()},
+            "duration": time.perf_counter() - start,
+        }
+
+    @staticmethod
+    def _run_timed(analysis):
+        # A failing analysis is reported without stopping the others
+        start = time.perf_counter()
+        try:
+            report = dict(analysis())
+        except Exception as e:
+            print(f"Error running analysis: {e}")
+            report = {"error": str(e)}
+        report["duration"] = time.perf_counter() - start
+        return report
+
+    @staticmethod
+    def _select_fdi_types(results, fdi_types):
+        return ResultList(result for result in results if result.fdi_type in fdi_types)
+
+    @staticmethod
+    def _select_backups(results):
+        return ResultList(
+            result
+            for result in results
+            if result.is_backup is None or result.is_backup != 0
+        )
+
     @classmethod
     def enhanced_analysis_storage_capacity(cls):
-        data = list(cls.database.get_results())
+        data = cls._get_results_frame(cls.enhanced_storage_analyzer.result_columns)
         labeled = list(cls.database.get_labeled_data_store())
         result = cls.enhanced_storage_analyzer.analyze_future_storage_capacity(
             data, labeled
         )
         return result
+
+    @classmethod
+    def status(cls):
+        status = {
+            "database": cls.database.pool_status(),
+            "resultsCache": cls.results_cache.status(),
+        }
+        if cls.outbox is not None:
+            status["outbox"] = {"pending": len(cls.outbox)}
+        return status
@@ -1,66 +1,130 @@
+import gzip
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from metadata_analyzer import serialization
 
 
 class Backend:
-    def __init__(self, backend_url):
+    def __init__(self, backend_url, session=None):
         self.backend_url = backend_url
+        timeout = os.getenv("BACKEND_TIMEOUT")
+        self.timeout = float(timeout) if timeout else None
+        # JSON bodies larger than this are sent gzip compressed, a negative value disables compression
+        self.gzip_threshold = int(os.getenv("BACKEND_GZIP_THRESHOLD") or 1024)
+        if session is None:
+            session = self._create_session()
+        self.session = session
+
+    @staticmethod
+    def _create_session():
+        # A single session keeps the connections to the backend alive between requests
+        retries = int(os.getenv("BACKEND_RETRIES") or 3)
+        # All used endpoints are idempotent: data is upserted by id and the backend ignores
+        # alerts that already exist, so POST requests can be retried safely as well
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=float(os.getenv("BACKEND_BACKOFF_FACTOR") or 0.5),
+            status_forcelist=(500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "PUT", "POST"]),
+            # Return the last response, so raise_for_status raises the usual HTTPError
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=int(os.getenv("BACKEND_POOL_SIZE") or 10),
+            max_retries=retry,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def after_fork(self):
+        # Drops the connections inherited from the parent process, new ones are opened on demand
+        self.session.close()
+
+    def _post(self, url, payload):
+        body = serialization.dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        if 0 <= self.gzip_threshold < len(body):
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+        r = self.session.post(url, data=body, headers=headers, timeout=self.timeout)
+        r.raise_for_status()
 
     def send_backup_data_batched(self, batch):
         url = self.backend_url + "backupData/batched"
-        r = requests.post(url, json=batch)
-        r.raise_for_status()
+        self._post(url, batch)
 
     def send_task_data_batched(self, batch):
         url = self.backend_url + "tasks/batched"
-        r = requests.post(url, json=batch)
-        r.raise_for_status()
+        self._post(url, batch)
 
     def send_storage_data(self, storage):
         url = self.backend_url + "dataStores"
-        r = requests.post(url, json=storage)
-        r.raise_for_status()
+        self._post(url, storage)
 
     def create_size_alerts_batched(self, alerts):
         url = self.backend_url + "alerting/size/batched"
-        r = requests.post(url, json=alerts)
-        r.raise_for_status()
+        self._post(url, alerts)
 
     def create_creation_date_alerts_batched(self, alerts):
         url = self.backend_url + "alerting/creationDate/batched"
-        r = requests.post(url, json=alerts)
-        r.raise_for_status()
+        self._post(url, alerts)
 
     def create_missing_backup_alert(self, alert):
         url = self.backend_url + "alerting/missingBackup"
-        r = requests.post(url, json=alert)
-        r.raise_for_status()
+        self._post(url, alert)
 
     def create_additional_backup_alert(self, alert):
         url = self.backend_url + "alerting/additionalBackup"
-        r = requests.post(url, json=alert)
-        r.raise_for_status()
+        self._post(url, alert)
+
+    def create_missing_backup_alerts_batched(self, alerts):
+        url = self.backend_url + "alerting/missingBackup/batched"
+        self._post(url, alerts)
+
+    def create_additional_backup_alerts_batched(self, alerts):
+        url = self.backend_url + "alerting/additionalBackup/batched"
+        self._post(url, alerts)
 
     def create_storage_fill_alerts(self, alerts):
         url = self.backend_url + "alerting/storageFill"
-        r = requests.post(url, json=alerts)
-        r.raise_for_status()
+        self._post(url, alerts)
 
     def get_latest_alert_id(self, alert_type, backup_type=None):
         url = self.backend_url + f"alerting/type/{alert_type}/latest"
         if backup_type != None:
             url += f"?backupType={backup_type}"
-        r = requests.get(url)
+        r = self.session.get(url, timeout=self.timeout)
         r.raise_for_status()
         return r.text
 
+    def get_latest_alert_ids(self, queries):
+        # Fetches the latest alert ids of several (alert_type, backup_type) pairs at the same time
+        if len(queries) <= 1:
+            return [self.get_latest_alert_id(*query) for query in queries]
+        with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+            return list(
+                executor.map(lambda query: self.get_latest_alert_id(*query), queries)
+            )
+
     def get_latest_backup_date(self):
         url = self.backend_url + "backupData/latest"
-        r = requests.get(url)
+        r = self.session.get(url, timeout=self.timeout)
         r.raise_for_status()
         return r.json()
 
     def create_size_overflow_notification(self, uuid, overflow):
         headers = {"Content-type": "application/json"}
         url = self.backend_url + f"datastores/{uuid}/OverflowTime/"
-        r = requests.put(url, data=overflow, headers=headers)
+        r = self.session.put(url, data=overflow, headers=headers, timeout=self.timeout)
         r.raise_for_status()
@@ -0,0 +1,224 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata_analyzer import serialization
+
+
+class BatchDispatchError(Exception):
+    def __init__(self, errors, skipped, resume=None):
+        # errors is a list of (batch index, exception) pairs
+        # resume is the position given for the first batch which failed or was skipped
+        self.errors = errors
+        self.skipped = skipped
+        self.resume = resume
+        messages = "; ".join(f"batch {index}: {error}" for index, error in errors)
+        super().__init__(
+            f"{len(errors)} batches could not be sent, {skipped} batches were skipped: "
+            + messages
+        )
+
+
+class AdaptiveBatchSizer:
+    # Decides when a batch is full by the size of its JSON payload instead of a fixed number of items
+    # The target size adapts to the observed latency: it is halved while requests take longer than
+    # target_latency and grows again up to max_bytes while they are fast
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(
+        self,
+        target_bytes=None,
+        min_bytes=None,
+        max_bytes=None,
+        max_items=None,
+        target_latency=None,
+    ):
+        if target_bytes is None:
+            target_bytes = int(os.getenv("BACKEND_BATCH_BYTES") or 64 * 1024)
+        if min_bytes is None:
+            min_bytes = int(os.getenv("BACKEND_MIN_BATCH_BYTES") or 8 * 1024)
+        if max_bytes is None:
+            # Stays below the default body limit of 100kb of the backend
+            max_bytes = int(os.getenv("BACKEND_MAX_BATCH_BYTES") or 96 * 1024)
+        if max_items is None:
+            max_items = int(os.getenv("BACKEND_BATCH_SIZE") or 1000)
+        if target_latency is None:
+            target_latency = float(os.getenv("BACKEND_TARGET_LATENCY") or 1.0)
+        self.min_bytes = min(min_bytes, target_bytes)
+        self.max_bytes = max(max_bytes, target_bytes)
+        self.max_items = max_items
+        self.target_latency = target_latency
+        self.lock = threading.Lock()
+        self._target_bytes = target_bytes
+
+    @classmethod
+    def shared(cls, name):
+        # Returns the sizer used for all batches of the given kind, so what it learned is kept between runs
+        with cls._shared_lock:
+            if name not in cls._shared:
+                cls._shared[name] = cls()
+            return cls._shared[name]
+
+    @property
+    def target_bytes(self):
+        with self.lock:
+            return self._target_bytes
+
+    @staticmethod
+    def item_bytes(item):
+        # Size of the item in the JSON array of a request, including the separator
+        return len(serialization.dumps(item)) + 1
+
+    def is_full(self, num_items, num_bytes):
+        return num_items >= self.max_items or num_bytes >= self.target_bytes
+
+    def fits(self, num_items, num_bytes, item_bytes):
+        # Whether an item can be added to a batch without exceeding the limits
+        return num_items == 0 or (
+            num_items < self.max_items and num_bytes + item_bytes <= self.target_bytes
+        )
+
+    def observe(self, latency):
+        with self.lock:
+            if latency > self.target_latency:
+                self._target_bytes = max(self.min_bytes, self._target_bytes // 2)
+            elif latency < self.target_latency / 2:
+                self._target_bytes = min(
+                    self.max_bytes, self._target_bytes + self._target_bytes // 4
+                )
+
+
+class BatchDispatcher:
+    # Sends batches with send(batch) while keeping up to max_in_flight requests running at once.
+    # Errors are collected and raised together as a BatchDispatchError when the dispatcher is closed.
+    # ordered=True is for data where the backend derives its progress from the newest entry it has
+    # received: once a batch failed no further batch is started, but the batches already in flight
+    # can still be accepted after it. The error then carries the position of the first batch that
+    # was not sent, so the caller can start there again; resending is fine because the backend
+    # ignores entries it already has.
+    # Items passed to add are grouped into batches by the sizer.
+    # If an outbox is given, every batch is stored in it before it is sent and only removed once
+    # the backend accepted it, including the batches skipped after a failure.
+    def __init__(
+        self, send, max_in_flight=None, ordered=False, sizer=None, outbox=None
+    ):
+        if max_in_flight is None:
+            max_in_flight = int(os.getenv("BACKEND_MAX_IN_FLIGHT") or 4)
+        if sizer is None:
+            sizer = AdaptiveBatchSizer()
+        self.send = send
+        self.ordered = ordered
+        self.sizer = sizer
+        self.outbox = outbox
+        self.batch = []
+        self.batch_bytes = 2
+        self.batch_position = None
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        # Blocks submit while max_in_flight batches are being sent, so batches don't pile up in memory
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.submitted = 0
+        self.skipped = 0
+        # Positions of the batches which were not accepted yet, by batch index
+        self.positions = {}
+        # Index of the first batch which failed or was skipped
+        self.first_unsent = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # Don't hide the original exception behind the dispatch errors
+            self.executor.shutdown(wait=True)
+        return False
+
+    def add(self, item, position=None):
+        # position is where to start again if the batch of the item is not sent,
+        # only the position of the first item of every batch is kept
+        item_bytes = self.sizer.item_bytes(item)
+        if not self.sizer.fits(len(self.batch), self.batch_bytes, item_bytes):
+            self.flush()
+        if len(self.batch) == 0:
+            self.batch_position = position
+        self.batch.append(item)
+        self.batch_bytes += item_bytes
+        if self.sizer.is_full(len(self.batch), self.batch_bytes):
+            self.flush()
+
+    def flush(self):
+        # Submits the items added since the last batch
+        if len(self.batch) > 0:
+            self.submit(self.batch, self.batch_position)
+        self.batch = []
+        self.batch_bytes = 2
+        self.batch_position = None
+
+    def submit(self, batch, position=None):
+        entry_id = None
+        if self.outbox is not None:
+            entry_id = self.outbox.append(self.send.__name__, batch)
+        index = self.submitted
+        self.submitted += 1
+        if self.ordered:
+            with self.lock:
+                self.positions[index] = position
+        self.slots.acquire()
+        # Checked once a slot is free, a batch which failed while this one waited is known by then
+        if self.ordered and self.failed():
+            self.slots.release()
+            self._skip(index, entry_id)
+            return
+        self.executor.submit(self._send, index, batch, entry_id)
+
+    def failed(self):
+        with self.lock:
+            return len(self.errors) > 0
+
+    def close(self):
+        # Sends the remaining items, waits for all batches and raises the collected errors
+        self.flush()
+        self.executor.shutdown(wait=True)
+        if len(self.errors) > 0:
+            resume = None
+            if self.ordered and self.first_unsent is not None:
+                resume = self.positions[self.first_unsent]
+            raise BatchDispatchError(
+                sorted(self.errors, key=lambda error: error[0]), self.skipped, resume
+            )
+
+    def _send(self, index, batch, entry_id):
+        try:
+            start = time.perf_counter()
+            self.send(batch)
+            self.sizer.observe(time.perf_counter() - start)
+            if entry_id is not None:
+                self.outbox.ack(entry_id)
+            if self.ordered:
+                with self.lock:
+                    self.positions.pop(index, None)
+        except Exception as e:
+            with self.lock:
+                self.errors.append((index, e))
+                self._unsent(index)
+            if entry_id is not None:
+                self.outbox.release(entry_id)
+        finally:
+            self.slots.release()
+
+    def _skip(self, index, entry_id):
+        with self.lock:
+            self.skipped += 1
+            self._unsent(index)
+        if entry_id is not None:
+            self.outbox.release(entry_id)
+
+    def _unsent(self, index):
+        # Expects the lock to be held
+        if self.first_unsent is None or index < self.first_unsent:
+            self.first_unsent = index
@@ -1,8 +1,16 @@
+import base64
 import datetime
+import json
 import os
+import threading
+import time
+from contextlib import contextmanager
 
-from sqlalchemy import create_engine, select, distinct
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, select, distinct, func, inspect, or_, tuple_
 from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
 
 from metadata_analyzer.models import (
     Result,
@@ -14,14 +22,47 @@ from metadata_analyzer.models import (
 )
 
 
+def parse_backend_date(date):
+    # Parses a date as returned by the backend, e.g. "2000-01-01T12:00:00.000Z"
+    return datetime.datetime.strptime(date, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def encode_results_cursor(result):
+    # Encodes the position after a result as an opaque token for keyset pagination
+    position = [result.start_time.isoformat(), result.saveset]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def decode_results_cursor(cursor):
+    start_time, saveset = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.datetime.fromisoformat(start_time), saveset
+
+
 class Database:
-    def __init__(self):
+    def __init__(self, engine=None):
+        if engine is None:
+            engine = self._create_engine()
+        self.engine = engine
+        # Number of rows fetched per round trip when streaming results or loading the results frame
+        self.stream_chunk_size = int(os.getenv("DATABASE_STREAM_CHUNK_SIZE") or 1000)
+        # Number of results per page when paginating with a cursor
+        self.page_size = int(os.getenv("DATABASE_PAGE_SIZE") or 10000)
+
+        # Statistics about connection checkouts, used for sizing the pool
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._sessions_in_use = 0
+        self._total_checkout_wait = 0.0
+        self._max_checkout_wait = 0.0
+
+    @staticmethod
+    def _create_engine():
         db_user = os.getenv("DATABASE_USER") or "postgres"
         db_port = os.getenv("DATABASE_PORT") or "5432"
         db_password = os.getenv("DATABASE_PASSWORD") or "postgres"
         db_host = os.getenv("DATABASE_HOST") or "localhost"
         db_name = os.getenv("DATABASE_DATABASE") or "postgres"
-        self.engine = create_engine(
+        return create_engine(
             "postgresql+pg8000://"
             + db_user
             + ":"
@@ -31,62 +72,257 @@ class Database:
             + ":"
             + db_port
             + "/"
-            + db_name
+            + db_name,
+            poolclass=QueuePool,
+            pool_size=int(os.getenv("DATABASE_POOL_SIZE") or 5),
+            max_overflow=int(os.getenv("DATABASE_POOL_MAX_OVERFLOW") or 10),
+            pool_timeout=float(os.getenv("DATABASE_POOL_TIMEOUT") or 30),
+            # Recycle connections before the server or a proxy drops them
+            pool_recycle=int(os.getenv("DATABASE_POOL_RECYCLE") or 1800),
+            pool_pre_ping=(os.getenv("DATABASE_POOL_PRE_PING") or "true").lower()
+            == "true",
         )
 
-    def get_results(self, latest_backup_date=None):
-        session = Session(self.engine)
-        stmt = select(Result)
+    @contextmanager
+    def session(self):
+        # Opens a session that is closed (and its connection returned to the pool)
+        # as soon as the block is left
+        start = time.perf_counter()
+        with Session(self.engine) as session:
+            # Check out the connection eagerly to measure the time spent waiting for the pool
+            session.connection()
+            wait = time.perf_counter() - start
+            with self._stats_lock:
+                self._checkouts += 1
+                self._sessions_in_use += 1
+                self._total_checkout_wait += wait
+                self._max_checkout_wait = max(self._max_checkout_wait, wait)
+            try:
+                yield session
+            finally:
+                with self._stats_lock:
+                    self._sessions_in_use -= 1
+
+    def after_fork(self):
+        # The connections of the parent process must not be used by a forked worker
+        self.engine.dispose(close=False)
+
+    def pool_status(self):
+        pool = self.engine.pool
+        with self._stats_lock:
+            status = {
+                "sessionsInUse": self._sessions_in_use,
+                "checkouts": self._checkouts,
+                "averageCheckoutWait": (
+                    self._total_checkout_wait / self._checkouts
+                    if self._checkouts > 0
+                    else 0.0
+                ),
+                "maxCheckoutWait": self._max_checkout_wait,
+            }
+        if isinstance(pool, QueuePool):
+            status.update(
+                {
+                    "poolSize": pool.size(),
+                    "checkedOut": pool.checkedout(),
+                    "checkedIn": pool.checkedin(),
+                    "overflow": pool.overflow(),
+                }
+            )
+        return status
+
+    def missing_indexes(self):
+        # Returns the indexes of the models which don't exist in the database yet
+        # Existing indexes under a different name are accepted if their columns start with the same columns
+        inspector = inspect(self.engine)
+        missing = []
+        for table in (Result.__table__, ResultLabel.__table__):
+            existing = [
+                tuple(index["column_names"])
+                for index in inspector.get_indexes(table.name)
+            ]
+            for index in table.indexes:
+                columns = tuple(column.name for column in index.columns)
+                if not any(other[: len(columns)] == columns for other in existing):
+                    missing.append(index)
+        return missing
+
+    def create_indexes(self):
+        # Creates the missing indexes without locking the tables against writes
+        created = []
+        with self.engine.connect().execution_options(
+            isolation_level="AUTOCOMMIT"
+        ) as connection:
+            for index in self.missing_indexes():
+                index.create(connection, checkfirst=True)
+                created.append(index.name)
+        return created
+
+    @staticmethod
+    def _select_results_since(latest_backup_date):
         # Select all results since the latest backup date
         if latest_backup_date is not None:
-            timestamp = datetime.datetime.strptime(
-                latest_backup_date, "%Y-%m-%dT%H:%M:%S.%fZ"
-            )
-            stmt = select(Result).where(Result.start_time > timestamp)
+            timestamp = parse_backend_date(latest_backup_date)
+            return select(Result).where(Result.start_time > timestamp)
         else:
-            stmt = select(Result).where(Result.start_time > datetime.datetime.min)
+            return select(Result).where(Result.start_time > datetime.datetime.min)
+
+    def probe_results(self):
+        # Cheap check whether the results changed: the newest start_time and the number of results
+        stmt = select(func.max(Result.start_time), func.count()).select_from(Result)
+
+        with self.session() as session:
+            return tuple(session.execute(stmt).one())
+
+    def get_results(self, latest_backup_date=None):
+        stmt = self._select_results_since(latest_backup_date)
 
-        results = session.scalars(stmt)
+        with self.session() as session:
+            return session.scalars(stmt).all()
 
-        return results
+    def get_results_page(self, latest_backup_date=None, cursor=None, page_size=None):
+        # Returns one page of results ordered by (start_time, saveset) and the cursor for the next page
+        # The next page starts right after the cursor, so no results are skipped or repeated
+        # without using OFFSET. The cursor is None if there are no more results.
+        if page_size is None:
+            page_size = self.page_size
+        stmt = self._select_results_after(latest_backup_date, cursor).limit(page_size)
+
+        with self.session() as session:
+            results = session.scalars(stmt).all()
+
+        next_cursor = None
+        if len(results) == page_size:
+            next_cursor = encode_results_cursor(results[-1])
+        return results, next_cursor
+
+    def stream_results(self, latest_backup_date=None, cursor=None, chunk_size=None):
+        # Yields all results after the cursor in the order of get_results_page through a
+        # server-side cursor, so only chunk_size rows are held in memory at once
+        if chunk_size is None:
+            chunk_size = self.stream_chunk_size
+        stmt = self._select_results_after(latest_backup_date, cursor).execution_options(
+            yield_per=chunk_size
+        )
+
+        with self.session() as session:
+            yield from session.scalars(stmt)
+
+    @staticmethod
+    def _select_results_after(latest_backup_date, cursor):
+        # Selects the results after the cursor ordered by (start_time, saveset)
+        stmt = select(Result).where(Result.start_time > datetime.datetime.min)
+        # Results sharing the timestamp of the latest backup are included,
+        # because not all of them have to be known by the backend
+        if latest_backup_date is not None:
+            stmt = stmt.where(
+                Result.start_time >= parse_backend_date(latest_backup_date)
+            )
+        if cursor is not None:
+            stmt = stmt.where(
+                tuple_(Result.start_time, Result.saveset)
+                > tuple_(*decode_results_cursor(cursor))
+            )
+        return stmt.order_by(Result.start_time, Result.saveset)
+
+    def get_result_columns(self, columns, fdi_types=None, backups_only=False):
+        # Only loads the given columns of the results as lightweight named tuples
+        # instead of hydrating full Result objects
+        stmt = select(*[getattr(Result, column) for column in columns]).where(
+            Result.start_time > datetime.datetime.min,
+            # Skip the results which are ignored by every analysis
+            Result.subtask_flag == "0",
+            Result.data_size.is_not(None),
+            or_(Result.task.is_(None), Result.task != ""),
+            or_(Result.fdi_type.is_(None), Result.fdi_type != ""),
+        )
+        if fdi_types is not None:
+            stmt = stmt.where(Result.fdi_type.in_(fdi_types))
+        if backups_only:
+            stmt = stmt.where(or_(Result.is_backup.is_(None), Result.is_backup != 0))
+
+        with self.session() as session:
+            return session.execute(stmt).all()
+
+    def get_results_frame(self, columns=None, since=None):
+        # Loads the results column by column into a typed DataFrame,
+        # without creating a Result object or a dict per row
+        # If since is given, only results started at or after it are loaded
+        if columns is None:
+            columns = [column.name for column in Result.__table__.columns]
+        stmt = (
+            select(*[getattr(Result, column) for column in columns])
+            .where(Result.start_time > datetime.datetime.min)
+            .execution_options(yield_per=self.stream_chunk_size)
+        )
+        if since is not None:
+            stmt = stmt.where(Result.start_time >= since)
+
+        values = [[] for _ in columns]
+        with self.session() as session:
+            for partition in session.execute(stmt).partitions():
+                for i, column_values in enumerate(zip(*partition)):
+                    values[i].extend(column_values)
+
+        return pd.DataFrame(
+            {
+                column: self._to_array(Result.__table__.c[column], column_values)
+                for column, column_values in zip(columns, values)
+            },
+            columns=columns,
+        )
+
+    @staticmethod
+    def _to_array(column, values):
+        python_type = column.type.python_type
+        if python_type is datetime.datetime:
+            return pd.to_datetime(values).values.astype("datetime64[ns]")
+        if python_type is int:
+            # Columns with null values are loaded as floats (with NaN)
+            if any(value is None for value in values):
+                return np.array(
+                    [np.nan if value is None else value for value in values],
+                    dtype=np.float64,
+                )
+            return np.array(values, dtype=np.int64)
+        if python_type is float:
+            return np.array(
+                [np.nan if value is None else value for value in values],
+                dtype=np.float64,
+            )
+        return np.array(values, dtype=object)
 
     def get_tasks(self):
-        session = Session(self.engine)
         stmt = select(Tasks)
 
-        result = session.scalars(stmt)
-        return result
+        with self.session() as session:
+            return session.scalars(stmt).all()
 
     def get_data_stores(self):
-        session = Session(self.engine)
         stmt = select(DataStore)
 
-        result = session.scalars(stmt)
-        return result
+        with self.session() as session:
+            return session.scalars(stmt).all()
 
     def get_schedules(self):
-        session = Session(self.engine)
         stmt = select(Schedule)
 
-        result = session.scalars(stmt)
-        return result
+        with self.session() as session:
+            return session.scalars(stmt).all()
 
     def get_task_events(self):
-        session = Session(self.engine)
         stmt = select(TaskEvent)
 
-        result = session.scalars(stmt)
-        return result
+        with self.session() as session:
+            return session.scalars(stmt).all()
 
     def get_result_labels(self):
-        session = Session(self.engine)
         stmt = select(ResultLabel)
 
-        labels = session.scalars(stmt)
-        return labels
+        with self.session() as session:
+            return session.scalars(stmt).all()
 
     def get_labeled_data_store(self):
-        session = Session(self.engine)
         stmt = (
             select(
                 DataStore.name,
@@ -99,5 +335,5 @@ class Database:
             .select_from(DataStore)
             .join(ResultLabel, DataStore.name == ResultLabel.pool)
         )
-        joined = session.execute(stmt).mappings().all()
-        return joined
+        with self.session() as session:
+            return session.execute(stmt).mappings().all()
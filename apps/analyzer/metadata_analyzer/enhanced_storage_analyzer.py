@@ -1,36 +1,50 @@
 from metadata_analyzer.forecast_storage_fill_alert import ForecastStorageFillAlert
-import pandas as pd
+from metadata_analyzer.jobs import report_progress
 import numpy as np
 import metadata_analyzer.backend
 import json
-from darts import TimeSeries
-from darts.models import AutoARIMA
 from decimal import Decimal
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+
+# Forecast settings in seconds, replaced as a whole by the setters,
+# so an analysis running at the same time keeps using consistent values
+ForecastConfig = namedtuple("ForecastConfig", ["forecast_length", "frequency"])
 
 
 class EnhancedStorageAnalyzer:
-    forecast_length = 366 * (24 * 60 * 60)
-    frequency = 24 * 60 * 60
+    # Columns of the results table used for the forecasts
+    result_columns = ("saveset", "task", "sbc_start", "data_size")
 
     def __init__(self, backend):
         self.backend = backend
+        self.config = ForecastConfig(
+            forecast_length=366 * (24 * 60 * 60), frequency=24 * 60 * 60
+        )
+
+    @property
+    def forecast_length(self):
+        return self.config.forecast_length
+
+    @property
+    def frequency(self):
+        return self.config.frequency
 
     def set_forecast_length(self, new_length):
-        self.forecast_length = new_length
+        self.config = self.config._replace(forecast_length=new_length)
 
     def set_forecast_frequency(self, new_frequency):
-        self.frequency = new_frequency
+        self.config = self.config._replace(frequency=new_frequency)
 
     # Analyzes if storage capacity will be reached within confines of forecast
     def analyze_future_storage_capacity(self, data, labeled_data_store):
+        config = self.config
         scaled_forecasts = defaultdict(list)
 
         # gets the saveset (as an identifier) for all backups that are relevant for these labels
         savesets = set([row.saveset for row in labeled_data_store])
 
-        # throws all backups into a dataframe
-        root_df = pd.DataFrame([res.as_dict() for res in data])
+        # data contains all backups as a dataframe
+        root_df = data
 
         # removes backups from dataframe by their saveset if they are not saved on the data_stores in question
         root_df = root_df.loc[root_df["saveset"].isin(savesets)]
@@ -61,9 +75,10 @@ class EnhancedStorageAnalyzer:
 
         # starts forecast for every task
         task_total_sizes = defaultdict(list)
-        for task, group in tasks_savesets:  #
+        for i, (task, group) in enumerate(tasks_savesets):
+            report_progress(i, tasks_savesets.ngroups)
             df = group[["sbc_start", "data_size"]]
-            forecast = self.forecast_storage(df)
+            forecast = self.forecast_storage(df, config)
             forecasts.update({task: forecast})
 
             # get the total size of all tasks on store
@@ -123,7 +138,9 @@ class EnhancedStorageAnalyzer:
 
             scaled_forecasts.update({store: prev})
 
-        overflows = self.get_overflow_times(scaled_forecasts, data_store_capacities)
+        overflows = self.get_overflow_times(
+            scaled_forecasts, data_store_capacities, config
+        )
         for store, overflow in overflows.items():
             uuid = data_store_ids[store]
             self.backend.create_size_overflow_notification(
@@ -132,7 +149,13 @@ class EnhancedStorageAnalyzer:
 
         return overflows
 
-    def forecast_storage(self, df):
+    def forecast_storage(self, df, config=None):
+        # darts pulls in torch, so it is only imported once a forecast needs it
+        from darts import TimeSeries
+        from darts.models import AutoARIMA
+
+        if config is None:
+            config = self.config
         # remove entries that have the same sbc_start, necessary for indexing the time axis (could cause problems later)
         df = df.drop_duplicates(subset=["sbc_start"])
         # sorts dataframe by sbc_start
@@ -142,10 +165,10 @@ class EnhancedStorageAnalyzer:
         df = df.dropna()
 
         # sets frequency at a fixed value, switch to dynamic method for risky results
-        chosen_freq = self.frequency
+        chosen_freq = config.frequency
 
         # calculates number of steps to take for forecasting
-        steps = int(self.forecast_length / chosen_freq)
+        steps = int(config.forecast_length / chosen_freq)
 
         df.index = df["sbc_start"]  # sets index to datetime in sbc_start column
         df = df.drop(
@@ -169,13 +192,15 @@ class EnhancedStorageAnalyzer:
             pred = None
         return pred
 
-    def get_overflow_times(self, scaled_forecasts, data_store_capacities):
+    def get_overflow_times(self, scaled_forecasts, data_store_capacities, config=None):
+        if config is None:
+            config = self.config
         overflows = defaultdict(list)
 
         for key, forecasted_steps in scaled_forecasts.items():
             multiplier = 1000000000  # assume capacity in gb, forecast in bytes
             limit = data_store_capacities[key][0]
-            step_width = self.forecast_length / len(forecasted_steps)
+            step_width = config.forecast_length / len(forecasted_steps)
             if not any(np.isnan(forecasted_steps)):
                 # calculates how many steps
                 i = 0
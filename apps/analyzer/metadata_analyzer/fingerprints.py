@@ -0,0 +1,81 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_analyzer import serialization
+
+
+class FingerprintStore:
+    # Remembers a hash of every task and data store sent to the backend,
+    # so update_data only sends the ones that are new or changed
+    # Fingerprints older than max_age seconds are ignored, so everything is sent again from time to time,
+    # e.g. in case the backend database was reset
+    def __init__(self, path=":memory:", max_age=None):
+        if max_age is None:
+            max_age = float(os.getenv("FINGERPRINTS_MAX_AGE") or 24 * 60 * 60)
+        self.path = path
+        self.max_age = max_age
+        self._connect()
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        with self.lock:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS fingerprints ("
+                "kind TEXT NOT NULL, "
+                "id TEXT NOT NULL, "
+                "hash TEXT NOT NULL, "
+                "updated REAL NOT NULL, "
+                "PRIMARY KEY (kind, id))"
+            )
+
+    def after_fork(self):
+        # SQLite connections must not be shared with the parent process, every worker opens its own
+        # An in-memory store starts empty in every worker
+        self._connect()
+
+    @staticmethod
+    def fingerprint(payload):
+        return hashlib.sha256(serialization.dumps(payload, sort_keys=True)).hexdigest()
+
+    def changed(self, kind, payloads):
+        # Returns the payloads which differ from the last payload sent with the same id
+        with self.lock:
+            known = dict(
+                self.connection.execute(
+                    "SELECT id, hash FROM fingerprints WHERE kind = ? AND updated >= ?",
+                    (kind, time.time() - self.max_age),
+                ).fetchall()
+            )
+        return [
+            payload
+            for payload in payloads
+            if known.get(payload["id"]) != self.fingerprint(payload)
+        ]
+
+    def record(self, kind, payloads):
+        # Stores the fingerprints of payloads which were accepted by the backend
+        updated = time.time()
+        rows = [
+            (kind, payload["id"], self.fingerprint(payload), updated)
+            for payload in payloads
+        ]
+        with self.lock:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO fingerprints (kind, id, hash, updated) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+
+    def clear(self):
+        with self.lock:
+            self.connection.execute("DELETE FROM fingerprints")
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,173 @@
+import datetime
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from metadata_analyzer import serialization
+
+# The job run by the current worker thread, used to report its progress
+_current = threading.local()
+
+
+def report_progress(done, total):
+    # Called by long running analyses, does nothing outside of a job
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.progress = {"done": done, "total": total}
+        _current.queue._save(job, throttle=True)
+
+
+class Job:
+    def __init__(self, analysis, parameters, key):
+        self.id = str(uuid.uuid4())
+        self.analysis = analysis
+        self.parameters = parameters
+        self.key = key
+        self.status = "queued"
+        self.progress = None
+        self.submitted = datetime.datetime.now()
+        self.started = None
+        self.finished = None
+        self.duration = None
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        # Time the job was last written to the shared state
+        self.saved = 0.0
+
+    def as_json(self):
+        return {
+            "id": self.id,
+            "analysis": self.analysis,
+            "parameters": self.parameters,
+            "status": self.status,
+            "progress": self.progress,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+            "duration": self.duration,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class _StoredJob:
+    # A job read from the shared state, it may run in another worker process
+    def __init__(self, job):
+        for field in ("submitted", "started", "finished"):
+            if job[field] is not None:
+                job[field] = datetime.datetime.fromisoformat(job[field])
+        self.id = job["id"]
+        self.job = job
+
+    def as_json(self):
+        return self.job
+
+
+class JobQueue:
+    # Runs long analyses on a pool of max_workers threads instead of in the HTTP request
+    # Submitting an analysis with the same parameters as a queued or running job returns that job
+    # Finished jobs are kept for max_age seconds
+    # With a shared state the jobs are also written to it, so every worker process can
+    # return their status, duplicates are still only detected within one process
+    def __init__(self, max_workers=None, max_age=None):
+        if max_workers is None:
+            max_workers = int(os.getenv("JOBS_MAX_WORKERS") or 2)
+        if max_age is None:
+            max_age = float(os.getenv("JOBS_MAX_AGE") or 60 * 60)
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.in_flight = {}
+        # Set to a SharedState in the gunicorn serving mode
+        self.state = None
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="jobs"
+        )
+
+    @staticmethod
+    def key(analysis, parameters):
+        return (analysis, serialization.dumps(parameters, sort_keys=True))
+
+    def submit(self, analysis, parameters, run):
+        # Returns the job and whether it was newly created
+        key = self.key(analysis, parameters)
+        with self.lock:
+            self._remove_expired()
+            job = self.in_flight.get(key)
+            if job is not None:
+                return job, False
+            job = Job(analysis, parameters, key)
+            self.jobs[job.id] = job
+            self.in_flight[key] = job
+        self._save(job)
+        self.executor.submit(self._run, job, run)
+        return job, True
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None and self.state is not None:
+            stored = self.state.load_job(job_id)
+            if stored is not None:
+                job = _StoredJob(stored)
+        return job
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+    def _run(self, job, run):
+        job.status = "running"
+        job.started = datetime.datetime.now()
+        start = time.perf_counter()
+        self._save(job)
+        _current.job = job
+        _current.queue = self
+        try:
+            job.result = run()
+            job.status = "succeeded"
+        except Exception as e:
+            print(f"Error in job {job.id} ({job.analysis}): {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            _current.job = None
+            job.duration = time.perf_counter() - start
+            job.finished = datetime.datetime.now()
+            self._save(job)
+            with self.lock:
+                self.in_flight.pop(job.key, None)
+            job.done.set()
+
+    def _save(self, job, throttle=False):
+        # Progress updates are written at most once per second
+        if self.state is None:
+            return
+        now = time.time()
+        if throttle and now - job.saved < 1:
+            return
+        job.saved = now
+        try:
+            self.state.save_job(
+                job.id,
+                job.as_json(),
+                None if job.finished is None else job.finished.timestamp(),
+            )
+        except Exception as e:
+            print(f"Error saving job {job.id}: {e}")
+
+    def _remove_expired(self):
+        # Expects the lock to be held
+        now = datetime.datetime.now()
+        expired = [
+            job_id
+            for job_id, job in self.jobs.items()
+            if job.finished is not None
+            and (now - job.finished).total_seconds() > self.max_age
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if self.state is not None:
+            self.state.remove_jobs(self.max_age)
@@ -1,23 +1,83 @@
 import os
+import sys
+import tempfile
+import time
 
+from contextlib import contextmanager
 from datetime import datetime
 from dotenv import load_dotenv
 from flasgger import Swagger
 from flasgger import swag_from
 from flask import Flask, request, jsonify
 
+import metadata_analyzer
 from metadata_analyzer.analyzer import Analyzer
 from metadata_analyzer.backend import Backend
 from metadata_analyzer.database import Database
+from metadata_analyzer.fingerprints import FingerprintStore
+from metadata_analyzer.jobs import JobQueue
+from metadata_analyzer.outbox import Outbox
+from metadata_analyzer.results_snapshot import ResultsSnapshot
+from metadata_analyzer.scheduler import Scheduler
+from metadata_analyzer import serve
 from metadata_analyzer.schedule_based_analyzer import ScheduleBasedAnalyzer
+from metadata_analyzer.serialization import FlaskJSONProvider
+from metadata_analyzer.shared_state import SharedState
+from metadata_analyzer.single_flight import SingleFlight
 from metadata_analyzer.simple_rule_based_analyzer import SimpleRuleBasedAnalyzer
 from metadata_analyzer.enhanced_storage_analyzer import EnhancedStorageAnalyzer
 from metadata_analyzer.time_series_analyzer import Time_series_analyzer
 
 app = Flask(__name__)
+app.json = FlaskJSONProvider(app)
 swagger = Swagger(app)
 load_dotenv(dotenv_path=".env")
 path = app.root_path
+scheduler = Scheduler()
+jobs = JobQueue()
+# Identical concurrent requests share one analysis run
+single_flight = SingleFlight()
+# Settings, jobs and the scheduler status shared between the worker processes,
+# only set in the gunicorn serving mode
+shared_state = None
+# Durations of the startup steps in seconds
+startup_times = {"imports": time.perf_counter() - metadata_analyzer.import_start}
+
+
+@app.before_request
+def check_time_series_enabled():
+    # The time series analyses can be disabled with TIME_SERIES_ENABLED=false
+    if (
+        request.path.startswith("/timeSeriesAnalysis/")
+        and Analyzer.time_series_analyzer is None
+    ):
+        return "Time series analyses are disabled", 503
+
+
+@app.before_request
+def apply_shared_settings():
+    # Every worker process applies the settings changed through any of the workers
+    if shared_state is not None:
+        load_settings()
+
+
+def publish_settings(name, **changes):
+    # Makes changed settings visible to the other worker processes,
+    # every setting is stored on its own so concurrent changes of different settings don't collide
+    if shared_state is None:
+        return
+    for field, value in changes.items():
+        shared_state.put(f"{name}.{field}", value)
+
+
+def load_settings():
+    time_series_config = shared_state.get_prefix("timeSeries.")
+    if len(time_series_config) > 0 and Analyzer.time_series_analyzer is not None:
+        Analyzer.time_series_analyzer._update_config(**time_series_config)
+    forecast_config = shared_state.get_prefix("forecast.")
+    if len(forecast_config) > 0 and Analyzer.enhanced_storage_analyzer is not None:
+        analyzer = Analyzer.enhanced_storage_analyzer
+        analyzer.config = analyzer.config._replace(**forecast_config)
 
 
 @app.route("/")
@@ -30,7 +90,7 @@ def hello_world():
     os.path.join(path, "swagger", "updating", "basicBackupData.yaml"), validation=False
 )
 def update_data():
-    return jsonify(Analyzer.update_data())
+    return jsonify(single_flight.do("updateData", {}, Analyzer.update_data))
 
 
 @app.route("/alerting/size/fullBackups", methods=["POST"])
@@ -43,7 +103,13 @@ def simple_rule_based_analysis():
 
     try:
         int(alert_limit)
-        return jsonify(Analyzer.simple_rule_based_analysis(int(alert_limit)))
+        return jsonify(
+            single_flight.do(
+                "sizeFullBackups",
+                {"alertLimit": int(alert_limit)},
+                lambda: Analyzer.simple_rule_based_analysis(int(alert_limit)),
+            )
+        )
     except ValueError:
         return "Invalid value for alert limit", 400
 
@@ -58,7 +124,13 @@ def simple_rule_based_analysis_diff():
 
     try:
         int(alert_limit)
-        return jsonify(Analyzer.simple_rule_based_analysis_diff(int(alert_limit)))
+        return jsonify(
+            single_flight.do(
+                "sizeDiffBackups",
+                {"alertLimit": int(alert_limit)},
+                lambda: Analyzer.simple_rule_based_analysis_diff(int(alert_limit)),
+            )
+        )
     except ValueError:
         return "Invalid value for alert limit", 400
 
@@ -73,7 +145,13 @@ def simple_rule_based_analysis_inc():
 
     try:
         int(alert_limit)
-        return jsonify(Analyzer.simple_rule_based_analysis_inc(int(alert_limit)))
+        return jsonify(
+            single_flight.do(
+                "sizeIncBackups",
+                {"alertLimit": int(alert_limit)},
+                lambda: Analyzer.simple_rule_based_analysis_inc(int(alert_limit)),
+            )
+        )
     except ValueError:
         return "Invalid value for alert limit", 400
 
@@ -88,7 +166,32 @@ def simple_rule_based_analysis_creation_date():
 
     try:
         int(alert_limit)
-        return jsonify(Analyzer.schedule_based_analysis(int(alert_limit), now))
+        return jsonify(
+            single_flight.do(
+                "creationDate",
+                {"alertLimit": int(alert_limit)},
+                lambda: Analyzer.schedule_based_analysis(int(alert_limit), now),
+            )
+        )
+    except ValueError:
+        return "Invalid value for alert limit", 400
+
+
+@app.route("/alerting/all", methods=["POST"])
+@swag_from(os.path.join(path, "swagger", "alerting", "all.yaml"), validation=False)
+def run_all_analyses():
+    alert_limit = request.args.get("alertLimit", -1)
+    now = datetime.now()
+
+    try:
+        int(alert_limit)
+        return jsonify(
+            single_flight.do(
+                "allAnalyses",
+                {"alertLimit": int(alert_limit)},
+                lambda: Analyzer.run_all_analyses(int(alert_limit), now),
+            )
+        )
     except ValueError:
         return "Invalid value for alert limit", 400
 
@@ -103,7 +206,13 @@ def simple_rule_based_analysis_storage_capacity():
     try:
         int(alert_limit)
         return jsonify(
-            Analyzer.simple_rule_based_analysis_storage_capacity(int(alert_limit))
+            single_flight.do(
+                "storageCapacity",
+                {"alertLimit": int(alert_limit)},
+                lambda: Analyzer.simple_rule_based_analysis_storage_capacity(
+                    int(alert_limit)
+                ),
+            )
         )
     except ValueError:
         return "Invalid value for alert limit", 400
@@ -132,8 +241,18 @@ def runTimeSeriesTests():
         return "Missing field of type " + field, 400
 
     try:
-        result = Analyzer.simple_time_series_analysis(
-            variable, task_id, frequency, backup_type, window_size
+        result = single_flight.do(
+            "kMeansAnomalies",
+            {
+                "variable": variable,
+                "task_id": task_id,
+                "frequency": frequency,
+                "backup_type": backup_type,
+                "window_size": window_size,
+            },
+            lambda: Analyzer.simple_time_series_analysis(
+                variable, task_id, frequency, backup_type, window_size
+            ),
         )
         return jsonify(result)
     except ValueError as val:
@@ -206,6 +325,7 @@ def set_time_series_threshold():
     if threshold > 1 or threshold < 0:
         return "Threshold value not between 1 and 0, was " + str(threshold), 400
     Analyzer.time_series_analyzer.set_threshold(threshold), 200
+    publish_settings("timeSeries", threshold=threshold)
     return "Setting threshold was successful", 200
 
 
@@ -221,6 +341,7 @@ def set_time_series_clusters():
     except:
         return "Clusters value not an integer, was " + str(clusters), 400
     Analyzer.time_series_analyzer.set_clusters(clusters)
+    publish_settings("timeSeries", clusters=clusters)
     return "Setting clusters was successful", 200
 
 
@@ -244,6 +365,9 @@ def set_training_limits():
 
         Analyzer.time_series_analyzer.set_training_start(start)
         Analyzer.time_series_analyzer.set_training_end(end)
+        publish_settings(
+            "timeSeries", training_series_start=start, training_series_end=end
+        )
         return "Indices set successfully", 200
 
 
@@ -269,6 +393,12 @@ def calculate_training_indices():
             + str(ex),
             500,
         )
+    config = Analyzer.time_series_analyzer.config
+    publish_settings(
+        "timeSeries",
+        training_series_start=config.training_series_start,
+        training_series_end=config.training_series_end,
+    )
     return "Calculation of training series was successful", 200
 
 
@@ -281,7 +411,11 @@ def calculate_training_indices():
 )
 def enhanced_analysis_storage_capacity():
     try:
-        return jsonify(Analyzer.enhanced_analysis_storage_capacity())
+        return jsonify(
+            single_flight.do(
+                "storageOverflow", {}, Analyzer.enhanced_analysis_storage_capacity
+            )
+        )
     except KeyError as keyError:
         return "KeyError occurred: " + str(keyError), 500
     except ValueError as valError:
@@ -302,6 +436,7 @@ def set_enhanced_size_forecast_steps():
             400,
         )
     Analyzer.enhanced_storage_analyzer.set_forecast_length(steps), 200
+    publish_settings("forecast", forecast_length=steps)
     return "Setting forecasting steps was succesful", 200
 
 
@@ -320,20 +455,225 @@ def set_enhanced_size_forecast_frequency():
             "Threshold value could not be converted to int, was " + str(freq),
             400,
         )
-    Analyzer.enhanced_storage_analyzer.set_forecast_length(freq), 200
+    Analyzer.enhanced_storage_analyzer.set_forecast_frequency(freq)
+    publish_settings("forecast", frequency=freq)
     return "Setting forecasting frequency was succesful", 200
 
 
-def main():
-    database = Database()
+@app.route("/status", methods=["GET"])
+@swag_from(os.path.join(path, "swagger", "status.yaml"), validation=False)
+def status():
+    status = Analyzer.status()
+    status["singleFlight"] = single_flight.status()
+    return jsonify(status)
+
+
+@app.route("/scheduler", methods=["GET"])
+@swag_from(os.path.join(path, "swagger", "scheduler.yaml"), validation=False)
+def scheduler_status():
+    if len(scheduler) == 0 and shared_state is not None:
+        # Another worker process runs the scheduled analyses
+        status = shared_state.get("scheduler") or {}
+        for job in status.values():
+            if job["lastRun"] is not None:
+                job["lastRun"] = datetime.fromisoformat(job["lastRun"])
+        return jsonify(status)
+    return jsonify(scheduler.status())
+
+
+# Analyses which can be run as jobs or on a schedule, called with the alert limit
+# They use the same keys as their endpoints, so a job or a scheduled run shares
+# its run with identical requests
+job_analyses = {
+    "updateData": lambda alert_limit: single_flight.do(
+        "updateData", {}, Analyzer.update_data
+    ),
+    "sizeFullBackups": lambda alert_limit: single_flight.do(
+        "sizeFullBackups",
+        {"alertLimit": alert_limit},
+        lambda: Analyzer.simple_rule_based_analysis(alert_limit),
+    ),
+    "sizeDiffBackups": lambda alert_limit: single_flight.do(
+        "sizeDiffBackups",
+        {"alertLimit": alert_limit},
+        lambda: Analyzer.simple_rule_based_analysis_diff(alert_limit),
+    ),
+    "sizeIncBackups": lambda alert_limit: single_flight.do(
+        "sizeIncBackups",
+        {"alertLimit": alert_limit},
+        lambda: Analyzer.simple_rule_based_analysis_inc(alert_limit),
+    ),
+    "creationDate": lambda alert_limit: single_flight.do(
+        "creationDate",
+        {"alertLimit": alert_limit},
+        lambda: Analyzer.schedule_based_analysis(alert_limit, datetime.now()),
+    ),
+    "storageCapacity": lambda alert_limit: single_flight.do(
+        "storageCapacity",
+        {"alertLimit": alert_limit},
+        lambda: Analyzer.simple_rule_based_analysis_storage_capacity(alert_limit),
+    ),
+    "allAnalyses": lambda alert_limit: single_flight.do(
+        "allAnalyses",
+        {"alertLimit": alert_limit},
+        lambda: Analyzer.run_all_analyses(alert_limit, datetime.now()),
+    ),
+    "storageOverflow": lambda alert_limit: single_flight.do(
+        "storageOverflow", {}, Analyzer.enhanced_analysis_storage_capacity
+    ),
+}
+
+
+@app.route("/jobs", methods=["POST"])
+@swag_from(os.path.join(path, "swagger", "jobs", "submit.yaml"), validation=False)
+def submit_job():
+    json = request.get_json(silent=True)
+    if not isinstance(json, dict):
+        return "Missing JSON body", 400
+    analysis = json.get("analysis")
+    if analysis not in job_analyses:
+        return "Unknown analysis " + str(analysis), 400
+    # The storage overflow forecast is a time series analysis
+    if analysis == "storageOverflow" and Analyzer.time_series_analyzer is None:
+        return "Time series analyses are disabled", 503
+    parameters = json.get("parameters") or {}
+    if not isinstance(parameters, dict):
+        return "Invalid parameters", 400
+    try:
+        alert_limit = int(parameters.get("alertLimit", -1))
+    except (ValueError, TypeError):
+        return "Invalid value for alert limit", 400
+
+    # Jobs are identical if the parsed parameters are, e.g. for "5" and 5
+    job, _ = jobs.submit(
+        analysis,
+        {"alertLimit": alert_limit},
+        lambda: job_analyses[analysis](alert_limit),
+    )
+    return jsonify(job.as_json()), 202, {"Location": f"/jobs/{job.id}"}
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+@swag_from(os.path.join(path, "swagger", "jobs", "status.yaml"), validation=False)
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return "Job not found", 404
+    return jsonify(job.as_json())
+
+
+@app.cli.command("create-indexes")
+def create_indexes():
+    """Creates the indexes used by the analyzer in the analyzer database."""
+    created = Database().create_indexes()
+    print(f"Created indexes: {created}")
+
+
+def check_indexes(database):
+    # Warn at startup if the analyzer queries would have to scan whole tables
+    try:
+        if os.getenv("DATABASE_CREATE_INDEXES", "false").lower() == "true":
+            created = database.create_indexes()
+            if len(created) > 0:
+                print(f"Created indexes: {created}")
+        missing = database.missing_indexes()
+    except Exception as e:
+        print(f"Error checking the database indexes: {e}")
+        return
+    for index in missing:
+        columns = ", ".join(column.name for column in index.columns)
+        print(
+            f"WARNING: Missing index {index.name} on {index.table.name}({columns}), "
+            "run 'flask --app metadata_analyzer.main create-indexes' to create it"
+        )
+
+
+def scheduled(name):
+    # Scheduled runs first apply the settings changed through the other worker processes
+    def run_scheduled():
+        if shared_state is not None:
+            load_settings()
+        return job_analyses[name](-1)
+
+    return run_scheduled
+
+
+def schedule_analyses():
+    # Runs the analyses with a configured SCHEDULE_<NAME>_INTERVAL in the background
+    for name, env_name in [
+        ("updateData", "UPDATE_DATA"),
+        ("sizeFullBackups", "SIZE_FULL_BACKUPS"),
+        ("sizeDiffBackups", "SIZE_DIFF_BACKUPS"),
+        ("sizeIncBackups", "SIZE_INC_BACKUPS"),
+        ("creationDate", "CREATION_DATE"),
+        ("storageCapacity", "STORAGE_CAPACITY"),
+        ("allAnalyses", "ALL_ANALYSES"),
+    ]:
+        scheduler.add_from_env(name, env_name, scheduled(name))
+    if len(scheduler) > 0:
+        print(f"Scheduled analyses: {list(scheduler.status())}")
+        scheduler.start()
+
+
+@contextmanager
+def startup_step(name):
+    start = time.perf_counter()
+    yield
+    startup_times[name] = time.perf_counter() - start
+
+
+def print_startup_report():
+    total = time.perf_counter() - metadata_analyzer.import_start
+    steps = ", ".join(
+        f"{name} {duration:.2f}s" for name, duration in startup_times.items()
+    )
+    print(f"Startup took {total:.2f}s ({steps})")
+    print(
+        "Time series analyses: "
+        + ("enabled" if Analyzer.time_series_analyzer is not None else "disabled")
+        + f", darts loaded: {'darts' in sys.modules}"
+    )
+
+
+def init_analyzer():
+    with startup_step("database"):
+        database = Database()
+        check_indexes(database)
+    with startup_step("analyzers"):
+        init_analyzers(database)
+
+
+def init_analyzers(database):
     backend = Backend(os.getenv("BACKEND_URL"))
-    parameters = []
-    parameters.append(os.getenv("ANOMALY_THRESHOLD"))
-    parameters.append(os.getenv("CLUSTER_NUMBER"))
-    time_series_analyzer = Time_series_analyzer(parameters)
-    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(backend, 0.2, 0.2, 0.2, 0.2)
+    # Without the time series analyses only the rule based analyzers are started,
+    # darts and torch are only loaded once a time series analysis runs
+    time_series_enabled = (os.getenv("TIME_SERIES_ENABLED") or "true").lower() == "true"
+    time_series_analyzer = None
+    enhanced_storage_analyzer = None
+    if time_series_enabled:
+        parameters = []
+        parameters.append(os.getenv("ANOMALY_THRESHOLD"))
+        parameters.append(os.getenv("CLUSTER_NUMBER"))
+        time_series_analyzer = Time_series_analyzer(parameters)
+        enhanced_storage_analyzer = EnhancedStorageAnalyzer(backend)
+    outbox = None
+    outbox_path = os.getenv("OUTBOX_PATH")
+    if outbox_path:
+        outbox = Outbox(outbox_path)
+        print(f"Outbox: {len(outbox)} pending batches")
+    # Without a path the fingerprints are only kept until the analyzer is restarted
+    fingerprints = FingerprintStore(os.getenv("FINGERPRINTS_PATH") or ":memory:")
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(
+        backend, 0.2, 0.2, 0.2, 0.2, outbox
+    )
     schedule_based_analyzer = ScheduleBasedAnalyzer(backend)
-    enhanced_storage_analyzer = EnhancedStorageAnalyzer(backend)
+    results_snapshot = None
+    snapshot_path = os.getenv("RESULTS_SNAPSHOT_PATH")
+    if snapshot_path:
+        if ResultsSnapshot.is_supported():
+            results_snapshot = ResultsSnapshot(database, snapshot_path)
+        else:
+            print("WARNING: pyarrow is not installed, RESULTS_SNAPSHOT_PATH is ignored")
     Analyzer.__init__(
         database,
         backend,
@@ -341,7 +681,28 @@ def main():
         time_series_analyzer,
         schedule_based_analyzer,
         enhanced_storage_analyzer,
+        results_snapshot,
+        outbox,
+        fingerprints,
     )
+    if outbox is not None:
+        # Sends the batches left over from the previous run
+        try:
+            Analyzer.replay_outbox()
+        except Exception as e:
+            print(f"Error replaying the outbox: {e}")
+
+
+def share_state(path):
+    # Shares the settings, jobs and scheduler status between the gunicorn worker processes
+    global shared_state
+    shared_state = SharedState(path)
+    jobs.state = shared_state
+    scheduler.on_change = lambda status: shared_state.put("scheduler", status)
+
+
+def main():
+    init_analyzer()
 
     print(f"FLASK_RUN_HOST: {os.getenv('FLASK_RUN_HOST')}")
     print(f"FLASK_RUN_PORT: {os.getenv('FLASK_RUN_PORT')}")
@@ -350,4 +711,17 @@ def main():
     new_port = os.getenv("FLASK_RUN_PORT")
     new_host = os.getenv("FLASK_RUN_HOST", "localhost")
     int_port = int(new_port or 5000)
+    # SERVER=gunicorn serves with several worker processes instead of the Flask server
+    if (os.getenv("SERVER") or "flask").lower() == "gunicorn":
+        share_state(
+            os.getenv("SERVER_STATE_PATH")
+            or os.path.join(tempfile.gettempdir(), "metadata-analyzer-state.sqlite")
+        )
+        with startup_step("preload"):
+            serve.preload()
+        print_startup_report()
+        serve.serve(app, new_host, int_port, schedule_analyses)
+        return
+    schedule_analyses()
+    print_startup_report()
     app.run(host=new_host, port=int_port, debug=False)
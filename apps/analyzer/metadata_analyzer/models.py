@@ -1,6 +1,7 @@
 from datetime import datetime
 from typing import ClassVar, Optional
 
+from sqlalchemy import Index, text
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import mapped_column, Mapped
 
@@ -11,6 +12,33 @@ class Base(DeclarativeBase):
 
 class Result(Base):
     __tablename__ = "results"
+    # Indexes for the access paths of the analyzer, they are created by Database.create_indexes
+    __table_args__ = (
+        # Streaming and incremental reads ordered by start_time
+        Index(
+            "ix_results_start_time_saveset",
+            "start_time",
+            "saveset",
+            postgresql_concurrently=True,
+        ),
+        # Per task analyses of one backup type
+        Index(
+            "ix_results_task_fdi_type_start_time",
+            "task",
+            "fdi_type",
+            "start_time",
+            postgresql_concurrently=True,
+        ),
+        # Backup type filters of the analyses, which always skip subtasks
+        Index(
+            "ix_results_fdi_type_start_time_no_subtasks",
+            "fdi_type",
+            "start_time",
+            postgresql_where=text("subtask_flag = '0'"),
+            sqlite_where=text("subtask_flag = '0'"),
+            postgresql_concurrently=True,
+        ),
+    )
 
     # For now I only added the most relevant columns
     saveset: Mapped[str] = mapped_column(primary_key=True)
@@ -140,6 +168,10 @@ class TaskEvent(Base):
 
 class ResultLabel(Base):
     __tablename__ = "result_lbls"
+    # Used for joining the data stores on their name
+    __table_args__ = (
+        Index("ix_result_lbls_pool", "pool", postgresql_concurrently=True),
+    )
 
     saveset: Mapped[str] = mapped_column(primary_key=True)
     uuid: Mapped[str]
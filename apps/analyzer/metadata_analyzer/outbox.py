@@ -0,0 +1,125 @@
+import os
+import sqlite3
+import threading
+import time
+
+from metadata_analyzer import serialization
+
+
+class Outbox:
+    # Local SQLite spool of the batches for the backend
+    # Every batch is stored before it is sent and removed once the backend accepted it,
+    # so batches which could not be sent are replayed later without reading the results again
+    # A batch is claimed while it is being sent and only replayed once it was released after a failure,
+    # was left over from a previous run or its claim is older than lease seconds
+    def __init__(self, path, lease=None):
+        if lease is None:
+            lease = float(os.getenv("OUTBOX_LEASE") or 600)
+        self.path = path
+        self.lease = lease
+        self._connect()
+        # Nothing is being sent yet, so the batches claimed by a previous run can be replayed
+        with self.lock:
+            self.connection.execute("UPDATE batches SET claimed = NULL")
+
+    def _connect(self):
+        self.lock = threading.Lock()
+        # Concurrent analyses must not send the same pending batches twice
+        self.replay_lock = threading.Lock()
+        self.connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        with self.lock:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS batches ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "method TEXT NOT NULL, "
+                "payload TEXT NOT NULL, "
+                "claimed REAL)"
+            )
+            columns = [
+                row[1] for row in self.connection.execute("PRAGMA table_info(batches)")
+            ]
+            if "claimed" not in columns:
+                self.connection.execute("ALTER TABLE batches ADD COLUMN claimed REAL")
+
+    def after_fork(self):
+        # SQLite connections must not be shared with the parent process, every worker opens its own
+        self._connect()
+
+    def append(self, method, batch):
+        # Stores a batch for the backend method of the given name and returns its id
+        # The batch is claimed by the caller, which sends it right away
+        payload = serialization.dumps(batch).decode()
+        with self.lock:
+            cursor = self.connection.execute(
+                "INSERT INTO batches (method, payload, claimed) VALUES (?, ?, ?)",
+                (method, payload, time.time()),
+            )
+            return cursor.lastrowid
+
+    def ack(self, entry_id):
+        with self.lock:
+            self.connection.execute("DELETE FROM batches WHERE id = ?", (entry_id,))
+
+    def release(self, entry_id):
+        # Marks a batch which could not be sent for the next replay
+        with self.lock:
+            self.connection.execute(
+                "UPDATE batches SET claimed = NULL WHERE id = ?", (entry_id,)
+            )
+
+    def pending(self):
+        # Returns the batches which were not acknowledged yet in the order they were appended
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, method, payload FROM batches ORDER BY id"
+            ).fetchall()
+        return [
+            (entry_id, method, serialization.loads(payload))
+            for entry_id, method, payload in rows
+        ]
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM batches").fetchone()[0]
+
+    def _claim(self):
+        # Claims the batches which are not being sent by anyone else
+        now = time.time()
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT id, method, payload FROM batches "
+                "WHERE claimed IS NULL OR claimed < ? ORDER BY id",
+                (now - self.lease,),
+            ).fetchall()
+            self.connection.executemany(
+                "UPDATE batches SET claimed = ? WHERE id = ?",
+                [(now, entry_id) for entry_id, _, _ in rows],
+            )
+        return [
+            (entry_id, method, serialization.loads(payload))
+            for entry_id, method, payload in rows
+        ]
+
+    def replay(self, backend):
+        # Sends the unclaimed batches in order and stops at the first one that fails
+        # Batches which are being sent at the same time are not sent again
+        count = 0
+        with self.replay_lock:
+            entries = self._claim()
+            for i, (entry_id, method, batch) in enumerate(entries):
+                try:
+                    getattr(backend, method)(batch)
+                except Exception:
+                    for remaining_id, _, _ in entries[i:]:
+                        self.release(remaining_id)
+                    raise
+                self.ack(entry_id)
+                count += 1
+        return count
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,79 @@
+import os
+import queue
+import threading
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+_DONE = object()
+
+
+class Prefetcher:
+    # Reads an iterable in a background thread while the consumer works on the items read before
+    # At most queue_size chunks of chunk_size items are buffered, so memory stays bounded
+    def __init__(self, iterable, chunk_size=None, queue_size=None):
+        if chunk_size is None:
+            chunk_size = int(os.getenv("PIPELINE_CHUNK_SIZE") or 1000)
+        if queue_size is None:
+            queue_size = int(os.getenv("PIPELINE_QUEUE_SIZE") or 4)
+        self.iterable = iterable
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=queue_size)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._produce, daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def __iter__(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is _DONE:
+                return
+            if isinstance(chunk, _Failure):
+                raise chunk.error
+            yield from chunk
+
+    def close(self):
+        # Stops reading, e.g. if the consumer failed, and waits for the background thread
+        self.stopped.set()
+        self.thread.join()
+
+    def _put(self, chunk):
+        # Waits for space in the queue unless the prefetcher was closed
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(chunk, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        iterator = iter(self.iterable)
+        try:
+            chunk = []
+            for item in iterator:
+                chunk.append(item)
+                if len(chunk) == self.chunk_size:
+                    if not self._put(chunk):
+                        return
+                    chunk = []
+            if len(chunk) > 0 and not self._put(chunk):
+                return
+            self._put(_DONE)
+        except Exception as e:
+            self._put(_Failure(e))
+        finally:
+            # Closes generators early, e.g. to return their database session
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+
+
+class ResultList(list):
+    # List of results with an index from uuid to start_time, built on the first lookup
+    # and shared by every start date lookup on the same data
+    def __init__(self, results=()):
+        super().__init__(results)
+        self.lock = threading.Lock()
+        self.start_times = None
+        self.duplicates = None
+
+    def start_time(self, uuid):
+        with self.lock:
+            if self.start_times is None:
+                self._build_index()
+        # Every uuid has to belong to exactly one result
+        assert uuid in self.start_times and uuid not in self.duplicates
+        return self.start_times[uuid]
+
+    def _build_index(self):
+        self.start_times = {}
+        self.duplicates = set()
+        for result in self:
+            if result.uuid in self.start_times:
+                self.duplicates.add(result.uuid)
+            self.start_times[result.uuid] = result.start_time
+
+
+class ResultsCache:
+    # Shares the data loaded by the analyses until the results table changes
+    # Before every lookup a cheap probe (newest start_time and number of results) checks whether
+    # the cached data is still current; entries are dropped after max_age seconds in any case,
+    # because changed schedules or task events are not detected by the probe
+    # The cached data is shared by all analyses and must not be modified
+    def __init__(self, database, max_age=None):
+        if max_age is None:
+            max_age = float(os.getenv("RESULTS_CACHE_MAX_AGE") or 300)
+        self.database = database
+        self.max_age = max_age
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.version = None
+        self.loaded = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, load):
+        version = self.database.probe_results()
+        with self.lock:
+            if (
+                version != self.version
+                or time.monotonic() - self.loaded > self.max_age
+            ):
+                self.entries = {}
+                self.version = version
+                self.loaded = time.monotonic()
+            if key in self.entries:
+                self.hits += 1
+                return self.entries[key]
+            self.misses += 1
+
+        value = load()
+        with self.lock:
+            # Don't store data loaded while the table changed
+            if self.version == version:
+                self.entries[key] = value
+        return value
+
+    def invalidate(self):
+        with self.lock:
+            self.entries = {}
+            self.version = None
+
+    def status(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+            }
@@ -0,0 +1,99 @@
+import fcntl
+import importlib.util
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from metadata_analyzer.models import Result
+
+
+class ResultsSnapshot:
+    def __init__(self, database, path):
+        self.database = database
+        self.path = path
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_supported():
+        # Reading and writing parquet files requires pyarrow
+        return importlib.util.find_spec("pyarrow") is not None
+
+    def load(self):
+        # Returns all results, only results newer than the snapshot are loaded from the database
+        with self._locked():
+            columns = [column.name for column in Result.__table__.columns]
+            df = self._read()
+            if df is None or list(df.columns) != columns or df.empty:
+                df = self.database.get_results_frame(columns)
+            else:
+                # Results with the same start_time as the newest result in the snapshot
+                # could have been added after the snapshot was written, so load them again
+                newest = df["start_time"].max()
+                delta = self.database.get_results_frame(columns, since=newest)
+                # Without new results the delta only contains the results of the snapshot
+                # with the newest start_time, then the snapshot doesn't have to be rewritten
+                if self._unchanged(df[df["start_time"] == newest], delta):
+                    return df
+                df = pd.concat(
+                    [df[~df["saveset"].isin(delta["saveset"])], delta],
+                    ignore_index=True,
+                )
+            self._write(df)
+            return df
+
+    @staticmethod
+    def _unchanged(boundary, delta):
+        if len(boundary) != len(delta):
+            return False
+        boundary = boundary.sort_values("saveset").reset_index(drop=True)
+        delta = delta.sort_values("saveset").reset_index(drop=True)
+        return boundary.astype(object).equals(delta.astype(object))
+
+    def invalidate(self):
+        # Forces a full reload from the database on the next load
+        with self._locked():
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    @contextmanager
+    def _locked(self):
+        # The snapshot is shared by the worker processes of the gunicorn serving mode,
+        # so the lock file keeps other processes from merging and replacing it at the same time
+        directory = os.path.dirname(self.path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        with self.lock, open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            return pd.read_parquet(self.path, memory_map=True)
+        except Exception as e:
+            print(f"Error reading the results snapshot {self.path}: {e}")
+            return None
+
+    def _write(self, df):
+        # Write to a temporary file first, so a crash never leaves a broken snapshot behind
+        # The name of the temporary file is unique, so no other writer can replace it
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(self.path) or ".",
+            prefix=os.path.basename(self.path) + ".",
+            suffix=".tmp",
+            delete=False,
+        ) as temp_file:
+            temp_path = temp_file.name
+        try:
+            df.to_parquet(temp_path, index=False)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
@@ -1,12 +1,26 @@
 from collections import defaultdict
 from datetime import datetime, timedelta, time
 import sys
+from metadata_analyzer.batch_dispatcher import AdaptiveBatchSizer, BatchDispatcher
 from metadata_analyzer.creation_date_alert import CreationDateAlert
 from metadata_analyzer.missing_backup_alert import MissingBackupAlert
 from metadata_analyzer.additional_backup_alert import AdditionalBackupAlert
+from metadata_analyzer.jobs import report_progress
 
 
 class ScheduleBasedAnalyzer:
+    # Columns of the results table used by the schedule based analysis
+    result_columns = (
+        "uuid",
+        "task",
+        "fdi_type",
+        "is_backup",
+        "subtask_flag",
+        "schedule",
+        "data_size",
+        "start_time",
+    )
+
     def __init__(self, backend):
         self.backend = backend
 
@@ -28,7 +42,8 @@ class ScheduleBasedAnalyzer:
             groups[result.task].append(result)
 
         alerts = []
-        for task, unordered_results in groups.items():
+        for i, (task, unordered_results) in enumerate(groups.items()):
+            report_progress(i, len(groups))
             results = sorted(unordered_results, key=lambda result: result.start_time)
             alerts += self._analyze_one_task(
                 task, results, schedules, task_events, start_date, stop_date
@@ -57,14 +72,34 @@ class ScheduleBasedAnalyzer:
             elif isinstance(alert, AdditionalBackupAlert):
                 additional_backup_alerts.append(alert.as_json())
 
-        self.backend.create_creation_date_alerts_batched(creation_date_alerts)
-        for alert in missing_backup_alerts:
-            self.backend.create_missing_backup_alert(alert)
-        for alert in additional_backup_alerts:
-            self.backend.create_additional_backup_alert(alert)
+        self._send_alerts(
+            self.backend.create_creation_date_alerts_batched,
+            AdaptiveBatchSizer.shared("creation_date_alerts"),
+            creation_date_alerts,
+        )
+        self._send_alerts(
+            self.backend.create_missing_backup_alerts_batched,
+            AdaptiveBatchSizer.shared("missing_backup_alerts"),
+            missing_backup_alerts,
+        )
+        self._send_alerts(
+            self.backend.create_additional_backup_alerts_batched,
+            AdaptiveBatchSizer.shared("additional_backup_alerts"),
+            additional_backup_alerts,
+        )
 
         return {"count": count}
 
+    @staticmethod
+    def _send_alerts(send, sizer, alerts):
+        # The next analysis starts after the latest alert, so the batches are sent one after
+        # another and none is sent after a failed one
+        with BatchDispatcher(
+            send, max_in_flight=1, ordered=True, sizer=sizer
+        ) as dispatcher:
+            for alert in alerts:
+                dispatcher.add(alert)
+
     def _analyze_one_task(
         self, task, results, schedules, task_events, start_date, stop_date
     ):
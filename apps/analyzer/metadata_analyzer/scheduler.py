@@ -0,0 +1,155 @@
+import datetime
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Job:
+    def __init__(self, name, run, interval, jitter):
+        self.name = name
+        self.run = run
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = None
+        self.running = False
+        self.runs = 0
+        self.skipped = 0
+        self.failures = 0
+        self.last_run = None
+        self.last_duration = None
+        self.last_error = None
+
+
+class Scheduler:
+    # Runs analyses periodically in the background
+    # One thread keeps the times of the next runs, the runs themselves are executed
+    # on a pool of max_concurrent threads
+    # A run is skipped if the previous run of the same analysis is still going
+    def __init__(self, max_concurrent=None):
+        if max_concurrent is None:
+            max_concurrent = int(os.getenv("SCHEDULER_MAX_CONCURRENT") or 2)
+        self.max_concurrent = max_concurrent
+        self.lock = threading.Lock()
+        self.jobs = {}
+        self.stopped = threading.Event()
+        # Wakes the scheduler thread when a job is added
+        self.changed = threading.Event()
+        self.executor = None
+        self.thread = None
+        # Called with the status after the scheduler started and after every run
+        self.on_change = None
+
+    def add(self, name, run, interval, jitter=0.0):
+        # The first run starts after one interval, every run is delayed by up to jitter seconds,
+        # so analyses with the same interval don't hit the database at the same time
+        job = _Job(name, run, interval, jitter)
+        job.next_run = time.monotonic() + self._delay(job)
+        with self.lock:
+            self.jobs[name] = job
+        self.changed.set()
+        return job
+
+    def add_from_env(self, name, env_name, run):
+        # Reads SCHEDULE_<env_name>_INTERVAL and SCHEDULE_<env_name>_JITTER in seconds,
+        # analyses without an interval are not scheduled
+        interval = float(os.getenv(f"SCHEDULE_{env_name}_INTERVAL") or 0)
+        if interval <= 0:
+            return None
+        jitter = float(os.getenv(f"SCHEDULE_{env_name}_JITTER") or 0)
+        return self.add(name, run, interval, jitter)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.jobs)
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrent, thread_name_prefix="scheduler"
+        )
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+        self._changed()
+
+    def stop(self, wait=True):
+        self.stopped.set()
+        self.changed.set()
+        if self.thread is not None:
+            self.thread.join()
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+
+    def status(self):
+        with self.lock:
+            return {
+                job.name: {
+                    "interval": job.interval,
+                    "jitter": job.jitter,
+                    "running": job.running,
+                    "runs": job.runs,
+                    "skipped": job.skipped,
+                    "failures": job.failures,
+                    "lastRun": job.last_run,
+                    "lastDuration": job.last_duration,
+                    "lastError": job.last_error,
+                }
+                for job in self.jobs.values()
+            }
+
+    @staticmethod
+    def _delay(job):
+        return job.interval + random.uniform(0, job.jitter)
+
+    def _loop(self):
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            with self.lock:
+                due = [job for job in self.jobs.values() if job.next_run <= now]
+                for job in due:
+                    job.next_run = now + self._delay(job)
+                next_run = min(
+                    (job.next_run for job in self.jobs.values()), default=None
+                )
+            for job in due:
+                self._submit(job)
+
+            timeout = None if next_run is None else max(next_run - now, 0)
+            self.changed.wait(timeout)
+            self.changed.clear()
+
+    def _submit(self, job):
+        with self.lock:
+            if job.running:
+                print(f"Skipping scheduled {job.name}, the previous run is still going")
+                job.skipped += 1
+                return
+            job.running = True
+        self.executor.submit(self._run, job)
+
+    def _run(self, job):
+        last_run = datetime.datetime.now()
+        start = time.perf_counter()
+        error = None
+        try:
+            job.run()
+        except Exception as e:
+            print(f"Error in scheduled {job.name}: {e}")
+            error = str(e)
+        with self.lock:
+            job.running = False
+            job.runs += 1
+            job.last_run = last_run
+            job.last_duration = time.perf_counter() - start
+            job.last_error = error
+            if error is not None:
+                job.failures += 1
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is None:
+            return
+        try:
+            self.on_change(self.status())
+        except Exception as e:
+            print(f"Error publishing the scheduler status: {e}")
@@ -0,0 +1,57 @@
+import datetime
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional, without it the standard library is used
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(obj, default=None, sort_keys=False):
+    # Encodes obj as compact JSON bytes, datetimes are encoded in ISO format
+    # If default is given, it is also called for datetimes instead
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if default is not None:
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=default or _default, option=option)
+    return json.dumps(
+        obj,
+        default=default or _default,
+        sort_keys=sort_keys,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    ).encode()
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FlaskJSONProvider(DefaultJSONProvider):
+    # Uses the same encoder as the requests to the backend for jsonify,
+    # while keeping Flask's encoding of dates and other types
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, self.default, self.sort_keys).decode()
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            dumps(obj, self.default, self.sort_keys) + b"\n", mimetype=self.mimetype
+        )
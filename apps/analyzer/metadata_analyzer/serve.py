@@ -0,0 +1,108 @@
+import gc
+import os
+import sys
+import tempfile
+import threading
+
+from metadata_analyzer.analyzer import Analyzer
+
+# gunicorn is optional, it is only needed to serve with several worker processes
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:
+    BaseApplication = None
+
+# Lock file held by the worker which runs the scheduled analyses
+_scheduler_lock = None
+
+
+def is_supported():
+    return BaseApplication is not None
+
+
+def preload():
+    # Loads the data shared by all workers in the master process
+    # The forked workers share the memory pages copy-on-write as long as they only read them
+    if (os.getenv("SERVER_PRELOAD_TIME_SERIES") or "true").lower() == "true":
+        if Analyzer.time_series_analyzer is not None:
+            try:
+                Analyzer.load_time_series_data()
+            except Exception as e:
+                print(f"Error preloading the time series data: {e}")
+    # Objects created so far are never collected, so the garbage collector of the workers
+    # doesn't write to and thereby copy the shared pages
+    gc.freeze()
+
+
+def after_fork():
+    Analyzer.after_fork()
+    # Every worker serves several requests at the same time, so torch must not
+    # start one thread per core in each worker
+    # torch is only imported once a time series analysis runs, it then reads the limit
+    # from the environment, if it was already imported the limit is set directly
+    threads = os.getenv("SERVER_TORCH_THREADS") or "1"
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    torch = sys.modules.get("torch")
+    if torch is not None:
+        torch.set_num_threads(int(threads))
+
+
+def start_scheduler_once(start_scheduler):
+    # Only the worker holding the lock file runs the scheduled analyses,
+    # if it exits the lock is released and another worker takes over
+    # fcntl is only available on unix, like gunicorn itself
+    import fcntl
+
+    path = os.getenv("SERVER_SCHEDULER_LOCK") or os.path.join(
+        tempfile.gettempdir(), "metadata-analyzer-scheduler.lock"
+    )
+
+    def wait_for_lock():
+        global _scheduler_lock
+        lock_file = open(path, "w")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # The lock is released when the file is closed, so keep it open
+        _scheduler_lock = lock_file
+        print(f"Worker {os.getpid()} runs the scheduled analyses")
+        start_scheduler()
+
+    threading.Thread(target=wait_for_lock, daemon=True).start()
+
+
+def options(host, port):
+    threads = int(os.getenv("SERVER_THREADS") or 4)
+    return {
+        "bind": f"{host}:{port}",
+        "workers": int(os.getenv("SERVER_WORKERS") or os.cpu_count() or 1),
+        "threads": threads,
+        "worker_class": "gthread" if threads > 1 else "sync",
+        # The analyses can run for minutes
+        "timeout": int(os.getenv("SERVER_TIMEOUT") or 300),
+        "preload_app": True,
+    }
+
+
+def serve(app, host, port, start_scheduler):
+    # Serves the app with gunicorn, the analyzer is initialized and preloaded in the master process
+    if not is_supported():
+        raise RuntimeError(
+            "gunicorn is not installed, run 'poetry install --extras server'"
+        )
+
+    config = options(host, port)
+    config["post_fork"] = lambda server, worker: after_fork()
+    config["post_worker_init"] = lambda worker: start_scheduler_once(start_scheduler)
+
+    class Application(BaseApplication):
+        def load_config(self):
+            for key, value in config.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return app
+
+    print(
+        f"Serving with {config['workers']} workers and {config['threads']} threads each"
+    )
+    Application().run()
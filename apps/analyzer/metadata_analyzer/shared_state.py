@@ -0,0 +1,82 @@
+import sqlite3
+import time
+from contextlib import closing, contextmanager
+
+from metadata_analyzer import serialization
+
+
+class SharedState:
+    # State shared between the worker processes of the gunicorn serving mode, kept in a SQLite file:
+    # the settings of the time series analyses, the status of the scheduler and the jobs
+    # Every call opens its own connection, so the forked workers never share one
+    # The state of a previous run is cleared when the master process creates it
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                "key TEXT PRIMARY KEY, "
+                "value TEXT NOT NULL)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, "
+                "job TEXT NOT NULL, "
+                "finished REAL)"
+            )
+            connection.execute("DELETE FROM state")
+            connection.execute("DELETE FROM jobs")
+
+    @contextmanager
+    def _connect(self):
+        with closing(
+            sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        ) as connection:
+            yield connection
+
+    def put(self, key, value):
+        value = serialization.dumps(value).decode()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value)
+            )
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM state WHERE key = ?", (key,)
+            ).fetchone()
+        return None if row is None else serialization.loads(row[0])
+
+    def get_prefix(self, prefix):
+        # Returns the values of all keys starting with prefix, by the rest of the key
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT key, value FROM state WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchall()
+        return {key[len(prefix) :]: serialization.loads(value) for key, value in rows}
+
+    def save_job(self, job_id, job, finished=None):
+        # finished is the time the job finished as a timestamp, used to remove it later
+        job = serialization.dumps(job).decode()
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO jobs (id, job, finished) VALUES (?, ?, ?)",
+                (job_id, job, finished),
+            )
+
+    def load_job(self, job_id):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT job FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return None if row is None else serialization.loads(row[0])
+
+    def remove_jobs(self, max_age):
+        # Removes the jobs which finished more than max_age seconds ago
+        with self._connect() as connection:
+            connection.execute(
+                "DELETE FROM jobs WHERE finished < ?", (time.time() - max_age,)
+            )
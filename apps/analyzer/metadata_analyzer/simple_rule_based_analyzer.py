@@ -1,12 +1,27 @@
 from collections import defaultdict
 from datetime import datetime, timedelta, time
 
+from metadata_analyzer.batch_dispatcher import (
+    AdaptiveBatchSizer,
+    BatchDispatcher,
+    BatchDispatchError,
+)
 from metadata_analyzer.creation_date_alert import CreationDateAlert
 from metadata_analyzer.size_alert import SizeAlert
 from metadata_analyzer.storage_fill_alert import StorageFillAlert
 
 
 class SimpleRuleBasedAnalyzer:
+    # Columns of the results table used by the size alert analyses
+    result_columns = (
+        "uuid",
+        "task",
+        "fdi_type",
+        "data_size",
+        "start_time",
+        "subtask_flag",
+    )
+
     def __init__(
         self,
         backend,
@@ -14,40 +29,43 @@ class SimpleRuleBasedAnalyzer:
         inc_percentage,
         inc_date_percentage,
         diff_percentage,
+        outbox=None,
     ):
         self.backend = backend
+        self.outbox = outbox
         self.size_alert_percentage = size_alert_percentage
         self.inc_data_percentage = inc_percentage
         self.inc_date_percentage = inc_date_percentage
         self.diff_percentage = diff_percentage
+        # Date of the first alert which was not sent by the last run of an analysis,
+        # if later alerts may have been accepted and no outbox keeps the unsent ones
+        self.resume_dates = {}
 
-    # Analyze a pair of consecutive results, returns a list of created alerts
-    def _analyze_pair(self, result1, result2, bound):
-        relative_change = self.handle_zero(result1, result2)
+    # Analyze a result against the size of the previous result, returns a list of created alerts
+    def _analyze_pair(self, reference_size, result, bound):
+        relative_change = self.handle_zero(reference_size, result.data_size)
         # Skip pairs of results with changes inside the bounds
         if -bound <= relative_change <= bound:
             return []
 
-        alert = SizeAlert(result2, result1.data_size)
+        alert = SizeAlert(result, reference_size)
         return [alert]
 
-    def handle_zero(self, result1, result2):
+    def handle_zero(self, reference_size, size):
         # Handle results with a data_size of zero
-        if result1.data_size == 0 and result2.data_size == 0:
+        if reference_size == 0 and size == 0:
             relative_change = 0
-        elif result1.data_size == 0:
+        elif reference_size == 0:
             relative_change = float("inf")
-        elif result2.data_size == 0:
+        elif size == 0:
             relative_change = -float("inf")
         else:
-            relative_change = (
-                result2.data_size - result1.data_size
-            ) / result1.data_size
+            relative_change = (size - reference_size) / reference_size
         return relative_change
 
     # Analyze a pair of consecutive results, returns a list of created alerts
     def _analyze_pair_diff(self, result1, result2):
-        relative_change = self.handle_zero(result1, result2)
+        relative_change = self.handle_zero(result1.data_size, result2.data_size)
 
         # Skip pairs of results with changes inside the bounds that increase
         if relative_change > 0 and relative_change <= self.diff_percentage:
@@ -58,6 +76,7 @@ class SimpleRuleBasedAnalyzer:
 
     # For now only search for size changes and trigger corresponding alerts
     def analyze(self, data, alert_limit, start_date):
+        start_date = self._start_date("size_full", start_date)
         # Group the 'full' results by their task
         groups = defaultdict(list)
         for result in data:
@@ -80,7 +99,7 @@ class SimpleRuleBasedAnalyzer:
                 # Only create alerts for unanalyzed results
                 if result2.start_time > start_date:
                     alerts += self._analyze_pair(
-                        result1, result2, self.size_alert_percentage
+                        result1.data_size, result2, self.size_alert_percentage
                     )
 
         # Because we ignore alerts which would be created earlier than the current latest alert,
@@ -95,26 +114,16 @@ class SimpleRuleBasedAnalyzer:
         maxAlerts = len(alerts) if alert_limit == -1 else min(alert_limit, len(alerts))
         # Send the alerts to the backend
         # Batch the api calls to the backend for improved efficiency
-        batch = []
-        count = 0
-
-        for alert in alerts[:maxAlerts]:
-            batch.append(alert.as_json())
-            count += 1
-
-            # Send a full batch
-            if len(batch) == 100:
-                self.backend.create_size_alerts_batched(batch)
-                batch = []
-
-        # Send the remaining results
-        if len(batch) > 0:
-            self.backend.create_size_alerts_batched(batch)
-
-        return {"count": count}
+        return self._send_alerts(
+            "size_full",
+            self.backend.create_size_alerts_batched,
+            AdaptiveBatchSizer.shared("size_alerts"),
+            alerts[:maxAlerts],
+        )
 
     # Searches for size increases in diffs and trigger corresponding alerts if not applicable
     def analyze_diff(self, data, alert_limit, start_date):
+        start_date = self._start_date("size_diff", start_date)
         # Group the 'full' and 'diff results by their task
         groups = defaultdict(list)
         groupNum = 0
@@ -154,26 +163,16 @@ class SimpleRuleBasedAnalyzer:
         maxAlerts = len(alerts) if alert_limit == -1 else min(alert_limit, len(alerts))
         # Send the alerts to the backend
         # Batch the api calls to the backend for improved efficiency
-        batch = []
-        count = 0
-
-        for alert in alerts[:maxAlerts]:
-            batch.append(alert.as_json())
-            count += 1
-
-            # Send a full batch
-            if len(batch) == 100:
-                self.backend.create_size_alerts_batched(batch)
-                batch = []
-
-        # Send the remaining results
-        if len(batch) > 0:
-            self.backend.create_size_alerts_batched(batch)
-
-        return {"count": count}
+        return self._send_alerts(
+            "size_diff",
+            self.backend.create_size_alerts_batched,
+            AdaptiveBatchSizer.shared("size_alerts"),
+            alerts[:maxAlerts],
+        )
 
     # Searches for size changes in incs and triggers corresponding alerts if not applicable
     def analyze_inc(self, data, alert_limit, start_date):
+        start_date = self._start_date("size_inc", start_date)
         groups = defaultdict(list)
         for result in data:
             if (
@@ -216,13 +215,11 @@ class SimpleRuleBasedAnalyzer:
                 if interval >= avg_time * (
                     1 - self.inc_date_percentage
                 ) and interval <= avg_time * (1 + self.inc_date_percentage):
-                    # converts prev to a result with the average size
-                    prev.data_size = avg_size
-
                     # Only create alerts for unanalyzed results
+                    # The average size is used as reference instead of the size of prev
                     if current.start_time > start_date:
                         alerts += self._analyze_pair(
-                            prev, current, self.inc_data_percentage
+                            avg_size, current, self.inc_data_percentage
                         )
 
         # Because we ignore alerts which would be created earlier than the current latest alert,
@@ -237,22 +234,42 @@ class SimpleRuleBasedAnalyzer:
         maxAlerts = len(alerts) if alert_limit == -1 else min(alert_limit, len(alerts))
         # Send the alerts to the backend
         # Batch the api calls to the backend for improved efficiency
-        batch = []
+        return self._send_alerts(
+            "size_inc",
+            self.backend.create_size_alerts_batched,
+            AdaptiveBatchSizer.shared("size_alerts"),
+            alerts[:maxAlerts],
+        )
+
+    def _start_date(self, kind, start_date):
+        # Starts again before the alerts the last run didn't send
+        resume_date = self.resume_dates.get(kind)
+        # Without a start date all results are analyzed anyway
+        if resume_date is None or start_date is None:
+            return start_date
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%S.%fZ")
+        # The analyses only create alerts for results after the start date
+        return min(start_date, resume_date - timedelta(microseconds=1))
+
+    def _send_alerts(self, kind, send, sizer, alerts):
+        # The alerts are sent in order of their date, because the next analysis starts after the latest alert
+        # Batches are sent at the same time, if one of them is not sent the next run starts again
+        # at its first alert; the backend ignores the alerts it already has
         count = 0
-
-        for alert in alerts[:maxAlerts]:
-            batch.append(alert.as_json())
-            count += 1
-
-            # Send a full batch
-            if len(batch) == 100:
-                self.backend.create_size_alerts_batched(batch)
-                batch = []
-
-        # Send the remaining results
-        if len(batch) > 0:
-            self.backend.create_size_alerts_batched(batch)
-
+        try:
+            with BatchDispatcher(
+                send, ordered=True, sizer=sizer, outbox=self.outbox
+            ) as dispatcher:
+                for alert in alerts:
+                    dispatcher.add(alert.as_json(), alert.date)
+                    count += 1
+        except BatchDispatchError as e:
+            # With an outbox the unsent batches are replayed instead
+            if self.outbox is None and e.resume is not None:
+                self.resume_dates[kind] = e.resume
+            raise
+        self.resume_dates.pop(kind, None)
         return {"count": count}
 
     # Search for unusual creation times of 'full' backups made after start_date
@@ -266,6 +283,7 @@ class SimpleRuleBasedAnalyzer:
     def analyze_creation_dates(
         self, data, schedules, alert_limit, start_date, mode="DEFAULT"
     ):
+        start_date = self._start_date("creation_date", start_date)
         # Group the 'full' results by their task
         groups = defaultdict(list)
         for result in data:
@@ -304,26 +322,53 @@ class SimpleRuleBasedAnalyzer:
         maxAlerts = len(alerts) if alert_limit == -1 else min(alert_limit, len(alerts))
         # Send the alerts to the backend
         # Batch the api calls to the backend for improved efficiency
-        batch = []
-        count = 0
+        return self._send_alerts(
+            "creation_date",
+            self.backend.create_creation_date_alerts_batched,
+            AdaptiveBatchSizer.shared("creation_date_alerts"),
+            alerts[:maxAlerts],
+        )
+
+    # Sets the scheduledTime of 'full' backups made after start_date without creating alerts.
+    # The results have to be ordered by their start_time, so they can be streamed
+    # and only the latest start_time per task and schedule has to be kept in memory
+    def annotate_scheduled_times(self, data, schedules, start_date):
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, "%Y-%m-%dT%H:%M:%S.%fZ")
 
-        for alert in alerts[:maxAlerts]:
-            batch.append(alert.as_json())
-            count += 1
+        schedule_dict = self.extract_schedule_dict(schedules)
+        previous_start_times = dict()
+        for result in data:
+            if (
+                result.task == ""
+                or result.fdi_type != "F"
+                or result.data_size is None
+                or result.start_time is None
+                or result.subtask_flag != "0"
+            ):
+                yield result
+                continue
 
-            # Send a full batch
-            if len(batch) == 100:
-                self.backend.create_creation_date_alerts_batched(batch)
-                batch = []
+            key = (result.task, result.schedule)
+            previous_start_time = previous_start_times.get(key)
+            previous_start_times[key] = result.start_time
 
-        # Send the remaining results
-        if len(batch) > 0:
-            self.backend.create_creation_date_alerts_batched(batch)
+            if (
+                previous_start_time is not None
+                and result.schedule in schedule_dict.keys()
+                and (start_date is None or result.start_time > start_date)
+            ):
+                expected_date = self._expected_creation_date(
+                    schedule_dict[result.schedule], previous_start_time
+                )
+                if expected_date is not None:
+                    result.scheduledTime = expected_date
 
-        return {"count": count}
+            yield result
 
-    # Analyzes the creation times of a group of results from one task.
-    def _analyze_creation_dates_of_one_task(self, results, schedule_dict, start_date):
+    # Calculates the expected creation date of the backup following a backup made at previous_start_time
+    # Returns None if the schedule has an unknown base
+    def _expected_creation_date(self, schedule, previous_start_time):
         base_to_seconds = {
             "MIN": 60,
             "HOU": 60 * 60,
@@ -332,6 +377,17 @@ class SimpleRuleBasedAnalyzer:
             "MON": 30 * 24 * 60 * 60,
         }
 
+        if schedule.p_base not in base_to_seconds.keys():
+            return None
+        # Calculate the expected timedelta between two backups for this schedule
+        multiplier = base_to_seconds[schedule.p_base]
+        expected_delta_seconds = schedule.p_count * multiplier
+        expected_delta = timedelta(seconds=expected_delta_seconds)
+
+        return self.compute_expected_date(previous_start_time, expected_delta, schedule)
+
+    # Analyzes the creation times of a group of results from one task.
+    def _analyze_creation_dates_of_one_task(self, results, schedule_dict, start_date):
         # Group all results by their schedule
         schedule_groups = defaultdict(list)
         for result in results:
@@ -344,12 +400,6 @@ class SimpleRuleBasedAnalyzer:
                 continue
             # Get the schedule for this schedule group
             schedule = schedule_dict[schedule_name]
-            if schedule.p_base not in base_to_seconds.keys():
-                continue
-            # Calculate the expected timedelta between two backups for this schedule
-            multiplier = base_to_seconds[schedule.p_base]
-            expected_delta_seconds = schedule.p_count * multiplier
-            expected_delta = timedelta(seconds=expected_delta_seconds)
 
             # Skip the first backup in a schedule group
             for result1, result2 in zip(schedule_group[:-1], schedule_group[1:]):
@@ -364,9 +414,12 @@ class SimpleRuleBasedAnalyzer:
                         continue
 
                 # Calculate the expected date for result2
-                expected_date = self.compute_expected_date(
-                    result1.start_time, expected_delta, schedule
+                expected_date = self._expected_creation_date(
+                    schedule, result1.start_time
                 )
+                # Skip schedules with an unknown base
+                if expected_date is None:
+                    break
 
                 # Set the scheduledTime field
                 result2.scheduledTime = expected_date
@@ -0,0 +1,64 @@
+import threading
+
+from metadata_analyzer import serialization
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    # Runs identical concurrent calls only once
+    # Callers with the same key as a running call wait for it and share its result or its error,
+    # so duplicate triggers don't load the data and send the alerts twice
+    # The shared results must not be modified
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.executed = 0
+        self.shared = 0
+
+    @staticmethod
+    def key(name, parameters):
+        # Parameters are normalized, so the order of the keys doesn't matter
+        return (name, serialization.dumps(parameters, sort_keys=True))
+
+    def do(self, name, parameters, run):
+        key = self.key(name, parameters)
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.calls[key] = call
+                self.executed += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = run()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.done.set()
+
+    def status(self):
+        with self.lock:
+            return {
+                "executed": self.executed,
+                "shared": self.shared,
+                "inFlight": len(self.calls),
+            }
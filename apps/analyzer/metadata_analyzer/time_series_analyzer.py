@@ -1,31 +1,36 @@
-import pandas as pd
-from darts import TimeSeries
 from sqlalchemy import create_engine
 from metadata_analyzer.database import Database
 from flask import jsonify
 import numpy as np
-from darts.ad import KMeansScorer
-from darts.ad.detectors import QuantileDetector
 import os
+import threading
+from collections import namedtuple
 
+# Settings of the k-means analysis, replaced as a whole by the setters,
+# so every analysis works on a consistent snapshot
+# A training_series_end of -1 means the training series is calculated for every analysis
+TimeSeriesConfig = namedtuple(
+    "TimeSeriesConfig",
+    ["threshold", "clusters", "training_series_start", "training_series_end"],
+)
 
-class Time_series_analyzer:
-    df = ""
-    threshold = ""
-    training_series_start = 0
-    training_series_end = 0
-    clusters = 0
-    temp_df = []
 
+class Time_series_analyzer:
     def __init__(self, parameters):
-        Time_series_analyzer.threshold = float(parameters[0])
-        Time_series_analyzer.training_series_start = 0
-        Time_series_analyzer.training_series_end = -1
-        Time_series_analyzer.clusters = int(parameters[1])
+        self.lock = threading.Lock()
+        self.config = TimeSeriesConfig(
+            threshold=float(parameters[0]),
+            clusters=int(parameters[1]),
+            training_series_start=0,
+            training_series_end=-1,
+        )
+        # Preprocessed results, shared read-only by all analyses
+        self.df = None
+        # Series of the latest analysis, used to calculate the training series on request
+        self.temp_df = None
 
-    def preload_data(self, data):
-        # read table into a dataframe
-        df = pd.DataFrame([res.as_dict() for res in data])
+    def preload_data(self, df):
+        # df contains the results table as loaded by Database.get_results_frame
 
         # --------------- General Preprocessing ---------------
         # removes null values in sbc_start, task_uuid and is_backup
@@ -42,28 +47,36 @@ class Time_series_analyzer:
         # sorts dataframe by sbc_start
         df = df.sort_values("sbc_start")
 
-        Time_series_analyzer.df = df
+        self.df = df
+
+    def _update_config(self, **changes):
+        with self.lock:
+            self.config = self.config._replace(**changes)
 
     def set_threshold(self, new_threshold):
-        Time_series_analyzer.threshold = new_threshold
+        self._update_config(threshold=new_threshold)
         return True
 
     def set_clusters(self, new_clusters):
-        Time_series_analyzer.clusters = new_clusters
+        self._update_config(clusters=new_clusters)
         return True
 
     def set_training_start(self, start):
-        Time_series_analyzer.training_series_start = start
+        self._update_config(training_series_start=start)
         return True
 
     def set_training_end(self, end):
-        Time_series_analyzer.training_series_end = end
+        self._update_config(training_series_end=end)
         return True
 
     def k_means_analyze(self, variable, task_id, frequency, backup_type, window_size):
-        working_df = Time_series_analyzer.task_preprocessing(
-            backup_type, task_id, variable
-        )
+        # darts pulls in torch, so it is only imported once an analysis needs it
+        from darts import TimeSeries
+        from darts.ad import KMeansScorer
+        from darts.ad.detectors import QuantileDetector
+
+        config = self.config
+        working_df = self.task_preprocessing(backup_type, task_id, variable)
 
         working_df.index = working_df[
             "sbc_start"
@@ -85,32 +98,34 @@ class Time_series_analyzer:
         if len(series) == 0:
             raise ValueError("Series had length 0 after applying specified parameters!")
 
-        Time_series_analyzer.temp_df = working_df
+        self.temp_df = working_df
 
         # if no indices were manually set to override, some are generated that could be useful
-        if Time_series_analyzer.training_series_end == -1:
-            self.calc_training_indices()
+        training_series_start = config.training_series_start
+        training_series_end = config.training_series_end
+        if training_series_end == -1:
+            training_series_start, training_series_end = self.training_indices(
+                working_df
+            )
 
         # trains series
-        series_train = series[
-            Time_series_analyzer.training_series_start : Time_series_analyzer.training_series_end
-        ]
+        series_train = series[training_series_start:training_series_end]
 
         # determines number of clusters for the k means scorer,
         # use clusters for more useful k value
         maxClusters = len(series_train)
 
-        if Time_series_analyzer.clusters > maxClusters:
+        if config.clusters > maxClusters:
             raise ValueError(
                 "Series had "
                 + str(maxClusters)
                 + " different samples, less than the number of clusters "
-                + str(Time_series_analyzer.clusters)
+                + str(config.clusters)
             )
 
         # using basic k-means scorer (moving window comparison)
         Kmeans_scorer = KMeansScorer(
-            k=Time_series_analyzer.clusters,
+            k=config.clusters,
             window=int(window_size),
             component_wise=False,
         )
@@ -118,7 +133,7 @@ class Time_series_analyzer:
         anomaly_score = Kmeans_scorer.score(series)
 
         # detects where anomalies lie, then return binary prediction
-        detector = QuantileDetector(high_quantile=Time_series_analyzer.threshold)
+        detector = QuantileDetector(high_quantile=config.threshold)
         anomaly_pred = detector.fit_detect(series=anomaly_score)
 
         # TODO decide on interface to backend and return useful values in useful format
@@ -132,7 +147,15 @@ class Time_series_analyzer:
         return anomaly_timestamps
 
     def calc_training_indices(self):
-        training_df = Time_series_analyzer.temp_df
+        # Sets the training series to the one calculated for the latest analysis
+        if self.temp_df is None:
+            raise NameError("No series was analyzed yet")
+        start, end = self.training_indices(self.temp_df)
+        self._update_config(training_series_start=start, training_series_end=end)
+
+    @staticmethod
+    def training_indices(working_df):
+        training_df = working_df.copy()
         if "index" in training_df.columns:
             training_df = training_df.drop("index", axis=1)
         training_df.insert(0, "index", range(0, len(training_df)))
@@ -154,10 +177,9 @@ class Time_series_analyzer:
         grp = max(grouped, key=lambda x: x[1].shape)
         grp = grp[1]  # gets series out of tuple
 
-        Time_series_analyzer.training_series_start = int(grp.iloc[0]["index"])
-        Time_series_analyzer.training_series_end = int(grp.iloc[len(grp) - 1]["index"])
+        return int(grp.iloc[0]["index"]), int(grp.iloc[len(grp) - 1]["index"])
 
-    def task_preprocessing(backup_type, task_id, variable):
+    def task_preprocessing(self, backup_type, task_id, variable):
         # --------------- Task Specific Preprocessing ---------------#
         # TODO remove when other types are implemented
         if backup_type != "F":
@@ -165,7 +187,7 @@ class Time_series_analyzer:
                 "k means analysis for this backup type is not yet implemented"
             )
 
-        working_df = Time_series_analyzer.df
+        working_df = self.df
         # removes backups of types that are not specified
         working_df = working_df[working_df.fdi_type == backup_type]
         # removes backups that do not have chosen task id
@@ -177,13 +199,11 @@ class Time_series_analyzer:
 
     def get_task_ids(self):
         # gets all possible values for task_uuid
-        task_ids = Time_series_analyzer.df["task_uuid"].unique()
+        task_ids = self.df["task_uuid"].unique()
         return dict(enumerate(task_ids.flatten(), 1))
 
     def get_frequencies(self, task_id, backup_type, variable):
-        working_df = Time_series_analyzer.task_preprocessing(
-            backup_type, task_id, variable
-        )
+        working_df = self.task_preprocessing(backup_type, task_id, variable)
         freqs = working_df[["sbc_start"]]
 
         # gets backup frequencies present in dataset
@@ -1,3 +1,11 @@
+from metadata_analyzer import serialization
+
+
+def _received(payload):
+    # The payload as the backend receives it after encoding
+    return serialization.loads(serialization.dumps(payload))
+
+
 class MockBackend:
     def __init__(self):
         self.backups = []
@@ -11,28 +19,34 @@ class MockBackend:
         self.latest_alert_ids = {}
 
     def send_backup_data_batched(self, batch):
-        self.backups += batch
+        self.backups += _received(batch)
 
     def send_task_data_batched(self, batch):
-        self.tasks += batch
+        self.tasks += _received(batch)
 
     def send_storage_data(self, storage):
-        self.storages += [storage]
+        self.storages += [_received(storage)]
 
     def create_creation_date_alerts_batched(self, alerts):
-        self.creation_date_alerts += alerts
+        self.creation_date_alerts += _received(alerts)
 
     def create_size_alerts_batched(self, alerts):
-        self.size_alerts += alerts
+        self.size_alerts += _received(alerts)
 
     def create_storage_fill_alerts(self, alerts):
-        self.storage_fill_alerts += alerts
+        self.storage_fill_alerts += _received(alerts)
 
     def create_missing_backup_alert(self, alert):
-        self.missing_backup_alerts.append(alert)
+        self.missing_backup_alerts.append(_received(alert))
 
     def create_additional_backup_alert(self, alert):
-        self.additional_backup_alerts.append(alert)
+        self.additional_backup_alerts.append(_received(alert))
+
+    def create_missing_backup_alerts_batched(self, alerts):
+        self.missing_backup_alerts += _received(alerts)
+
+    def create_additional_backup_alerts_batched(self, alerts):
+        self.additional_backup_alerts += _received(alerts)
 
     def set_latest_alert_id(self, alert_type, backup_type, uuid):
         self.latest_alert_ids[(alert_type, backup_type)] = uuid
@@ -43,6 +57,9 @@ class MockBackend:
         else:
             return ""
 
+    def get_latest_alert_ids(self, queries):
+        return [self.get_latest_alert_id(*query) for query in queries]
+
     def get_latest_backup_date(self):
         if len(self.backups) == 0:
             return None
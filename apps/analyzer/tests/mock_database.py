@@ -1,3 +1,6 @@
+import pandas as pd
+
+
 class MockDatabase:
     def __init__(self, results, tasks=[], data_stores=[], schedules=[], task_events=[]):
         self.results = results
@@ -9,6 +12,28 @@ class MockDatabase:
     def get_results(self, latest_backup_date=None):
         return iter(self.results)
 
+    def probe_results(self):
+        start_times = [
+            result.start_time
+            for result in self.results
+            if result.start_time is not None
+        ]
+        return max(start_times, default=None), len(self.results)
+
+    def get_result_columns(self, columns, fdi_types=None, backups_only=False):
+        return iter(self.results)
+
+    def get_results_frame(self, columns=None, since=None):
+        df = pd.DataFrame([result.as_dict() for result in self.results])
+        if since is not None:
+            df = df[df["start_time"] >= since]
+        if columns is not None:
+            df = df[list(columns)]
+        return df
+
+    def stream_results(self, latest_backup_date=None, cursor=None, chunk_size=None):
+        return iter(self.results)
+
     def get_tasks(self):
         return iter(self.tasks)
 
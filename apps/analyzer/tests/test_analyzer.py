@@ -1,7 +1,14 @@
+import time
 from datetime import datetime
 
+import pytest
+
 from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.batch_dispatcher import AdaptiveBatchSizer, BatchDispatchError
+from metadata_analyzer.database import decode_results_cursor
+from metadata_analyzer.fingerprints import FingerprintStore
 from metadata_analyzer.models import Result, Tasks, DataStore
+from metadata_analyzer.outbox import Outbox
 from tests.mock_backend import MockBackend
 from tests.mock_database import MockDatabase
 
@@ -56,6 +63,9 @@ class MockSimpleRuleBasedAnalyzer:
     ):
         pass
 
+    def annotate_scheduled_times(self, data, schedules, start_date):
+        return data
+
 
 def test_update_data_all_types():
     mock_result1 = _create_mock_result(
@@ -193,3 +203,463 @@ def test_update_data_no_subtasks():
     Analyzer.update_data()
 
     assert backend.backups == []
+
+
+def test_update_data_skips_unchanged_entities():
+    mock_task1 = _create_mock_task("1", "task1")
+    mock_task2 = _create_mock_task("2", "task2")
+    mock_storage1 = _create_mock_storage("1", "store1", 100, 80, 50, 50)
+    mock_storage2 = _create_mock_storage("2", "store2", 100, 80, 50, 50)
+
+    database = MockDatabase(
+        [], [mock_task1, mock_task2], [mock_storage1, mock_storage2]
+    )
+    backend = MockBackend()
+    Analyzer.__init__(
+        database,
+        backend,
+        MockSimpleRuleBasedAnalyzer(),
+        None,
+        None,
+        None,
+        fingerprints=FingerprintStore(),
+    )
+    Analyzer.update_data()
+    assert len(backend.tasks) == 2
+    assert len(backend.storages) == 2
+
+    mock_task2.task = "renamed"
+    mock_storage1.filled = 60
+    result = Analyzer.update_data()
+
+    assert result["skippedTasks"] == 1
+    assert result["skippedStorage"] == 1
+    assert backend.tasks[2:] == [{"id": "2", "displayName": "renamed"}]
+    assert [storage["id"] for storage in backend.storages[2:]] == ["1"]
+
+
+def test_update_data_resends_after_failure():
+    mock_task = _create_mock_task("1", "task1")
+
+    class FailingMockBackend(MockBackend):
+        failing = True
+
+        def send_task_data_batched(self, batch):
+            if self.failing:
+                raise ConnectionError("backend is down")
+            super().send_task_data_batched(batch)
+
+    database = MockDatabase([], [mock_task])
+    backend = FailingMockBackend()
+    Analyzer.__init__(
+        database,
+        backend,
+        MockSimpleRuleBasedAnalyzer(),
+        None,
+        None,
+        None,
+        fingerprints=FingerprintStore(),
+    )
+    with pytest.raises(BatchDispatchError):
+        Analyzer.update_data()
+
+    backend.failing = False
+    assert Analyzer.update_data()["skippedTasks"] == 0
+    assert backend.tasks == [{"id": "1", "displayName": "task1"}]
+
+
+def test_update_data_sends_backups_after_tasks():
+    mock_result = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_task = _create_mock_task("1", "task1")
+
+    class OrderMockBackend(MockBackend):
+        def __init__(self):
+            super().__init__()
+            self.calls = []
+
+        def send_task_data_batched(self, batch):
+            # Give the backups a chance to overtake the tasks
+            time.sleep(0.05)
+            self.calls.append("tasks")
+            super().send_task_data_batched(batch)
+
+        def send_backup_data_batched(self, batch):
+            self.calls.append("backups")
+            super().send_backup_data_batched(batch)
+
+    database = MockDatabase([mock_result], [mock_task])
+    backend = OrderMockBackend()
+    Analyzer.__init__(
+        database, backend, MockSimpleRuleBasedAnalyzer(), None, None, None
+    )
+
+    assert Analyzer.update_data() == {
+        "storage": 0,
+        "tasks": 1,
+        "backups": 1,
+        "skippedStorage": 0,
+        "skippedTasks": 0,
+    }
+    assert backend.calls == ["tasks", "backups"]
+
+
+def test_update_data_no_backups_if_tasks_fail():
+    mock_result = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_task = _create_mock_task("1", "task1")
+
+    class FailingMockBackend(MockBackend):
+        def send_task_data_batched(self, batch):
+            raise ConnectionError("backend is down")
+
+    database = MockDatabase([mock_result], [mock_task])
+    backend = FailingMockBackend()
+    Analyzer.__init__(
+        database, backend, MockSimpleRuleBasedAnalyzer(), None, None, None
+    )
+
+    with pytest.raises(BatchDispatchError):
+        Analyzer.update_data()
+    assert backend.backups == []
+
+
+def test_update_data_replays_outbox_after_failure(tmp_path):
+    mock_result1 = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "saveset2", "F", 100_000_000, datetime.fromisoformat("2000-01-02")
+    )
+
+    class FailingMockBackend(MockBackend):
+        failing = True
+
+        def send_backup_data_batched(self, batch):
+            if self.failing:
+                raise ConnectionError("backend is down")
+            super().send_backup_data_batched(batch)
+
+        def get_latest_backup_date(self):
+            if len(self.backups) == 0:
+                return None
+            return {"creationDate": self.backups[-1]["creationDate"] + ".000Z"}
+
+    database = MockDatabase([mock_result1, mock_result2])
+    backend = FailingMockBackend()
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    Analyzer.__init__(
+        database,
+        backend,
+        MockSimpleRuleBasedAnalyzer(),
+        None,
+        None,
+        None,
+        outbox=outbox,
+    )
+    with pytest.raises(BatchDispatchError):
+        Analyzer.update_data()
+    assert backend.backups == []
+    assert len(outbox) == 1
+
+    # The next run sends the stored batch before reading new results
+    backend.failing = False
+    database.results = []
+    Analyzer.update_data()
+    assert [backup["id"] for backup in backend.backups] == ["1", "2"]
+    assert len(outbox) == 0
+
+
+def test_update_data_resumes_after_cursor():
+    mock_result1 = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "saveset2", "F", 100_000_000, datetime.fromisoformat("2000-01-02")
+    )
+
+    class PagingMockDatabase(MockDatabase):
+        def stream_results(self, latest_backup_date=None, cursor=None, chunk_size=None):
+            self.cursor = cursor
+            return iter(self.results)
+
+    class LatestDateMockBackend(MockBackend):
+        def get_latest_backup_date(self):
+            return {"creationDate": "2000-01-02T00:00:00.000Z"}
+
+    database = PagingMockDatabase([mock_result1, mock_result2])
+    backend = LatestDateMockBackend()
+    Analyzer.__init__(
+        database, backend, MockSimpleRuleBasedAnalyzer(), None, None, None
+    )
+    Analyzer.update_data()
+    assert database.cursor is None
+
+    database.results = []
+    Analyzer.update_data()
+    assert decode_results_cursor(database.cursor) == (
+        mock_result2.start_time,
+        mock_result2.saveset,
+    )
+
+
+def test_update_data_resends_lost_backups_without_outbox(monkeypatch):
+    mock_results = [
+        _create_mock_result(
+            "foo",
+            str(i),
+            f"saveset{i}",
+            "F",
+            100_000_000,
+            datetime.fromisoformat(f"2000-01-0{i}"),
+        )
+        for i in range(1, 4)
+    ]
+
+    class PagingMockDatabase(MockDatabase):
+        def stream_results(self, latest_backup_date=None, cursor=None, chunk_size=None):
+            self.latest_backup_date = latest_backup_date
+            self.cursor = cursor
+            return iter(self.results)
+
+    class FailingMockBackend(MockBackend):
+        failing = True
+
+        def send_backup_data_batched(self, batch):
+            if self.failing and batch[0]["id"] == "2":
+                raise ConnectionError("backend is down")
+            super().send_backup_data_batched(batch)
+
+        def get_latest_backup_date(self):
+            if len(self.backups) == 0:
+                return None
+            return {"creationDate": self.backups[-1]["creationDate"] + ".000Z"}
+
+    # Every backup is sent in its own batch
+    monkeypatch.setitem(
+        AdaptiveBatchSizer._shared, "backups", AdaptiveBatchSizer(max_items=1)
+    )
+    database = PagingMockDatabase(mock_results)
+    backend = FailingMockBackend()
+    Analyzer.__init__(
+        database, backend, MockSimpleRuleBasedAnalyzer(), None, None, None
+    )
+    with pytest.raises(BatchDispatchError):
+        Analyzer.update_data()
+    assert "2" not in [backup["id"] for backup in backend.backups]
+
+    # The next run starts at the lost batch, even if a later batch was accepted
+    backend.failing = False
+    Analyzer.update_data()
+    assert database.latest_backup_date is None
+    assert decode_results_cursor(database.cursor) == (
+        mock_results[0].start_time,
+        mock_results[0].saveset,
+    )
+    assert "2" in [backup["id"] for backup in backend.backups]
+
+    # Afterwards it continues after the last read result again
+    Analyzer.update_data()
+    assert decode_results_cursor(database.cursor) == (
+        mock_results[2].start_time,
+        mock_results[2].saveset,
+    )
+
+
+def test_analyses_share_loaded_results():
+    mock_result = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+
+    class CountingMockDatabase(MockDatabase):
+        loads = 0
+
+        def get_result_columns(self, columns, fdi_types=None, backups_only=False):
+            self.loads += 1
+            return super().get_result_columns(columns, fdi_types, backups_only)
+
+    class ColumnsMockSimpleRuleBasedAnalyzer(MockSimpleRuleBasedAnalyzer):
+        result_columns = ("uuid", "start_time")
+
+        def analyze(self, data, alert_limit, start_date):
+            return {"count": len(data)}
+
+    database = CountingMockDatabase([mock_result])
+    Analyzer.__init__(
+        database,
+        MockBackend(),
+        ColumnsMockSimpleRuleBasedAnalyzer(),
+        None,
+        None,
+        None,
+    )
+
+    Analyzer.simple_rule_based_analysis(-1)
+    Analyzer.simple_rule_based_analysis(-1)
+    assert database.loads == 1
+
+    # New results are loaded
+    database.results = database.results + [
+        _create_mock_result(
+            "foo",
+            "2",
+            "saveset2",
+            "F",
+            100_000_000,
+            datetime.fromisoformat("2000-01-02"),
+        )
+    ]
+    assert Analyzer.simple_rule_based_analysis(-1) == {"count": 2}
+    assert database.loads == 2
+    assert Analyzer.results_cache.status() == {
+        "hits": 1,
+        "misses": 2,
+        "entries": 1,
+    }
+
+
+def test_endpoints_share_loaded_results():
+    mock_result1 = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "saveset2", "I", 100_000_000, datetime.fromisoformat("2000-01-02")
+    )
+    mock_result3 = _create_mock_result(
+        "foo",
+        "3",
+        "saveset3",
+        "F",
+        100_000_000,
+        datetime.fromisoformat("2000-01-03"),
+        is_backup=0,
+    )
+
+    class CountingMockDatabase(MockDatabase):
+        loads = 0
+
+        def get_result_columns(self, columns, fdi_types=None, backups_only=False):
+            self.loads += 1
+            return super().get_result_columns(columns, fdi_types, backups_only)
+
+    class ColumnsMockSimpleRuleBasedAnalyzer(MockSimpleRuleBasedAnalyzer):
+        result_columns = ("uuid", "fdi_type", "start_time")
+
+        def analyze_inc(self, data, alert_limit, start_date):
+            return {"count": len(data)}
+
+    class ColumnsMockScheduleBasedAnalyzer:
+        result_columns = ("uuid", "is_backup", "schedule", "start_time")
+
+        def analyze(
+            self, results, schedules, task_events, alert_limit, start_date, stop_date
+        ):
+            return {"count": len(results)}
+
+    database = CountingMockDatabase([mock_result1, mock_result2, mock_result3])
+    Analyzer.__init__(
+        database,
+        MockBackend(),
+        ColumnsMockSimpleRuleBasedAnalyzer(),
+        None,
+        ColumnsMockScheduleBasedAnalyzer(),
+        None,
+    )
+
+    # Each endpoint selects its backup types from the same cached results
+    assert Analyzer.simple_rule_based_analysis_inc(-1) == {"count": 1}
+    assert Analyzer.schedule_based_analysis(-1, None) == {"count": 2}
+    assert database.loads == 1
+
+
+def test_time_series_data_is_not_cached():
+    class MockTimeSeriesAnalyzer:
+        def preload_data(self, df):
+            self.df = df
+
+    mock_result = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    time_series_analyzer = MockTimeSeriesAnalyzer()
+    Analyzer.__init__(
+        MockDatabase([mock_result]),
+        MockBackend(),
+        None,
+        time_series_analyzer,
+        None,
+        None,
+    )
+
+    Analyzer.load_time_series_data()
+
+    assert len(time_series_analyzer.df) == 1
+    assert Analyzer.results_cache.status()["entries"] == 0
+
+
+def test_run_all_analyses(monkeypatch):
+    mock_result1 = _create_mock_result(
+        "foo", "1", "saveset1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "saveset2", "I", 100_000_000, datetime.fromisoformat("2000-01-02")
+    )
+
+    class CountingMockDatabase(MockDatabase):
+        loads = 0
+
+        def get_result_columns(self, columns, fdi_types=None, backups_only=False):
+            self.loads += 1
+            return super().get_result_columns(columns, fdi_types, backups_only)
+
+    class CountingMockSimpleRuleBasedAnalyzer(MockSimpleRuleBasedAnalyzer):
+        result_columns = ("uuid", "fdi_type", "start_time")
+
+        def analyze(self, data, alert_limit, start_date):
+            return {"count": len(data)}
+
+        def analyze_diff(self, data, alert_limit, start_date):
+            return {"count": len(data)}
+
+        def analyze_inc(self, data, alert_limit, start_date):
+            return {"count": len(data)}
+
+        def analyze_storage_capacity(self, data, alert_limit):
+            raise ValueError("storage failed")
+
+    class CountingMockScheduleBasedAnalyzer:
+        result_columns = ("uuid", "is_backup", "start_time")
+
+        def analyze(
+            self, results, schedules, task_events, alert_limit, start_date, stop_date
+        ):
+            return {"count": len(results)}
+
+    database = CountingMockDatabase([mock_result1, mock_result2])
+    Analyzer.__init__(
+        database,
+        MockBackend(),
+        CountingMockSimpleRuleBasedAnalyzer(),
+        None,
+        CountingMockScheduleBasedAnalyzer(),
+        None,
+    )
+
+    replays = []
+    monkeypatch.setattr(Analyzer, "replay_outbox", lambda: replays.append(1))
+
+    report = Analyzer.run_all_analyses(-1, None)
+
+    # The results are loaded and the outbox is replayed once for all analyses
+    assert database.loads == 1
+    assert len(replays) == 1
+    analyses = report["analyses"]
+    assert analyses["sizeFullBackups"]["count"] == 1
+    assert analyses["sizeDiffBackups"]["count"] == 1
+    assert analyses["sizeIncBackups"]["count"] == 1
+    assert analyses["creationDate"]["count"] == 2
+    # A failing analysis doesn't stop the others
+    assert analyses["storageCapacity"]["error"] == "storage failed"
+    assert all(analysis["duration"] >= 0 for analysis in analyses.values())
+    assert report["duration"] >= 0
@@ -0,0 +1,147 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+from metadata_analyzer.backend import Backend
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections alive between requests
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+            self.server.compressed.append(self.path)
+        self.server.requests.append((self.path, json.loads(body)))
+        self.server.client_ports.add(self.client_address[1])
+        status = self.server.statuses.pop(0) if self.server.statuses else 201
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        # Answers with the requested path, e.g. the alert type and backup type
+        body = self.path.encode()
+        self.server.requests.append((self.path, None))
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("localhost", 0), _Handler)
+    server.requests = []
+    server.client_ports = set()
+    server.statuses = []
+    server.compressed = []
+    thread = threading.Thread(
+        target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True
+    )
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _create_backend(server):
+    return Backend(f"http://localhost:{server.server_address[1]}/api/")
+
+
+def test_connection_is_reused(server):
+    backend = _create_backend(server)
+
+    backend.send_backup_data_batched([{"id": "1"}])
+    backend.send_task_data_batched([{"id": "2"}])
+
+    assert [path for path, _ in server.requests] == [
+        "/api/backupData/batched",
+        "/api/tasks/batched",
+    ]
+    assert len(server.client_ports) == 1
+
+
+def test_server_errors_are_retried(server, monkeypatch):
+    monkeypatch.setenv("BACKEND_BACKOFF_FACTOR", "0")
+    server.statuses = [503, 502]
+    backend = _create_backend(server)
+
+    backend.create_size_alerts_batched([{"backupId": "1"}])
+
+    assert len(server.requests) == 3
+
+
+def test_error_after_last_retry(server, monkeypatch):
+    monkeypatch.setenv("BACKEND_BACKOFF_FACTOR", "0")
+    monkeypatch.setenv("BACKEND_RETRIES", "1")
+    server.statuses = [500, 500]
+    backend = _create_backend(server)
+
+    with pytest.raises(requests.HTTPError):
+        backend.send_storage_data({"id": "1"})
+    assert len(server.requests) == 2
+
+
+def test_client_errors_are_not_retried(server):
+    server.statuses = [400]
+    backend = _create_backend(server)
+
+    with pytest.raises(requests.HTTPError):
+        backend.send_storage_data({"id": "1"})
+    assert len(server.requests) == 1
+
+
+def test_batched_alerts_are_posted_as_given(server, monkeypatch):
+    # The callers split the alerts into batches, the backend doesn't split them again
+    monkeypatch.setenv("BACKEND_BATCH_SIZE", "2")
+    backend = _create_backend(server)
+    alerts = [{"referenceDate": f"2000-01-0{i}T12:00:00"} for i in range(1, 6)]
+
+    backend.create_missing_backup_alerts_batched(alerts)
+
+    assert server.requests == [("/api/alerting/missingBackup/batched", alerts)]
+
+
+def test_large_bodies_are_compressed(server, monkeypatch):
+    monkeypatch.setenv("BACKEND_GZIP_THRESHOLD", "100")
+    backend = _create_backend(server)
+    small = [{"id": "1"}]
+    large = [{"id": str(i), "saveset": "saveset" * 10} for i in range(10)]
+
+    backend.send_backup_data_batched(small)
+    backend.send_backup_data_batched(large)
+
+    assert [body for _, body in server.requests] == [small, large]
+    assert server.compressed == ["/api/backupData/batched"]
+
+
+def test_compression_can_be_disabled(server, monkeypatch):
+    monkeypatch.setenv("BACKEND_GZIP_THRESHOLD", "-1")
+    backend = _create_backend(server)
+
+    backend.send_backup_data_batched([{"saveset": "saveset" * 1000}])
+
+    assert len(server.requests) == 1
+    assert server.compressed == []
+
+
+def test_latest_alert_ids_are_fetched_together(server):
+    backend = _create_backend(server)
+
+    assert backend.get_latest_alert_ids(
+        [("CREATION_DATE_ALERT", None), ("SIZE_ALERT", "FULL")]
+    ) == [
+        "/api/alerting/type/CREATION_DATE_ALERT/latest",
+        "/api/alerting/type/SIZE_ALERT/latest?backupType=FULL",
+    ]
+    assert len(server.requests) == 2
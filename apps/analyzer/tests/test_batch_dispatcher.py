@@ -0,0 +1,259 @@
+import threading
+import time
+
+import pytest
+
+from metadata_analyzer import serialization
+from metadata_analyzer.batch_dispatcher import (
+    AdaptiveBatchSizer,
+    BatchDispatcher,
+    BatchDispatchError,
+)
+from metadata_analyzer.outbox import Outbox
+
+
+def test_sends_all_batches():
+    sent = []
+    with BatchDispatcher(sent.append, max_in_flight=4) as dispatcher:
+        for i in range(10):
+            dispatcher.submit([i])
+
+    assert sorted(sent) == [[i] for i in range(10)]
+
+
+def test_bounds_requests_in_flight():
+    lock = threading.Lock()
+    in_flight = 0
+    max_seen = 0
+
+    def send(batch):
+        nonlocal in_flight, max_seen
+        with lock:
+            in_flight += 1
+            max_seen = max(max_seen, in_flight)
+        time.sleep(0.01)
+        with lock:
+            in_flight -= 1
+
+    with BatchDispatcher(send, max_in_flight=3) as dispatcher:
+        for i in range(12):
+            dispatcher.submit([i])
+
+    assert max_seen == 3
+
+
+def test_sends_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    # Only returns if two batches are sent at the same time
+    def send(batch):
+        barrier.wait()
+
+    with BatchDispatcher(send, max_in_flight=2) as dispatcher:
+        dispatcher.submit([1])
+        dispatcher.submit([2])
+
+
+def test_aggregates_errors():
+    sent = []
+
+    def send(batch):
+        if batch[0] % 2 == 1:
+            raise ValueError(f"failed {batch[0]}")
+        sent.append(batch)
+
+    with pytest.raises(BatchDispatchError) as e:
+        with BatchDispatcher(send, max_in_flight=2) as dispatcher:
+            for i in range(6):
+                dispatcher.submit([i])
+
+    assert sorted(sent) == [[0], [2], [4]]
+    assert [index for index, _ in e.value.errors] == [1, 3, 5]
+    assert e.value.skipped == 0
+
+
+def test_ordered_stops_after_failure():
+    sent = []
+
+    def send(batch):
+        if batch[0] == 1:
+            raise ValueError("failed")
+        sent.append(batch)
+
+    with pytest.raises(BatchDispatchError) as e:
+        with BatchDispatcher(send, max_in_flight=1, ordered=True) as dispatcher:
+            for i in range(5):
+                dispatcher.submit([i])
+                # Let the batch finish, so the failure is known before the next submit
+                time.sleep(0.01)
+
+    assert sent == [[0]]
+    assert len(e.value.errors) == 1
+    assert e.value.skipped == 3
+
+
+def test_ordered_does_not_send_after_failure_while_waiting():
+    sent = []
+
+    def send(batch):
+        if batch[0] == 0:
+            time.sleep(0.05)
+            raise ValueError("failed")
+        sent.append(batch)
+
+    # The second batch waits for the first one, which fails meanwhile
+    with pytest.raises(BatchDispatchError) as e:
+        with BatchDispatcher(send, max_in_flight=1, ordered=True) as dispatcher:
+            dispatcher.submit([0])
+            dispatcher.submit([1])
+
+    assert sent == []
+    assert e.value.skipped == 1
+
+
+def test_ordered_sends_concurrently():
+    barrier = threading.Barrier(2, timeout=5)
+
+    # Only returns if two batches are sent at the same time
+    def send(batch):
+        barrier.wait()
+
+    with BatchDispatcher(send, max_in_flight=2, ordered=True) as dispatcher:
+        dispatcher.submit([1])
+        dispatcher.submit([2])
+
+
+def test_ordered_resumes_at_first_unsent_batch():
+    sent = []
+
+    def send(batch):
+        if batch[0] == 2:
+            raise ValueError("failed")
+        time.sleep(0.05)
+        sent.append(batch)
+
+    with pytest.raises(BatchDispatchError) as e:
+        with BatchDispatcher(
+            send, max_in_flight=4, ordered=True, sizer=_create_sizer(max_items=1)
+        ) as dispatcher:
+            for i in range(8):
+                dispatcher.add(i, f"position {i}")
+                if i == 3:
+                    # Let the failure be known before the next batch is submitted
+                    while not dispatcher.failed():
+                        time.sleep(0.001)
+
+    # The batches in flight with the failed one are still sent, later ones are not started
+    assert [0] in sent and [1] in sent
+    assert all(batch[0] < 4 for batch in sent)
+    assert [index for index, _ in e.value.errors] == [2]
+    assert e.value.skipped == 7 - len(sent)
+    assert e.value.resume == "position 2"
+
+
+def test_unsent_batches_are_released_for_replay(tmp_path):
+    def send_backup_data_batched(batch):
+        if batch[0] == 0:
+            raise ValueError("failed")
+
+    outbox = Outbox(str(tmp_path / "outbox.db"), lease=60)
+    with pytest.raises(BatchDispatchError):
+        with BatchDispatcher(
+            send_backup_data_batched, ordered=True, outbox=outbox
+        ) as dispatcher:
+            for i in range(3):
+                dispatcher.submit([i])
+
+    sent = []
+
+    class Backend:
+        def send_backup_data_batched(self, batch):
+            sent.append(batch)
+
+    # The failed and the skipped batches are replayed in order
+    assert outbox.replay(Backend()) == 3
+    assert sent == [[0], [1], [2]]
+
+
+def test_exception_in_block_is_not_replaced():
+    def send(batch):
+        raise ValueError("failed")
+
+    with pytest.raises(KeyError):
+        with BatchDispatcher(send, max_in_flight=1) as dispatcher:
+            dispatcher.submit([1])
+            raise KeyError("other")
+
+
+def _create_sizer(**kwargs):
+    return AdaptiveBatchSizer(
+        **{
+            "target_bytes": 100,
+            "min_bytes": 50,
+            "max_bytes": 200,
+            "max_items": 1000,
+            "target_latency": 1.0,
+            **kwargs,
+        }
+    )
+
+
+def test_add_batches_by_size():
+    sent = []
+    # Every item takes 13 bytes in the array: {"id":"xxx"},
+    items = [{"id": f"{i:03}"} for i in range(15)]
+
+    # Fixed target size, the fast sends would grow it otherwise
+    sizer = _create_sizer(min_bytes=100, max_bytes=100)
+    with BatchDispatcher(sent.append, max_in_flight=1, sizer=sizer) as dispatcher:
+        for item in items:
+            dispatcher.add(item)
+
+    assert sent == [items[0:7], items[7:14], items[14:15]]
+    assert all(len(serialization.dumps(batch)) <= 100 for batch in sent)
+
+
+def test_add_batches_by_count():
+    sent = []
+
+    with BatchDispatcher(
+        sent.append, max_in_flight=1, sizer=_create_sizer(max_items=2)
+    ) as dispatcher:
+        for i in range(5):
+            dispatcher.add(i)
+
+    assert sent == [[0, 1], [2, 3], [4]]
+
+
+def test_oversized_item_is_sent_alone():
+    sent = []
+
+    sizer = _create_sizer(min_bytes=100, max_bytes=100)
+    with BatchDispatcher(sent.append, max_in_flight=1, sizer=sizer) as dispatcher:
+        dispatcher.add("a")
+        dispatcher.add("b" * 500)
+        dispatcher.add("c")
+
+    assert sent == [["a"], ["b" * 500], ["c"]]
+
+
+def test_sizer_adapts_to_latency():
+    sizer = _create_sizer()
+
+    sizer.observe(2.0)
+    assert sizer.target_bytes == 50
+    sizer.observe(2.0)
+    assert sizer.target_bytes == 50
+
+    for _ in range(10):
+        sizer.observe(0.1)
+    assert sizer.target_bytes == 200
+
+    # Latencies between half and the full target latency keep the size
+    sizer.observe(0.8)
+    assert sizer.target_bytes == 200
+
+
+def test_shared_sizer():
+    assert AdaptiveBatchSizer.shared("test") is AdaptiveBatchSizer.shared("test")
+    assert AdaptiveBatchSizer.shared("test") is not AdaptiveBatchSizer.shared("other")
@@ -0,0 +1,278 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from metadata_analyzer.database import Database
+from metadata_analyzer.models import Base, Result, Tasks
+
+
+def _create_database():
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    return Database(engine)
+
+
+def _create_result(saveset, uuid, task, fdi_type, data_size, start_time, **kwargs):
+    # The table is created from the models, so every column has to be set
+    columns = {
+        "task_uuid": "t" + task,
+        "is_backup": 1,
+        "state": 0,
+        "subtask_flag": "0",
+        "schedule": "",
+        "stop_time": start_time,
+        "sbc_start": start_time,
+        "stored_size": data_size,
+        "total_size": data_size,
+        "throughput": "",
+        "duration": 0,
+    }
+    columns.update(kwargs)
+    return Result(
+        saveset=saveset,
+        uuid=uuid,
+        task=task,
+        fdi_type=fdi_type,
+        data_size=data_size,
+        start_time=start_time,
+        **columns,
+    )
+
+
+def test_get_results_returns_detached_list():
+    database = _create_database()
+    with database.session() as session:
+        session.add(
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        )
+        session.commit()
+
+    results = database.get_results()
+
+    assert isinstance(results, list)
+    assert [result.uuid for result in results] == ["1"]
+    # Loaded attributes stay accessible after the session was closed
+    assert results[0].data_size == 100
+
+
+def test_pool_status_counts_sessions():
+    database = _create_database()
+    database.get_tasks()
+    database.get_tasks()
+
+    status = database.pool_status()
+
+    assert status["checkouts"] == 2
+    assert status["sessionsInUse"] == 0
+    assert status["maxCheckoutWait"] >= status["averageCheckoutWait"] >= 0
+
+
+def test_pool_status_while_session_open():
+    database = _create_database()
+    with database.session() as session:
+        session.add(Tasks(task="task1", uuid="1"))
+        assert database.pool_status()["sessionsInUse"] == 1
+    assert database.pool_status()["sessionsInUse"] == 0
+
+
+def test_default_engine_uses_configured_pool(monkeypatch):
+    monkeypatch.setenv("DATABASE_POOL_SIZE", "7")
+    monkeypatch.setenv("DATABASE_POOL_MAX_OVERFLOW", "3")
+    database = Database()
+
+    status = database.pool_status()
+
+    assert status["poolSize"] == 7
+    assert database.engine.pool._max_overflow == 3
+
+
+def test_get_result_columns_only_loads_given_columns():
+    database = _create_database()
+    with database.session() as session:
+        session.add(
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        )
+        session.commit()
+
+    rows = database.get_result_columns(("uuid", "data_size"))
+
+    assert [tuple(row) for row in rows] == [("1", 100)]
+    assert rows[0].uuid == "1"
+    assert not hasattr(rows[0], "task")
+
+
+def test_get_result_columns_filters_in_database():
+    database = _create_database()
+    start_time = datetime.fromisoformat("2000-01-01")
+    with database.session() as session:
+        session.add_all(
+            [
+                _create_result("s1", "1", "foo", "F", 100, start_time),
+                _create_result("s2", "2", "foo", "I", 100, start_time),
+                _create_result("s3", "3", "foo", "D", 100, start_time),
+                _create_result(
+                    "s4", "4", "foo", "F", 100, start_time, subtask_flag="1"
+                ),
+                _create_result("s5", "5", "", "F", 100, start_time),
+                _create_result("s6", "6", "foo", "F", 100, start_time, is_backup=0),
+            ]
+        )
+        session.commit()
+
+    full = database.get_result_columns(("uuid",), fdi_types=["F"])
+    full_and_diff = database.get_result_columns(("uuid",), fdi_types=["F", "D"])
+    backups = database.get_result_columns(("uuid",), backups_only=True)
+
+    assert sorted(row.uuid for row in full) == ["1", "6"]
+    assert sorted(row.uuid for row in full_and_diff) == ["1", "3", "6"]
+    assert sorted(row.uuid for row in backups) == ["1", "2", "3"]
+
+
+def test_missing_indexes_are_created():
+    database = _create_database()
+    with database.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_result_lbls_pool")
+        connection.exec_driver_sql("DROP INDEX ix_results_start_time_saveset")
+
+    missing = [index.name for index in database.missing_indexes()]
+    assert sorted(missing) == ["ix_result_lbls_pool", "ix_results_start_time_saveset"]
+
+    created = database.create_indexes()
+
+    assert sorted(created) == sorted(missing)
+    assert database.missing_indexes() == []
+
+
+def test_equivalent_index_is_accepted():
+    database = _create_database()
+    with database.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_result_lbls_pool")
+        connection.exec_driver_sql("CREATE INDEX other_pool_index ON result_lbls(pool)")
+
+    assert database.missing_indexes() == []
+
+
+def test_get_results_frame_is_typed():
+    database = _create_database()
+    with database.session() as session:
+        session.add_all(
+            [
+                _create_result(
+                    "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+                ),
+                _create_result(
+                    "s2", "2", "foo", "I", 200, datetime.fromisoformat("2000-01-02")
+                ),
+            ]
+        )
+        session.commit()
+
+    df = database.get_results_frame()
+    projected = database.get_results_frame(("saveset", "data_size"))
+
+    assert len(df) == 2
+    assert str(df["start_time"].dtype) == "datetime64[ns]"
+    assert str(df["data_size"].dtype) == "int64"
+    assert list(df.sort_values("saveset")["data_size"]) == [100, 200]
+    assert list(projected.columns) == ["saveset", "data_size"]
+
+
+def test_get_results_page_keyset_pagination():
+    database = _create_database()
+    start_time = datetime.fromisoformat("2000-01-01T12:00")
+    with database.session() as session:
+        session.add_all(
+            [
+                _create_result("s3", "3", "foo", "F", 100, start_time),
+                _create_result("s1", "1", "foo", "F", 100, start_time),
+                _create_result("s2", "2", "foo", "F", 100, start_time),
+                _create_result(
+                    "s0", "0", "foo", "F", 100, datetime.fromisoformat("2000-01-02")
+                ),
+            ]
+        )
+        session.commit()
+
+    page1, cursor1 = database.get_results_page(page_size=2)
+    page2, cursor2 = database.get_results_page(cursor=cursor1, page_size=2)
+    page3, cursor3 = database.get_results_page(cursor=cursor2, page_size=2)
+
+    assert [result.uuid for result in page1] == ["1", "2"]
+    assert [result.uuid for result in page2] == ["3", "0"]
+    assert page3 == []
+    assert cursor3 is None
+
+
+def test_stream_results_includes_latest_backup_date():
+    database = _create_database()
+    with database.session() as session:
+        session.add_all(
+            [
+                _create_result(
+                    "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+                ),
+                _create_result(
+                    "s2", "2", "foo", "F", 100, datetime.fromisoformat("2000-01-02")
+                ),
+                _create_result(
+                    "s3", "3", "foo", "F", 100, datetime.fromisoformat("2000-01-02")
+                ),
+                _create_result(
+                    "s4", "4", "foo", "F", 100, datetime.fromisoformat("2000-01-03")
+                ),
+            ]
+        )
+        session.commit()
+
+    results = database.stream_results("2000-01-02T00:00:00.000Z", chunk_size=1)
+
+    assert [result.uuid for result in results] == ["2", "3", "4"]
+    assert database.pool_status()["sessionsInUse"] == 0
+
+
+def test_stream_results_after_cursor():
+    database = _create_database()
+    start_time = datetime.fromisoformat("2000-01-01T12:00")
+    with database.session() as session:
+        session.add_all(
+            [
+                _create_result("s3", "3", "foo", "F", 100, start_time),
+                _create_result("s1", "1", "foo", "F", 100, start_time),
+                _create_result("s2", "2", "foo", "F", 100, start_time),
+                _create_result(
+                    "s0", "0", "foo", "F", 100, datetime.fromisoformat("2000-01-02")
+                ),
+            ]
+        )
+        session.commit()
+    page, cursor = database.get_results_page(page_size=1)
+
+    # Continues with the result sharing the start_time of the cursor
+    results = database.stream_results(cursor=cursor, chunk_size=2)
+
+    assert [result.uuid for result in results] == ["2", "3", "0"]
+
+
+def test_probe_results_changes_with_results():
+    database = _create_database()
+    assert database.probe_results() == (None, 0)
+
+    with database.session() as session:
+        session.add(
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        )
+        session.add(
+            _create_result(
+                "s2", "2", "foo", "F", 100, datetime.fromisoformat("2000-01-02")
+            )
+        )
+        session.commit()
+
+    assert database.probe_results() == (datetime.fromisoformat("2000-01-02"), 2)
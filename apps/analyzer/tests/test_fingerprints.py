@@ -0,0 +1,47 @@
+from metadata_analyzer.fingerprints import FingerprintStore
+
+
+def test_new_and_changed_payloads():
+    store = FingerprintStore()
+    store.record(
+        "tasks", [{"id": "1", "displayName": "a"}, {"id": "2", "displayName": "b"}]
+    )
+
+    assert store.changed(
+        "tasks",
+        [
+            {"id": "1", "displayName": "a"},
+            {"id": "2", "displayName": "changed"},
+            {"id": "3", "displayName": "new"},
+        ],
+    ) == [{"id": "2", "displayName": "changed"}, {"id": "3", "displayName": "new"}]
+
+
+def test_key_order_does_not_matter():
+    store = FingerprintStore()
+    store.record("storage", [{"id": "1", "capacity": 10, "filled": 5}])
+
+    assert store.changed("storage", [{"filled": 5, "capacity": 10, "id": "1"}]) == []
+
+
+def test_kinds_are_separate():
+    store = FingerprintStore()
+    store.record("tasks", [{"id": "1"}])
+
+    assert store.changed("storage", [{"id": "1"}]) == [{"id": "1"}]
+
+
+def test_old_fingerprints_are_ignored():
+    store = FingerprintStore(max_age=-1)
+    store.record("tasks", [{"id": "1"}])
+
+    assert store.changed("tasks", [{"id": "1"}]) == [{"id": "1"}]
+
+
+def test_fingerprints_survive_restart(tmp_path):
+    path = str(tmp_path / "fingerprints.db")
+    store = FingerprintStore(path)
+    store.record("tasks", [{"id": "1"}])
+    store.close()
+
+    assert FingerprintStore(path).changed("tasks", [{"id": "1"}]) == []
@@ -0,0 +1,145 @@
+import threading
+
+from metadata_analyzer import main
+from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.jobs import JobQueue, report_progress
+from metadata_analyzer.shared_state import SharedState
+
+
+def test_job_runs_in_background():
+    jobs = JobQueue(max_workers=1, max_age=60)
+
+    job, created = jobs.submit("analysis", {"alertLimit": -1}, lambda: {"count": 3})
+    assert created
+    assert job.done.wait(5)
+
+    assert jobs.get(job.id) is job
+    status = job.as_json()
+    assert status["status"] == "succeeded"
+    assert status["result"] == {"count": 3}
+    assert status["error"] is None
+    assert status["duration"] >= 0
+    assert status["started"] is not None and status["finished"] is not None
+    jobs.shutdown()
+
+
+def test_identical_in_flight_jobs_are_deduplicated():
+    jobs = JobQueue(max_workers=2, max_age=60)
+    release = threading.Event()
+
+    first, created = jobs.submit("analysis", {"a": 1, "b": 2}, release.wait)
+    assert created
+    second, created = jobs.submit("analysis", {"b": 2, "a": 1}, release.wait)
+    assert not created
+    assert second is first
+    other, created = jobs.submit("analysis", {"a": 2}, release.wait)
+    assert created
+    assert other is not first
+
+    release.set()
+    assert first.done.wait(5) and other.done.wait(5)
+
+    # Finished jobs are not reused
+    third, created = jobs.submit("analysis", {"a": 1, "b": 2}, lambda: None)
+    assert created
+    assert third is not first
+    jobs.shutdown()
+
+
+def test_failed_job_reports_error():
+    def analysis():
+        raise ValueError("analysis failed")
+
+    jobs = JobQueue(max_workers=1, max_age=60)
+    job, _ = jobs.submit("analysis", {}, analysis)
+    assert job.done.wait(5)
+
+    assert job.status == "failed"
+    assert job.error == "analysis failed"
+    jobs.shutdown()
+
+
+def test_progress_is_reported():
+    def analysis():
+        for i in range(3):
+            report_progress(i, 3)
+        return None
+
+    jobs = JobQueue(max_workers=1, max_age=60)
+    job, _ = jobs.submit("analysis", {}, analysis)
+    assert job.done.wait(5)
+
+    assert job.progress == {"done": 2, "total": 3}
+    # Outside of a job nothing happens
+    report_progress(1, 2)
+    jobs.shutdown()
+
+
+def test_finished_jobs_expire():
+    jobs = JobQueue(max_workers=1, max_age=-1)
+    job, _ = jobs.submit("analysis", {}, lambda: None)
+    assert job.done.wait(5)
+
+    jobs.submit("other", {}, lambda: None)
+    assert jobs.get(job.id) is None
+    jobs.shutdown()
+
+
+def test_jobs_are_shared_between_workers(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite"))
+    jobs = JobQueue(max_workers=1, max_age=60)
+    jobs.state = state
+    other = JobQueue(max_workers=1, max_age=60)
+    other.state = state
+
+    job, _ = jobs.submit("analysis", {"alertLimit": 1}, lambda: {"count": 3})
+    assert job.done.wait(5)
+
+    assert other.get("missing") is None
+    stored = other.get(job.id)
+    assert stored.as_json() == job.as_json()
+    jobs.shutdown()
+    other.shutdown()
+
+
+def test_submit_job_endpoint(monkeypatch):
+    release = threading.Event()
+
+    def analysis(alert_limit):
+        release.wait()
+        return {"alertLimit": alert_limit}
+
+    monkeypatch.setattr(Analyzer, "simple_rule_based_analysis", analysis)
+    client = main.app.test_client()
+
+    assert client.post("/jobs").status_code == 400
+    assert client.post("/jobs", json=["sizeFullBackups"]).status_code == 400
+    assert (
+        client.post(
+            "/jobs", json={"analysis": "sizeFullBackups", "parameters": "5"}
+        ).status_code
+        == 400
+    )
+
+    try:
+        first = client.post(
+            "/jobs",
+            json={"analysis": "sizeFullBackups", "parameters": {"alertLimit": "5"}},
+        )
+        # Same alert limit as a number and with an unused parameter
+        second = client.post(
+            "/jobs",
+            json={
+                "analysis": "sizeFullBackups",
+                "parameters": {"alertLimit": 5, "unused": True},
+            },
+        )
+    finally:
+        release.set()
+
+    assert first.status_code == 202 and second.status_code == 202
+    assert second.get_json()["id"] == first.get_json()["id"]
+    assert first.get_json()["parameters"] == {"alertLimit": 5}
+    job = main.jobs.get(first.get_json()["id"])
+    assert job.done.wait(5)
+    assert job.result == {"alertLimit": 5}
@@ -0,0 +1,127 @@
+import pytest
+
+from metadata_analyzer.outbox import Outbox
+from tests.mock_backend import MockBackend
+
+
+def test_pending_batches_in_order(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    first = outbox.append("send_backup_data_batched", [{"id": "1"}])
+    second = outbox.append("send_task_data_batched", [{"id": "2"}])
+    outbox.append("send_backup_data_batched", [{"id": "3"}])
+
+    outbox.ack(second)
+
+    assert [(method, batch) for _, method, batch in outbox.pending()] == [
+        ("send_backup_data_batched", [{"id": "1"}]),
+        ("send_backup_data_batched", [{"id": "3"}]),
+    ]
+    assert outbox.pending()[0][0] == first
+    assert len(outbox) == 2
+
+
+def test_batches_survive_restart(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path)
+    outbox.append("send_backup_data_batched", [{"id": "1"}])
+    outbox.close()
+
+    outbox = Outbox(path)
+    assert [batch for _, _, batch in outbox.pending()] == [[{"id": "1"}]]
+
+
+def _reopen(outbox):
+    # Batches are only replayed once they are no longer claimed by the run which appended them
+    outbox.close()
+    return Outbox(outbox.path)
+
+
+def test_replay_sends_and_acknowledges(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.append("send_task_data_batched", [{"id": "1"}])
+    outbox.append("send_backup_data_batched", [{"id": "2"}])
+    outbox = _reopen(outbox)
+    backend = MockBackend()
+
+    assert outbox.replay(backend) == 2
+
+    assert backend.tasks == [{"id": "1"}]
+    assert backend.backups == [{"id": "2"}]
+    assert len(outbox) == 0
+
+
+def test_replay_stops_at_failure(tmp_path):
+    class FailingMockBackend(MockBackend):
+        def send_backup_data_batched(self, batch):
+            raise ConnectionError("backend is down")
+
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.append("send_task_data_batched", [{"id": "1"}])
+    outbox.append("send_backup_data_batched", [{"id": "2"}])
+    outbox.append("send_task_data_batched", [{"id": "3"}])
+    outbox = _reopen(outbox)
+    backend = FailingMockBackend()
+
+    with pytest.raises(ConnectionError):
+        outbox.replay(backend)
+
+    assert backend.tasks == [{"id": "1"}]
+    assert [batch for _, _, batch in outbox.pending()] == [
+        [{"id": "2"}],
+        [{"id": "3"}],
+    ]
+
+
+def test_replay_skips_batches_being_sent(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), lease=60)
+    # Appended by a dispatcher which is still sending it
+    sending = outbox.append("send_backup_data_batched", [{"id": "1"}])
+    backend = MockBackend()
+
+    assert outbox.replay(backend) == 0
+    assert backend.backups == []
+
+    # The dispatcher failed to send it
+    outbox.release(sending)
+    assert outbox.replay(backend) == 1
+    assert backend.backups == [{"id": "1"}]
+
+
+def test_replay_takes_over_expired_claims(tmp_path):
+    outbox = Outbox(str(tmp_path / "outbox.db"), lease=-1)
+    outbox.append("send_backup_data_batched", [{"id": "1"}])
+    backend = MockBackend()
+
+    assert outbox.replay(backend) == 1
+    assert backend.backups == [{"id": "1"}]
+
+
+def test_claims_of_previous_run_are_released(tmp_path):
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, lease=60)
+    outbox.append("send_backup_data_batched", [{"id": "1"}])
+    outbox.close()
+
+    outbox = Outbox(path, lease=60)
+    backend = MockBackend()
+    assert outbox.replay(backend) == 1
+    assert backend.backups == [{"id": "1"}]
+
+
+def test_failed_replay_releases_remaining_batches(tmp_path):
+    class FailingMockBackend(MockBackend):
+        def send_backup_data_batched(self, batch):
+            raise ConnectionError("backend is down")
+
+    path = str(tmp_path / "outbox.db")
+    outbox = Outbox(path, lease=60)
+    outbox.append("send_backup_data_batched", [{"id": "1"}])
+    outbox.close()
+    outbox = Outbox(path, lease=60)
+
+    with pytest.raises(ConnectionError):
+        outbox.replay(FailingMockBackend())
+
+    backend = MockBackend()
+    assert outbox.replay(backend) == 1
+    assert backend.backups == [{"id": "1"}]
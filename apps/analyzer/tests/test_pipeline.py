@@ -0,0 +1,74 @@
+import threading
+
+import pytest
+
+from metadata_analyzer.pipeline import Prefetcher
+
+
+def test_items_are_kept_in_order():
+    with Prefetcher(range(25), chunk_size=4, queue_size=2) as prefetcher:
+        assert list(prefetcher) == list(range(25))
+
+
+def test_empty_iterable():
+    with Prefetcher([], chunk_size=4, queue_size=2) as prefetcher:
+        assert list(prefetcher) == []
+
+
+def test_reads_ahead_in_the_background():
+    read = threading.Event()
+
+    def items():
+        yield 1
+        read.set()
+
+    with Prefetcher(items(), chunk_size=1, queue_size=2):
+        # Nothing was consumed yet
+        assert read.wait(timeout=5)
+
+
+def test_buffer_is_bounded():
+    read = []
+
+    def items():
+        for i in range(100):
+            read.append(i)
+            yield i
+
+    with Prefetcher(items(), chunk_size=2, queue_size=3) as prefetcher:
+        iterator = iter(prefetcher)
+        assert next(iterator) == 0
+        # One chunk is being consumed, three are queued, one is waiting to be queued
+        prefetcher.thread.join(timeout=0.5)
+        assert len(read) <= 2 * 5
+
+
+def test_errors_are_raised_to_the_consumer():
+    def items():
+        yield 1
+        raise ValueError("database is gone")
+
+    with Prefetcher(items(), chunk_size=1, queue_size=2) as prefetcher:
+        iterator = iter(prefetcher)
+        assert next(iterator) == 1
+        with pytest.raises(ValueError):
+            next(iterator)
+
+
+def test_close_stops_reading():
+    closed = threading.Event()
+
+    def items():
+        try:
+            i = 0
+            while True:
+                yield i
+                i += 1
+        finally:
+            closed.set()
+
+    prefetcher = Prefetcher(items(), chunk_size=1, queue_size=1)
+    prefetcher.close()
+
+    assert closed.is_set()
+    assert not prefetcher.thread.is_alive()
@@ -0,0 +1,97 @@
+from collections import namedtuple
+
+import pytest
+
+from metadata_analyzer.results_cache import ResultList, ResultsCache
+
+MockResult = namedtuple("MockResult", ["uuid", "start_time"])
+
+
+class ProbeMockDatabase:
+    def __init__(self):
+        self.version = (None, 0)
+
+    def probe_results(self):
+        return self.version
+
+
+def test_loads_once_while_results_are_unchanged():
+    cache = ResultsCache(ProbeMockDatabase(), max_age=60)
+    loads = []
+
+    def load():
+        loads.append(1)
+        return [1, 2, 3]
+
+    assert cache.get("results", load) == [1, 2, 3]
+    assert cache.get("results", load) == [1, 2, 3]
+
+    assert len(loads) == 1
+    assert cache.status() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+def test_keys_are_cached_separately():
+    cache = ResultsCache(ProbeMockDatabase(), max_age=60)
+
+    assert cache.get("full", lambda: "F") == "F"
+    assert cache.get("inc", lambda: "I") == "I"
+    assert cache.get("full", lambda: "other") == "F"
+
+
+def test_changed_results_are_reloaded():
+    database = ProbeMockDatabase()
+    cache = ResultsCache(database, max_age=60)
+    cache.get("results", lambda: "old")
+
+    database.version = ("2000-01-01", 1)
+
+    assert cache.get("results", lambda: "new") == "new"
+    assert cache.status()["misses"] == 2
+
+
+def test_entries_expire():
+    cache = ResultsCache(ProbeMockDatabase(), max_age=-1)
+    cache.get("schedules", lambda: "old")
+
+    assert cache.get("schedules", lambda: "new") == "new"
+
+
+def test_data_loaded_during_a_change_is_not_kept():
+    database = ProbeMockDatabase()
+    cache = ResultsCache(database, max_age=60)
+
+    def load():
+        # Another request sees the new results while this one is loading
+        database.version = ("2000-01-01", 1)
+        cache.get("other", lambda: None)
+        return "stale"
+
+    cache.get("results", load)
+
+    assert cache.get("results", lambda: "current") == "current"
+
+
+def test_invalidate():
+    cache = ResultsCache(ProbeMockDatabase(), max_age=60)
+    cache.get("results", lambda: "old")
+
+    cache.invalidate()
+
+    assert cache.get("results", lambda: "new") == "new"
+
+
+def test_result_list_looks_up_start_times():
+    results = ResultList([MockResult("1", 10), MockResult("2", 20)])
+
+    assert results.start_time("2") == 20
+    assert results.start_time("1") == 10
+    assert results == [MockResult("1", 10), MockResult("2", 20)]
+
+
+def test_result_list_rejects_missing_and_duplicate_uuids():
+    results = ResultList([MockResult("1", 10), MockResult("1", 20)])
+
+    with pytest.raises(AssertionError):
+        results.start_time("1")
+    with pytest.raises(AssertionError):
+        results.start_time("2")
@@ -0,0 +1,154 @@
+import fcntl
+import threading
+from datetime import datetime
+
+import pytest
+
+from metadata_analyzer.models import Result
+from metadata_analyzer.results_snapshot import ResultsSnapshot
+from tests.test_database import _create_database, _create_result
+
+pytest.importorskip("pyarrow")
+
+
+def _add_results(database, results):
+    with database.session() as session:
+        session.add_all(results)
+        session.commit()
+
+
+def test_snapshot_is_written_on_first_load(tmp_path):
+    database = _create_database()
+    _add_results(
+        database,
+        [
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        ],
+    )
+    snapshot = ResultsSnapshot(database, str(tmp_path / "results.parquet"))
+
+    df = snapshot.load()
+
+    assert list(df["uuid"]) == ["1"]
+    assert (tmp_path / "results.parquet").exists()
+
+
+def test_snapshot_only_loads_new_results(tmp_path):
+    database = _create_database()
+    _add_results(
+        database,
+        [
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        ],
+    )
+    snapshot = ResultsSnapshot(database, str(tmp_path / "results.parquet"))
+    snapshot.load()
+
+    _add_results(
+        database,
+        [
+            # Same start_time as the newest result in the snapshot
+            _create_result(
+                "s2", "2", "foo", "F", 200, datetime.fromisoformat("2000-01-01")
+            ),
+            _create_result(
+                "s3", "3", "foo", "F", 300, datetime.fromisoformat("2000-01-02")
+            ),
+        ],
+    )
+    checkouts = database.pool_status()["checkouts"]
+    df = snapshot.load()
+
+    assert sorted(df["uuid"]) == ["1", "2", "3"]
+    assert database.pool_status()["checkouts"] == checkouts + 1
+    assert str(df["start_time"].dtype) == "datetime64[ns]"
+
+
+def test_invalidated_snapshot_is_rebuilt(tmp_path):
+    database = _create_database()
+    _add_results(
+        database,
+        [
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        ],
+    )
+    snapshot = ResultsSnapshot(database, str(tmp_path / "results.parquet"))
+    snapshot.load()
+    snapshot.invalidate()
+
+    assert not (tmp_path / "results.parquet").exists()
+    assert list(snapshot.load()["uuid"]) == ["1"]
+
+
+def test_unchanged_snapshot_is_not_rewritten(tmp_path, monkeypatch):
+    database = _create_database()
+    _add_results(
+        database,
+        [
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            ),
+            _create_result(
+                "s2", "2", "foo", "F", 200, datetime.fromisoformat("2000-01-02")
+            ),
+        ],
+    )
+    snapshot = ResultsSnapshot(database, str(tmp_path / "results.parquet"))
+    snapshot.load()
+    writes = []
+    write = snapshot._write
+    monkeypatch.setattr(snapshot, "_write", lambda df: writes.append(df) or write(df))
+
+    assert sorted(snapshot.load()["uuid"]) == ["1", "2"]
+    assert writes == []
+
+    # A changed result with the newest start_time is written
+    with database.session() as session:
+        session.query(Result).filter(Result.saveset == "s2").update({"data_size": 300})
+        session.commit()
+    df = snapshot.load()
+
+    assert len(writes) == 1
+    assert list(df.sort_values("saveset")["data_size"]) == [100, 300]
+
+
+def test_snapshot_waits_for_other_processes(tmp_path):
+    database = _create_database()
+    _add_results(
+        database,
+        [
+            _create_result(
+                "s1", "1", "foo", "F", 100, datetime.fromisoformat("2000-01-01")
+            )
+        ],
+    )
+    snapshot = ResultsSnapshot(database, str(tmp_path / "results.parquet"))
+
+    # The lock file is held as if by another worker process, which releases it after a while
+    with open(tmp_path / "results.parquet.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        events = []
+
+        def release():
+            events.append("released")
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        timer = threading.Timer(0.1, release)
+        timer.start()
+        snapshot.load()
+        events.append("loaded")
+        timer.join()
+
+    assert events == ["released", "loaded"]
+    assert (tmp_path / "results.parquet").exists()
+    # The unique temporary file was moved into place
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "results.parquet",
+        "results.parquet.lock",
+    ]
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta
 
 from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.batch_dispatcher import AdaptiveBatchSizer
 from metadata_analyzer.models import Result, Schedule, TaskEvent
 from metadata_analyzer.schedule_based_analyzer import ScheduleBasedAnalyzer
 from tests.mock_backend import MockBackend
@@ -480,6 +481,66 @@ def test_alerts_multiple_missing_backups():
     assert backend.additional_backup_alerts == []
 
 
+def test_alerts_are_sent_in_batches(monkeypatch):
+    mock_result1 = _create_mock_result(
+        "foo",
+        "1",
+        "F",
+        100_000_000,
+        datetime.fromisoformat("2000-01-01T12:00:00"),
+        "bar",
+    )
+    mock_result2 = _create_mock_result(
+        "foo",
+        "2",
+        "F",
+        100_000_000,
+        datetime.fromisoformat("2000-01-01T18:00:00"),
+        "bar",
+    )
+    mock_schedule = _create_mock_schedule("bar", "HOU", 2)
+    mock_task_event = _create_mock_task_event(1, "1", "foo", "bar")
+
+    class CountingMockBackend(MockBackend):
+        def __init__(self):
+            super().__init__()
+            self.batches = []
+
+        def create_creation_date_alerts_batched(self, alerts):
+            self.batches.append(("creationDate", len(alerts)))
+            super().create_creation_date_alerts_batched(alerts)
+
+        def create_missing_backup_alerts_batched(self, alerts):
+            self.batches.append(("missingBackup", len(alerts)))
+            super().create_missing_backup_alerts_batched(alerts)
+
+        def create_additional_backup_alerts_batched(self, alerts):
+            self.batches.append(("additionalBackup", len(alerts)))
+            super().create_additional_backup_alerts_batched(alerts)
+
+    # Every missing backup alert is sent in its own batch
+    monkeypatch.setitem(
+        AdaptiveBatchSizer._shared,
+        "missing_backup_alerts",
+        AdaptiveBatchSizer(max_items=1),
+    )
+    database = MockDatabase(
+        [mock_result1, mock_result2],
+        [],
+        [],
+        [mock_schedule],
+        [mock_task_event],
+    )
+    backend = CountingMockBackend()
+    schedule_based_analyzer = ScheduleBasedAnalyzer(backend)
+    Analyzer.__init__(database, backend, None, None, schedule_based_analyzer, None)
+    Analyzer.schedule_based_analysis(-1, datetime.fromisoformat("2000-01-01T19:00:00"))
+
+    # No requests are made without alerts
+    assert backend.batches == [("missingBackup", 1), ("missingBackup", 1)]
+    assert len(backend.missing_backup_alerts) == 2
+
+
 # Check correct behavior of mixing additional backup alerts and creation date alerts
 def test_alerts_creation_date_alert_and_additional_backup_alerts():
     mock_result1 = _create_mock_result(
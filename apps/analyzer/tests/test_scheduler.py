@@ -0,0 +1,97 @@
+import threading
+import time
+
+from metadata_analyzer.scheduler import Scheduler
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_runs_periodically():
+    scheduler = Scheduler(max_concurrent=1)
+    runs = []
+    scheduler.add("analysis", lambda: runs.append(1), 0.02)
+    scheduler.start()
+    try:
+        _wait_for(lambda: scheduler.status()["analysis"]["runs"] >= 3)
+    finally:
+        scheduler.stop()
+
+    status = scheduler.status()["analysis"]
+    assert status["failures"] == 0
+    assert status["lastRun"] is not None
+    assert status["lastDuration"] >= 0
+    assert status["lastError"] is None
+
+
+def test_skips_run_while_previous_is_going():
+    scheduler = Scheduler(max_concurrent=2)
+    release = threading.Event()
+    scheduler.add("slow", release.wait, 0.02)
+    scheduler.start()
+    try:
+        _wait_for(lambda: scheduler.status()["slow"]["skipped"] >= 2)
+        assert scheduler.status()["slow"]["running"]
+        assert scheduler.status()["slow"]["runs"] == 0
+    finally:
+        release.set()
+        scheduler.stop()
+
+    assert scheduler.status()["slow"]["runs"] == 1
+
+
+def test_caps_concurrent_runs():
+    scheduler = Scheduler(max_concurrent=1)
+    lock = threading.Lock()
+    running = [0]
+    overlaps = []
+
+    def analysis():
+        with lock:
+            running[0] += 1
+            overlaps.append(running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+
+    scheduler.add("first", analysis, 0.01)
+    scheduler.add("second", analysis, 0.01)
+    scheduler.start()
+    try:
+        _wait_for(lambda: all(job["runs"] >= 2 for job in scheduler.status().values()))
+    finally:
+        scheduler.stop()
+
+    assert max(overlaps) == 1
+
+
+def test_failures_are_recorded():
+    def analysis():
+        raise ValueError("analysis failed")
+
+    scheduler = Scheduler(max_concurrent=1)
+    scheduler.add("failing", analysis, 0.02)
+    scheduler.start()
+    try:
+        _wait_for(lambda: scheduler.status()["failing"]["failures"] >= 2)
+    finally:
+        scheduler.stop()
+
+    assert scheduler.status()["failing"]["lastError"] == "analysis failed"
+
+
+def test_interval_from_env(monkeypatch):
+    monkeypatch.setenv("SCHEDULE_UPDATE_DATA_INTERVAL", "600")
+    monkeypatch.setenv("SCHEDULE_UPDATE_DATA_JITTER", "30")
+    monkeypatch.delenv("SCHEDULE_CREATION_DATE_INTERVAL", raising=False)
+    scheduler = Scheduler(max_concurrent=1)
+
+    assert scheduler.add_from_env("updateData", "UPDATE_DATA", lambda: None)
+    assert scheduler.add_from_env("creationDate", "CREATION_DATE", lambda: None) is None
+    assert len(scheduler) == 1
+    assert scheduler.status()["updateData"]["interval"] == 600
+    assert scheduler.status()["updateData"]["jitter"] == 30
@@ -0,0 +1,60 @@
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+from flask import Flask, jsonify
+
+from metadata_analyzer import serialization
+from metadata_analyzer.serialization import FlaskJSONProvider
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+
+def test_datetimes_are_encoded_in_iso_format(encoder):
+    payload = {
+        "creationDate": datetime(2000, 1, 1, 12, 0, 0),
+        "date": datetime(2000, 1, 1, 12, 0, 0, 500, tzinfo=timezone.utc),
+        "scheduledTime": None,
+    }
+
+    assert serialization.loads(serialization.dumps(payload)) == {
+        "creationDate": "2000-01-01T12:00:00",
+        "date": "2000-01-01T12:00:00.000500+00:00",
+        "scheduledTime": None,
+    }
+
+
+def test_output_is_compact_bytes(encoder):
+    assert serialization.dumps([{"id": "1", "sizeMB": 1.5}]) == (
+        b'[{"id":"1","sizeMB":1.5}]'
+    )
+
+
+def test_unsupported_types_raise(encoder):
+    with pytest.raises(TypeError):
+        serialization.dumps({"value": object()})
+
+
+def test_numpy_values_with_orjson():
+    pytest.importorskip("orjson")
+    assert serialization.dumps({"values": np.array([1, 2])}) == b'{"values":[1,2]}'
+
+
+def test_flask_responses_keep_http_dates(encoder):
+    app = Flask(__name__)
+    app.json = FlaskJSONProvider(app)
+
+    with app.app_context():
+        response = jsonify({"b": 1, "a": datetime(2000, 1, 1, 12, 0, 0)})
+
+    assert response.mimetype == "application/json"
+    assert response.get_data() == (
+        b'{"a":"Sat, 01 Jan 2000 12:00:00 GMT","b":1}\n'
+    )
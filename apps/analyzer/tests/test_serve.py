@@ -0,0 +1,90 @@
+import os
+import time
+
+from metadata_analyzer import serve
+from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.fingerprints import FingerprintStore
+from metadata_analyzer.outbox import Outbox
+from tests.mock_backend import MockBackend
+from tests.mock_database import MockDatabase
+
+
+def test_options_from_env(monkeypatch):
+    monkeypatch.setenv("SERVER_WORKERS", "3")
+    monkeypatch.setenv("SERVER_THREADS", "8")
+    monkeypatch.setenv("SERVER_TIMEOUT", "60")
+
+    options = serve.options("localhost", 8000)
+
+    assert options["bind"] == "localhost:8000"
+    assert options["workers"] == 3
+    assert options["threads"] == 8
+    assert options["worker_class"] == "gthread"
+    assert options["timeout"] == 60
+    assert options["preload_app"]
+
+
+def test_single_thread_workers(monkeypatch):
+    monkeypatch.setenv("SERVER_THREADS", "1")
+
+    assert serve.options("localhost", 8000)["worker_class"] == "sync"
+
+
+def test_resources_are_reopened_after_fork(tmp_path):
+    class ForkMockDatabase(MockDatabase):
+        forked = False
+
+        def after_fork(self):
+            self.forked = True
+
+    class ForkMockBackend(MockBackend):
+        forked = False
+
+        def after_fork(self):
+            self.forked = True
+
+    database = ForkMockDatabase([])
+    backend = ForkMockBackend()
+    outbox = Outbox(str(tmp_path / "outbox.db"))
+    outbox.append("send_backup_data_batched", [{"id": "1"}])
+    fingerprints = FingerprintStore(str(tmp_path / "fingerprints.db"))
+    fingerprints.record("tasks", [{"id": "1"}])
+    Analyzer.__init__(
+        database, backend, None, None, None, None, None, outbox, fingerprints
+    )
+
+    serve.after_fork()
+
+    assert database.forked
+    assert backend.forked
+    # The reopened stores still see the data written before
+    assert len(outbox) == 1
+    assert fingerprints.changed("tasks", [{"id": "1"}]) == []
+
+
+def test_torch_threads_are_limited_before_torch_is_imported(monkeypatch):
+    monkeypatch.setattr(Analyzer, "after_fork", lambda: None)
+    monkeypatch.setenv("SERVER_TORCH_THREADS", "2")
+    # Restored after the test
+    monkeypatch.setenv("OMP_NUM_THREADS", "")
+    monkeypatch.setenv("MKL_NUM_THREADS", "")
+
+    serve.after_fork()
+
+    assert os.environ["OMP_NUM_THREADS"] == "2"
+    assert os.environ["MKL_NUM_THREADS"] == "2"
+
+
+def test_scheduler_runs_in_one_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv("SERVER_SCHEDULER_LOCK", str(tmp_path / "scheduler.lock"))
+    started = []
+
+    # Every call stands for a worker trying to take the lock
+    serve.start_scheduler_once(lambda: started.append(1))
+    serve.start_scheduler_once(lambda: started.append(2))
+
+    deadline = time.monotonic() + 5
+    while len(started) == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.1)
+    assert len(started) == 1
@@ -0,0 +1,94 @@
+from metadata_analyzer import main
+from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.enhanced_storage_analyzer import EnhancedStorageAnalyzer
+from metadata_analyzer.scheduler import Scheduler
+from metadata_analyzer.shared_state import SharedState
+from metadata_analyzer.time_series_analyzer import Time_series_analyzer
+from tests.mock_backend import MockBackend
+from tests.mock_database import MockDatabase
+
+
+def _init_analyzer():
+    # A fresh analyzer with the default settings, like in another worker process
+    backend = MockBackend()
+    Analyzer.__init__(
+        MockDatabase([]),
+        backend,
+        None,
+        Time_series_analyzer([0.95, 5]),
+        None,
+        EnhancedStorageAnalyzer(backend),
+    )
+
+
+def _share_state(monkeypatch, path):
+    state = SharedState(str(path))
+    monkeypatch.setattr(main, "shared_state", state)
+    return state
+
+
+def test_values(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite"))
+    state.put("a.x", 1)
+    state.put("a.y", [1, 2])
+    state.put("b", {"z": None})
+
+    assert state.get("a.x") == 1
+    assert state.get("b") == {"z": None}
+    assert state.get("missing") is None
+    assert state.get_prefix("a.") == {"x": 1, "y": [1, 2]}
+
+
+def test_jobs(tmp_path):
+    state = SharedState(str(tmp_path / "state.sqlite"))
+    state.save_job("running", {"id": "running"})
+    state.save_job("finished", {"id": "finished"}, finished=0)
+
+    assert state.load_job("running") == {"id": "running"}
+    state.remove_jobs(60)
+    assert state.load_job("running") is not None
+    assert state.load_job("finished") is None
+
+
+def test_state_of_previous_run_is_cleared(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = SharedState(path)
+    state.put("a", 1)
+    state.save_job("job", {"id": "job"})
+
+    state = SharedState(path)
+    assert state.get("a") is None
+    assert state.load_job("job") is None
+
+
+def test_settings_are_shared_between_workers(monkeypatch, tmp_path):
+    _share_state(monkeypatch, tmp_path / "state.sqlite")
+    client = main.app.test_client()
+    _init_analyzer()
+    assert client.post("/timeSeriesAnalysis/threshold?threshold=0.5").status_code == 200
+    assert client.post("/timeSeriesAnalysis/clusters?clusters=3").status_code == 200
+    assert (
+        client.post("/timeSeriesAnalysis/forecasting/steps?steps=100").status_code
+        == 200
+    )
+
+    _init_analyzer()
+    assert client.get("/").status_code == 200
+    assert Analyzer.time_series_analyzer.config.threshold == 0.5
+    assert Analyzer.time_series_analyzer.config.clusters == 3
+    assert Analyzer.enhanced_storage_analyzer.config.forecast_length == 100
+    assert Analyzer.enhanced_storage_analyzer.config.frequency == 24 * 60 * 60
+
+
+def test_scheduler_status_of_other_worker(monkeypatch, tmp_path):
+    state = _share_state(monkeypatch, tmp_path / "state.sqlite")
+    other = Scheduler(max_concurrent=1)
+    other.on_change = lambda status: state.put("scheduler", status)
+    other.add("updateData", lambda: None, 600)
+    other._run(other.jobs["updateData"])
+
+    response = main.app.test_client().get("/scheduler")
+
+    assert response.status_code == 200
+    assert response.get_json()["updateData"]["runs"] == 1
+    assert response.get_json()["updateData"]["lastRun"] is not None
@@ -1,6 +1,10 @@
+from collections import namedtuple
 from datetime import datetime
 
+import pytest
+
 from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.batch_dispatcher import AdaptiveBatchSizer, BatchDispatchError
 from metadata_analyzer.models import Result, DataStore, Schedule
 from metadata_analyzer.simple_rule_based_analyzer import SimpleRuleBasedAnalyzer
 from tests.mock_backend import MockBackend
@@ -119,6 +123,48 @@ def test_alerts_different_tasks():
     ]
 
 
+def test_lost_alerts_are_sent_by_next_run(monkeypatch):
+    mock_results = [
+        _create_mock_result(
+            "foo",
+            str(i),
+            "F",
+            100_000_000 if i % 2 == 1 else 200_000_000,
+            datetime.fromisoformat(f"2000-01-0{i}"),
+        )
+        for i in range(1, 5)
+    ]
+
+    class FailingMockBackend(MockBackend):
+        failing = True
+
+        def create_size_alerts_batched(self, alerts):
+            if self.failing and alerts[0]["backupId"] == "3":
+                raise ConnectionError("backend is down")
+            super().create_size_alerts_batched(alerts)
+
+    # Every alert is sent in its own batch
+    monkeypatch.setitem(
+        AdaptiveBatchSizer._shared, "size_alerts", AdaptiveBatchSizer(max_items=1)
+    )
+    backend = FailingMockBackend()
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(backend, 0.2, 0.2, 0.2, 0.2)
+    with pytest.raises(BatchDispatchError):
+        simple_rule_based_analyzer.analyze(mock_results, -1, datetime.min)
+    assert "3" not in [alert["backupId"] for alert in backend.size_alerts]
+
+    # The next run starts before the lost alert, even if a later alert was accepted
+    backend.failing = False
+    start_date = mock_results[3].start_time
+    assert simple_rule_based_analyzer.analyze(mock_results, -1, start_date) == {
+        "count": 2
+    }
+    assert "3" in [alert["backupId"] for alert in backend.size_alerts]
+    assert simple_rule_based_analyzer.analyze(mock_results, -1, start_date) == {
+        "count": 0
+    }
+
+
 def test_alert_backup_size_zero():
     mock_result1 = _create_mock_result(
         "foo", "1", "F", 100_000_000, datetime.fromisoformat("2000-01-01")
@@ -520,10 +566,12 @@ def test_alert_backup_size_zero_inc():
     Analyzer.__init__(database, backend, simple_rule_based_analyzer, None, None, None)
     Analyzer.simple_rule_based_analysis_inc(1)
 
+    # The average size of the incs is used as reference
+    avg = (mock_result1.data_size + mock_result2.data_size) / 2
     assert backend.size_alerts == [
         {
             "size": mock_result2.data_size / 1_000_000,
-            "referenceSize": mock_result1.data_size / 1_000_000,
+            "referenceSize": avg / 1_000_000,
             "backupId": mock_result2.uuid,
         }
     ]
@@ -715,3 +763,115 @@ def test_storage_fill_alert_missing_data():
     Analyzer.simple_rule_based_analysis_storage_capacity(-1)
 
     assert backend.storage_fill_alerts == []
+
+
+# Tests for the scheduled times of backups
+
+
+# The scheduled time is derived from the previous backup of the same task and schedule
+def test_annotate_scheduled_times():
+    mock_result1 = _create_mock_result(
+        "foo", "1", "F", 100_000_000, datetime.fromisoformat("2000-01-01T12:00"), "s1"
+    )
+    mock_result2 = _create_mock_result(
+        "bar", "2", "F", 100_000_000, datetime.fromisoformat("2000-01-01T18:00"), "s1"
+    )
+    mock_result3 = _create_mock_result(
+        "foo", "3", "F", 100_000_000, datetime.fromisoformat("2000-01-02T13:00"), "s1"
+    )
+    mock_schedule = _create_mock_schedule("s1", "DAY", 1, "12:00")
+
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(None, 0.2, 0.2, 0.2, 0.2)
+    results = list(
+        simple_rule_based_analyzer.annotate_scheduled_times(
+            iter([mock_result1, mock_result2, mock_result3]), [mock_schedule], None
+        )
+    )
+
+    assert results == [mock_result1, mock_result2, mock_result3]
+    assert mock_result1.scheduledTime is None
+    assert mock_result2.scheduledTime is None
+    assert mock_result3.scheduledTime == datetime.fromisoformat("2000-01-02T12:00")
+
+
+# Results older than the start date keep their scheduled time
+def test_annotate_scheduled_times_start_date():
+    mock_result1 = _create_mock_result(
+        "foo", "1", "F", 100_000_000, datetime.fromisoformat("2000-01-01T12:00"), "s1"
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "F", 100_000_000, datetime.fromisoformat("2000-01-02T12:00"), "s1"
+    )
+    mock_result3 = _create_mock_result(
+        "foo", "3", "F", 100_000_000, datetime.fromisoformat("2000-01-03T12:30"), "s1"
+    )
+    mock_schedule = _create_mock_schedule("s1", "DAY", 1, "12:00")
+
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(None, 0.2, 0.2, 0.2, 0.2)
+    list(
+        simple_rule_based_analyzer.annotate_scheduled_times(
+            [mock_result1, mock_result2, mock_result3],
+            [mock_schedule],
+            "2000-01-02T12:00:00.000Z",
+        )
+    )
+
+    assert mock_result2.scheduledTime is None
+    assert mock_result3.scheduledTime == datetime.fromisoformat("2000-01-03T12:00")
+
+
+# The scheduled time is sent to the backend together with the backup
+def test_update_data_scheduled_time():
+    mock_result1 = _create_mock_result(
+        "foo", "1", "F", 100_000_000, datetime.fromisoformat("2000-01-01T12:00"), "s1"
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "F", 100_000_000, datetime.fromisoformat("2000-01-02T12:10"), "s1"
+    )
+    mock_schedule = _create_mock_schedule("s1", "DAY", 1, "12:00")
+
+    database = MockDatabase([mock_result1, mock_result2], schedules=[mock_schedule])
+    backend = MockBackend()
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(backend, 0.2, 0.2, 0.2, 0.2)
+    Analyzer.__init__(database, backend, simple_rule_based_analyzer, None, None, None)
+    Analyzer.update_data()
+
+    assert [backup["scheduledTime"] for backup in backend.backups] == [
+        None,
+        "2000-01-02T12:00:00",
+    ]
+
+
+# The inc analysis must not modify the analyzed results
+def test_inc_analysis_keeps_results_unchanged():
+    mock_result1 = _create_mock_result(
+        "foo", "1", "I", 100_000_000, datetime.fromisoformat("2000-01-01")
+    )
+    mock_result2 = _create_mock_result(
+        "foo", "2", "I", 200_000_000, datetime.fromisoformat("2000-01-02")
+    )
+
+    database = MockDatabase([mock_result1, mock_result2])
+    backend = MockBackend()
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(backend, 0.2, 0.2, 0.2, 0.2)
+    Analyzer.__init__(database, backend, simple_rule_based_analyzer, None, None, None)
+    Analyzer.simple_rule_based_analysis_inc(-1)
+
+    assert mock_result1.data_size == 100_000_000
+    assert mock_result2.data_size == 200_000_000
+
+
+# The size analyses work on projected rows which only contain the declared columns
+def test_alert_projected_rows():
+    Row = namedtuple("Row", SimpleRuleBasedAnalyzer.result_columns)
+    row1 = Row("1", "foo", "I", 100_000_000, datetime.fromisoformat("2000-01-01"), "0")
+    row2 = Row("2", "foo", "I", 100_000_000, datetime.fromisoformat("2000-01-02"), "0")
+    row3 = Row("3", "foo", "I", 200_000_000, datetime.fromisoformat("2000-01-03"), "0")
+
+    database = MockDatabase([row1, row2, row3])
+    backend = MockBackend()
+    simple_rule_based_analyzer = SimpleRuleBasedAnalyzer(backend, 0.2, 0.2, 0.2, 0.2)
+    Analyzer.__init__(database, backend, simple_rule_based_analyzer, None, None, None)
+    Analyzer.simple_rule_based_analysis_inc(-1)
+
+    assert [alert["backupId"] for alert in backend.size_alerts] == ["2", "3"]
@@ -0,0 +1,136 @@
+import threading
+import time
+
+import pytest
+
+from metadata_analyzer import main
+from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.single_flight import SingleFlight
+
+
+def test_concurrent_duplicates_share_the_result():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def analysis():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return {"count": 1}
+
+    results = []
+
+    def call(parameters):
+        results.append(single_flight.do("analysis", parameters, analysis))
+
+    first = threading.Thread(target=call, args=({"a": 1, "b": 2},))
+    first.start()
+    assert started.wait(5)
+    # Same parameters in a different order
+    second = threading.Thread(target=call, args=({"b": 2, "a": 1},))
+    second.start()
+    while single_flight.status()["shared"] == 0:
+        time.sleep(0.001)
+    release.set()
+    first.join()
+    second.join()
+
+    assert len(calls) == 1
+    assert results == [{"count": 1}, {"count": 1}]
+    assert single_flight.status() == {"executed": 1, "shared": 1, "inFlight": 0}
+
+
+def test_different_parameters_run_separately():
+    single_flight = SingleFlight()
+
+    assert single_flight.do("analysis", {"alertLimit": 1}, lambda: 1) == 1
+    assert single_flight.do("analysis", {"alertLimit": 2}, lambda: 2) == 2
+    assert single_flight.do("other", {"alertLimit": 1}, lambda: 3) == 3
+    assert single_flight.status()["executed"] == 3
+
+
+def test_sequential_calls_run_again():
+    single_flight = SingleFlight()
+    calls = []
+
+    single_flight.do("analysis", {}, lambda: calls.append(1))
+    single_flight.do("analysis", {}, lambda: calls.append(1))
+
+    assert len(calls) == 2
+
+
+def test_errors_are_shared():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def analysis():
+        started.set()
+        release.wait()
+        raise ValueError("analysis failed")
+
+    errors = []
+
+    def call():
+        try:
+            single_flight.do("analysis", {}, analysis)
+        except ValueError as e:
+            errors.append(str(e))
+
+    first = threading.Thread(target=call)
+    first.start()
+    assert started.wait(5)
+    second = threading.Thread(target=call)
+    second.start()
+    while single_flight.status()["shared"] == 0:
+        time.sleep(0.001)
+    release.set()
+    first.join()
+    second.join()
+
+    assert errors == ["analysis failed", "analysis failed"]
+    # The failed call is not kept
+    with pytest.raises(KeyError):
+        single_flight.do("analysis", {}, lambda: {}["missing"])
+    assert single_flight.status()["inFlight"] == 0
+
+
+def test_jobs_and_scheduled_runs_share_runs_with_requests(monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def analysis(alert_limit):
+        calls.append(alert_limit)
+        started.set()
+        release.wait()
+        return {"count": 1}
+
+    monkeypatch.setattr(Analyzer, "simple_rule_based_analysis", analysis)
+    shared = main.single_flight.status()["shared"]
+    results = []
+    job = threading.Thread(
+        target=lambda: results.append(main.job_analyses["sizeFullBackups"](-1))
+    )
+    job.start()
+    assert started.wait(5)
+    request = threading.Thread(
+        target=lambda: results.append(
+            main.app.test_client()
+            .post("/alerting/size/fullBackups?alertLimit=-1")
+            .get_json()
+        )
+    )
+    request.start()
+    deadline = time.monotonic() + 5
+    while main.single_flight.status()["shared"] == shared:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    release.set()
+    job.join(5)
+    request.join(5)
+
+    assert calls == [-1]
+    assert results == [{"count": 1}, {"count": 1}]
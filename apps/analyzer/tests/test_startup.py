@@ -0,0 +1,51 @@
+import subprocess
+import sys
+
+from metadata_analyzer.analyzer import Analyzer
+from metadata_analyzer.main import app
+from metadata_analyzer.time_series_analyzer import Time_series_analyzer
+from tests.mock_backend import MockBackend
+from tests.mock_database import MockDatabase
+
+
+def test_darts_is_not_imported_at_startup():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, metadata_analyzer.main; print('darts' in sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_time_series_routes_without_time_series_analyzer():
+    Analyzer.__init__(MockDatabase([]), MockBackend(), None, None, None, None)
+
+    response = app.test_client().post("/timeSeriesAnalysis/threshold?threshold=0.5")
+
+    assert response.status_code == 503
+
+
+def test_storage_overflow_job_without_time_series_analyzer():
+    Analyzer.__init__(MockDatabase([]), MockBackend(), None, None, None, None)
+
+    response = app.test_client().post("/jobs", json={"analysis": "storageOverflow"})
+
+    assert response.status_code == 503
+
+
+def test_time_series_routes_with_time_series_analyzer():
+    time_series_analyzer = Time_series_analyzer([0.95, 5])
+    Analyzer.__init__(
+        MockDatabase([]), MockBackend(), None, time_series_analyzer, None, None
+    )
+
+    response = app.test_client().post("/timeSeriesAnalysis/threshold?threshold=0.5")
+
+    assert response.status_code == 200
+    assert time_series_analyzer.config.threshold == 0.5
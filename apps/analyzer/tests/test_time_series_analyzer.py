@@ -260,8 +260,8 @@ class Test_time_series_analyzer:
             ]
         )
         time_series_analyzer = Time_series_analyzer([0.95, 5])
-        Analyzer.time_series_analyzer.set_training_start(0)
-        Analyzer.time_series_analyzer.set_training_end(5)
+        time_series_analyzer.set_training_start(0)
+        time_series_analyzer.set_training_end(5)
         Analyzer.__init__(database, backend, None, time_series_analyzer, None, None)
         Analyzer.load_time_series_data()
 
@@ -270,3 +270,18 @@ class Test_time_series_analyzer:
         )
 
         assert result == [pd.Timestamp("2000-01-19T12")]
+
+    def test_settings_are_replaced_as_snapshot(self):
+        time_series_analyzer = Time_series_analyzer([0.95, 5])
+        config = time_series_analyzer.config
+
+        time_series_analyzer.set_threshold(0.9)
+        time_series_analyzer.set_clusters(3)
+        time_series_analyzer.set_training_start(2)
+        time_series_analyzer.set_training_end(10)
+
+        # A running analysis keeps its snapshot
+        assert config == (0.95, 5, 0, -1)
+        assert time_series_analyzer.config == (0.9, 3, 2, 10)
+        # Settings are not shared between instances
+        assert Time_series_analyzer([0.95, 5]).config == config
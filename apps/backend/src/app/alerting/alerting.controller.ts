@@ -223,6 +223,35 @@ export class AlertingController {
     );
   }
 
+  @Post('missingBackup/batched')
+  @ApiOperation({
+    summary: 'Create multiple new missing backup alerts batched.',
+  })
+  @ApiCreatedResponse({ description: 'Missing Backup Alerts created' })
+  @ApiBody({ type: CreateMissingBackupAlertDto })
+  async createMissingBackupAlertsBatched(
+    @Body() createMissingBackupAlertDtos: CreateMissingBackupAlertDto[]
+  ): Promise<void> {
+    await this.alertingService.createMissingBackupAlertsBatched(
+      createMissingBackupAlertDtos
+    );
+  }
+
+  @Post('additionalBackup/batched')
+  @ApiOperation({
+    summary: 'Create multiple new additional backup alerts batched.',
+  })
+  @ApiNotFoundResponse({ description: 'Backup not found' })
+  @ApiCreatedResponse({ description: 'Additional Backup Alerts created' })
+  @ApiBody({ type: CreateAdditionalBackupAlertDto })
+  async createAdditionalBackupAlertsBatched(
+    @Body() createAdditionalBackupAlertDtos: CreateAdditionalBackupAlertDto[]
+  ): Promise<void> {
+    await this.alertingService.createAdditionalBackupAlertsBatched(
+      createAdditionalBackupAlertDtos
+    );
+  }
+
   @Get('type/:typeName/latest')
   @ApiOperation({
     summary:
@@ -577,6 +577,99 @@ describe('AlertingService', () => {
     });
   });
 
+  describe('createMissingBackupAlertsBatched', () => {
+    it('should create and save missing backup alerts in batch', async () => {
+      const createMissingBackupAlertDtos: CreateMissingBackupAlertDto[] = [
+        { referenceDate: new Date('2025-01-13T17:53:33.239Z') },
+        { referenceDate: new Date('2025-01-14T17:53:33.239Z') },
+      ];
+
+      await service.createMissingBackupAlertsBatched(
+        createMissingBackupAlertDtos
+      );
+
+      expect(missingBackupAlertEntityRepository.save).toHaveBeenCalledWith([
+        expect.objectContaining({
+          referenceDate: new Date('2025-01-13T17:53:33.239Z'),
+          alertType: mockedMissingBackupAlertTypeEntity,
+        }),
+        expect.objectContaining({
+          referenceDate: new Date('2025-01-14T17:53:33.239Z'),
+          alertType: mockedMissingBackupAlertTypeEntity,
+        }),
+      ]);
+      expect(mailService.sendAlertMail).toHaveBeenCalledTimes(2);
+    });
+
+    it('should ignore duplicate missing backup alerts in the batch', async () => {
+      const createMissingBackupAlertDtos: CreateMissingBackupAlertDto[] = [
+        { referenceDate: new Date('2025-01-13T17:53:33.239Z') },
+        { referenceDate: new Date('2025-01-13T17:53:33.239Z') },
+      ];
+
+      await service.createMissingBackupAlertsBatched(
+        createMissingBackupAlertDtos
+      );
+
+      expect(missingBackupAlertEntityRepository.save).toHaveBeenCalledWith([
+        expect.objectContaining({
+          referenceDate: new Date('2025-01-13T17:53:33.239Z'),
+        }),
+      ]);
+    });
+  });
+
+  describe('createAdditionalBackupAlertsBatched', () => {
+    it('should create and save additional backup alerts in batch', async () => {
+      const createAdditionalBackupAlertDtos: CreateAdditionalBackupAlertDto[] =
+        [
+          {
+            date: new Date('2025-01-13T17:53:33.239Z'),
+            backupId: 'backup-id',
+          },
+        ];
+
+      await service.createAdditionalBackupAlertsBatched(
+        createAdditionalBackupAlertDtos
+      );
+
+      expect(backupDataService.findOneById).toHaveBeenCalledWith('backup-id');
+      expect(additionalBackupAlertEntityRepository.save).toHaveBeenCalledWith([
+        expect.objectContaining({
+          date: new Date('2025-01-13T17:53:33.239Z'),
+          backup: mockedBackupDataEntity,
+          alertType: mockedAdditionalBackupAlertTypeEntity,
+        }),
+      ]);
+      expect(mailService.sendAlertMail).toHaveBeenCalledTimes(1);
+    });
+
+    it('should ignore duplicate additional backup alerts in the batch', async () => {
+      const createAdditionalBackupAlertDtos: CreateAdditionalBackupAlertDto[] =
+        [
+          {
+            date: new Date('2025-01-13T17:53:33.239Z'),
+            backupId: 'backup-id',
+          },
+          {
+            date: new Date('2025-01-13T17:53:33.239Z'),
+            backupId: 'backup-id',
+          },
+        ];
+
+      await service.createAdditionalBackupAlertsBatched(
+        createAdditionalBackupAlertDtos
+      );
+
+      expect(additionalBackupAlertEntityRepository.save).toHaveBeenCalledWith([
+        expect.objectContaining({
+          backup: mockedBackupDataEntity,
+        }),
+      ]);
+      expect(mailService.sendAlertMail).toHaveBeenCalledTimes(1);
+    });
+  });
+
   describe('adminChangeActiveStatusAlertType', () => {
     it('should activate alert type by admin', async () => {
       const alertTypeId = 'not-active-id';
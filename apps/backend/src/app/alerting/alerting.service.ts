@@ -605,6 +605,103 @@ export class AlertingService extends PaginationService implements OnModuleInit {
     }
   }
 
+  async createMissingBackupAlertsBatched(
+    createMissingBackupAlertDtos: CreateMissingBackupAlertDto[]
+  ) {
+    const alertType = await this.alertTypeRepository.findOneBy({
+      name: MISSING_BACKUP_ALERT,
+    });
+    if (!alertType) {
+      throw new NotFoundException(
+        `Alert type ${MISSING_BACKUP_ALERT} not found`
+      );
+    }
+
+    const alerts: MissingBackupAlertEntity[] = [];
+    for (const alertDto of createMissingBackupAlertDtos) {
+      // Check if alert already exists, in the database or in this batch
+      const existingAlertEntity = await this.missingBackupRepository.findOneBy({
+        referenceDate: alertDto.referenceDate,
+      });
+      if (
+        existingAlertEntity ||
+        alerts.some(
+          (alert) =>
+            new Date(alert.referenceDate).getTime() ===
+            new Date(alertDto.referenceDate).getTime()
+        )
+      ) {
+        console.log('Alert already exists -> ignoring it');
+        continue;
+      }
+
+      const alert = new MissingBackupAlertEntity();
+      alert.referenceDate = alertDto.referenceDate;
+      alert.alertType = alertType;
+      alerts.push(alert);
+    }
+
+    await this.missingBackupRepository.save(alerts);
+
+    if (alertType.user_active && alertType.master_active) {
+      for (const alert of alerts) {
+        this.triggerAlertMail(alert);
+      }
+    }
+  }
+
+  async createAdditionalBackupAlertsBatched(
+    createAdditionalBackupAlertDtos: CreateAdditionalBackupAlertDto[]
+  ) {
+    const alertType = await this.alertTypeRepository.findOneBy({
+      name: ADDITIONAL_BACKUP_ALERT,
+    });
+    if (!alertType) {
+      throw new NotFoundException(
+        `Alert type ${ADDITIONAL_BACKUP_ALERT} not found`
+      );
+    }
+
+    const alerts: AdditionalBackupAlertEntity[] = [];
+    const backupIds = new Set<string>();
+    for (const alertDto of createAdditionalBackupAlertDtos) {
+      // Check if alert already exists, in the database or in this batch
+      const existingAlertEntity =
+        await this.additionalBackupRepository.findOneBy({
+          backup: { id: alertDto.backupId },
+        });
+      if (existingAlertEntity || backupIds.has(alertDto.backupId)) {
+        console.log('Alert already exists -> ignoring it');
+        continue;
+      }
+
+      const alert = new AdditionalBackupAlertEntity();
+      alert.date = alertDto.date;
+
+      const backup = await this.backupDataService.findOneById(
+        alertDto.backupId
+      );
+      if (!backup) {
+        throw new NotFoundException(
+          `Backup with id ${alertDto.backupId} not found`
+        );
+      }
+      alert.backup = backup;
+      alert.alertType = alertType;
+
+      alerts.push(alert);
+      backupIds.add(alertDto.backupId);
+    }
+
+    await this.additionalBackupRepository.save(alerts);
+
+    if (alertType.user_active && alertType.master_active) {
+      for (const alert of alerts) {
+        this.triggerAlertMail(alert);
+      }
+    }
+  }
+
   private async findAlertTypeByIdOrThrow(id: string): Promise<AlertTypeEntity> {
     const entity = await this.alertTypeRepository.findOneBy({ id });
     if (!entity) {